@@ -0,0 +1,258 @@
+import re
+import json
+import time
+import threading
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, unquote
+
+from benchmarks.generators import build_report_zip
+
+
+class FakeCanvas:
+    """
+    Local stand-in for the parts of the Canvas API the integration uses.
+
+    Serves account 1, its enrollment terms, provisioning reports built from
+    generated institutions and SIS imports whose progress advances on
+    every poll, and answers the direct user, course, section and
+    enrollment calls used for small deltas. Course, section and
+    enrollment listings used by reconciliation return the generated
+    institution as it was before the run; imports are not applied to it.
+    API calls are throttled like Canvas: each one fills a
+    leaky bucket by request_cost, the bucket drains at leak_rate units a
+    second and a full bucket answers 403 Rate Limit Exceeded.
+    """
+
+    def __init__(self, institutions, report_delay=0.0, import_step=50, request_cost=1.0, leak_rate=10.0,
+                 bucket_size=700.0):
+        self.institutions = {institution["canvas_term_id"]: institution for institution in institutions}
+        self.report_delay = report_delay
+        self.import_step = import_step
+        self.reports = {}
+        self.report_files = {}
+        self.sis_imports = {}
+        self.rest_calls = 0
+        self.requests = 0
+        self.throttled = 0
+        self.request_cost = request_cost
+        self.leak_rate = leak_rate
+        self.bucket_size = bucket_size
+        self._bucket = 0.0
+        self._bucket_updated = time.monotonic()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._thread = None
+
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                fake._dispatch(self, "GET")
+
+            def do_POST(self):
+                fake._dispatch(self, "POST")
+
+            def do_DELETE(self):
+                fake._dispatch(self, "DELETE")
+
+        return Handler
+
+
+    def _dispatch(self, handler, method):
+        path = urlparse(handler.path).path
+        body = handler.rfile.read(int(handler.headers.get("Content-Length") or 0))
+
+        with self._lock:
+            self.requests += 1
+            now = time.monotonic()
+            self._bucket = max(0.0, self._bucket - (now - self._bucket_updated) * self.leak_rate)
+            self._bucket_updated = now
+            throttled = path.startswith("/api/") and self._bucket + self.request_cost > self.bucket_size
+            if path.startswith("/api/") and not throttled:
+                self._bucket += self.request_cost
+            if throttled:
+                self.throttled += 1
+            remaining = self.bucket_size - self._bucket
+
+        routes = [
+            ("GET", r"/api/v1/accounts/1", self._get_account),
+            ("GET", r"/api/v1/accounts/1/terms", self._get_terms),
+            ("POST", r"/api/v1/accounts/1/reports/(\w+)", self._create_report),
+            ("GET", r"/api/v1/accounts/1/reports/(\w+)/(\d+)", self._get_report),
+            ("GET", r"/files/(\d+)\.zip", self._get_report_file),
+            ("POST", r"/api/v1/accounts/1/sis_imports", self._create_sis_import),
+            ("GET", r"/api/v1/accounts/1/sis_imports/(\d+)", self._get_sis_import),
+            ("POST", r"/api/v1/accounts/1/users", self._rest_object),
+            ("POST", r"/api/v1/accounts/([^/]+)/courses", self._rest_object),
+            ("POST", r"/api/v1/courses/([^/]+)/sections", self._rest_object),
+            ("POST", r"/api/v1/sections/([^/]+)/enrollments", self._rest_object),
+            ("GET", r"/api/v1/sections/([^/]+)/enrollments", self._get_section_enrollments),
+            ("GET", r"/api/v1/accounts/1/courses", self._get_courses),
+            ("GET", r"/api/v1/courses/([^/]+)/sections", self._get_course_sections),
+            ("GET", r"/api/v1/courses/([^/]+)/enrollments", self._get_course_enrollments),
+            ("DELETE", r"/api/v1/courses/([^/]+)/enrollments/(\d+)", self._rest_object),
+        ]
+
+        status, content_type, payload = 404, "application/json", json.dumps({"errors": [path]}).encode()
+        if throttled:
+            status, content_type, payload = 403, "text/plain", b"403 Forbidden (Rate Limit Exceeded)"
+        else:
+            for route_method, pattern, route in routes:
+                match = re.fullmatch(pattern, path)
+                if route_method == method and match:
+                    status, content_type, payload = route(body, *match.groups())
+                    break
+
+        handler.send_response(status)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(payload)))
+        if path.startswith("/api/"):
+            handler.send_header("X-Request-Cost", str(self.request_cost))
+            handler.send_header("X-Rate-Limit-Remaining", f'{remaining:.1f}')
+        handler.end_headers()
+        handler.wfile.write(payload)
+
+
+    def _json(self, data):
+        return 200, "application/json", json.dumps(data).encode()
+
+
+    def _get_account(self, body):
+        return self._json({"id": 1, "name": "Benchmark Institution"})
+
+
+    def _get_terms(self, body):
+        terms = [{"id": canvas_term_id, "sis_term_id": institution["term_id"], "name": institution["term_id"]}
+                 for canvas_term_id, institution in self.institutions.items()]
+        return self._json({"enrollment_terms": terms})
+
+
+    def _create_report(self, body, report_type):
+        term_match = re.search(rb"enrollment_term_id\]?=(\d+)", body)
+        canvas_term_id = int(term_match.group(1)) if term_match else next(iter(self.institutions))
+        datasets = [name for name in self.institutions[canvas_term_id]["canvas"]
+                    if re.search(rf"parameters(%5B|\[){name}(%5D|\])=True".encode(), body)]
+
+        with self._lock:
+            report_id = len(self.reports) + 1
+            self.reports[report_id] = {"id": report_id, "report": report_type, "status": "running",
+                                       "canvas_term_id": canvas_term_id, "datasets": datasets,
+                                       "created": time.monotonic()}
+
+        return self._json(self._report_json(report_id))
+
+
+    def _get_report(self, body, report_type, report_id):
+        return self._json(self._report_json(int(report_id)))
+
+
+    def _report_json(self, report_id):
+        report = self.reports[report_id]
+        data = {"id": report_id, "report": report["report"], "status": "running"}
+
+        if time.monotonic() - report["created"] >= self.report_delay:
+            with self._lock:
+                if report_id not in self.report_files:
+                    canvas_datasets = self.institutions[report["canvas_term_id"]]["canvas"]
+                    if report["datasets"]:
+                        canvas_datasets = {name: canvas_datasets[name] for name in report["datasets"]}
+                    self.report_files[report_id] = build_report_zip(canvas_datasets)
+            data["status"] = "complete"
+            data["attachment"] = {"url": f'{self.url}/files/{report_id}.zip'}
+
+        return data
+
+
+    def _get_report_file(self, body, report_id):
+        return 200, "application/zip", self.report_files[int(report_id)]
+
+
+    def _create_sis_import(self, body):
+        rows = max(0, body.count(b"\n") - 6)
+
+        with self._lock:
+            import_id = len(self.sis_imports) + 1
+            self.sis_imports[import_id] = {"id": import_id, "progress": 0, "rows": rows}
+
+        return self._json(self._sis_import_json(import_id))
+
+
+    def _get_sis_import(self, body, import_id):
+        import_id = int(import_id)
+
+        with self._lock:
+            sis_import = self.sis_imports[import_id]
+            sis_import["progress"] = min(100, sis_import["progress"] + self.import_step)
+
+        return self._json(self._sis_import_json(import_id))
+
+
+    def _rest_object(self, body, *ids):
+        with self._lock:
+            self.rest_calls += 1
+            object_id = self.rest_calls
+
+        return self._json({"id": object_id, "course_id": 1})
+
+
+    def _get_section_enrollments(self, body, section_id):
+        return self._json([{"id": 1, "course_id": 1, "type": "StudentEnrollment"}])
+
+
+    def _get_courses(self, body):
+        return self._json([{"id": int(course["canvas_course_id"]), "sis_course_id": course["course_id"]}
+                           for institution in self.institutions.values()
+                           for course in institution["canvas"]["courses"].to_dict("records")])
+
+
+    def _get_course_sections(self, body, course_id):
+        sections = self._course_rows("sections", course_id)
+        return self._json([{"id": int(section["canvas_section_id"]), "sis_section_id": section["section_id"]}
+                           for section in sections])
+
+
+    def _get_course_enrollments(self, body, course_id):
+        enrollment_types = {"student": "StudentEnrollment", "teacher": "TeacherEnrollment"}
+        enrollments = self._course_rows("enrollments", course_id)
+        return self._json([{"id": int(enrollment["canvas_enrollment_id"]), "sis_section_id": enrollment["section_id"],
+                            "sis_user_id": enrollment["user_id"], "type": enrollment_types[enrollment["role"]]}
+                           for enrollment in enrollments])
+
+
+    def _course_rows(self, dataset_name, course_id):
+        course_id = unquote(course_id).removeprefix("sis_course_id:")
+        return [row for institution in self.institutions.values()
+                for row in institution["canvas"][dataset_name].to_dict("records") if row["course_id"] == course_id]
+
+
+    def _sis_import_json(self, import_id):
+        sis_import = self.sis_imports[import_id]
+        statistics = {name: sis_import["rows"] for name in ["Account", "Course", "CourseSection", "Enrollment"]}
+
+        return {"id": import_id, "progress": sis_import["progress"],
+                "workflow_state": "imported" if sis_import["progress"] == 100 else "importing",
+                "data": {"statistics": statistics}}
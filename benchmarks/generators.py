@@ -0,0 +1,166 @@
+import io
+import zipfile
+import numpy as np
+import pandas as pd
+
+
+def generate_institution(enrollments, term_id="211S", canvas_term_id=42, churn=0.02, seed=0):
+    """
+    Generate a synthetic institution with about the given number of enrollments.
+
+    Returns the ERP tables and the Canvas provisioning datasets. Canvas
+    is missing a churn share of the ERP users, courses, sections and
+    enrollments, and the ERP drops a churn share of the enrollments
+    Canvas still has, so every update query has work to do.
+    """
+    rng = np.random.default_rng(seed)
+    n_users = max(10, enrollments // 5)
+    n_sections = max(4, enrollments // 25)
+    n_courses = max(2, int(n_sections / 1.25))
+    n_faculty = max(2, n_sections // 3)
+
+    user_ids = np.arange(100000, 100000 + n_users)
+    erp_users = pd.DataFrame({
+        "user_id": user_ids,
+        "login_id": [f"user{user_id}" for user_id in user_ids],
+        "first_name": "First",
+        "last_name": [f"Last{user_id}" for user_id in user_ids],
+        "email": [f"user{user_id}@example.edu" for user_id in user_ids],
+        "status": "active",
+        "role": np.where(np.arange(n_users) < n_faculty, "faculty", "student"),
+    })
+
+    course_ids = [f"CRS {index:06d}" for index in range(n_courses)]
+    erp_courses = pd.DataFrame({
+        "course_id": course_ids,
+        "short_name": course_ids,
+        "long_name": [f"Course {index}" for index in range(n_courses)],
+        "account_id": np.where(np.arange(n_courses) % 50 == 0, "ctl_library", "academic"),
+        "term_id": term_id,
+        "status": "active",
+        "yr_cde": term_id[:2],
+        "trm_cde": term_id[2:4],
+    })
+
+    section_courses = np.arange(n_sections) % n_courses
+    erp_sections = pd.DataFrame({
+        "section_id": [f"{course_ids[course]} {index:02d}" for index, course in enumerate(section_courses)],
+        "course_id": [course_ids[course] for course in section_courses],
+        "name": [f"Section {index}" for index in range(n_sections)],
+        "status": "active",
+        "account_id": erp_courses["account_id"].to_numpy()[section_courses],
+        "yr_cde": term_id[:2],
+        "trm_cde": term_id[2:4],
+    })
+
+    student_sections = rng.integers(0, n_sections, enrollments)
+    students = rng.integers(n_faculty, n_users, enrollments)
+    teacher_sections = np.arange(n_sections)
+    teachers = rng.integers(0, n_faculty, n_sections)
+    erp_enrollments = pd.DataFrame({
+        "section_index": np.concatenate([student_sections, teacher_sections]),
+        "user_id": np.concatenate([user_ids[students], user_ids[teachers]]),
+        "role": ["student"] * enrollments + ["teacher"] * n_sections,
+    })
+    erp_enrollments = erp_enrollments.drop_duplicates(["section_index", "user_id", "role"]).reset_index(drop=True)
+    erp_enrollments["section_id"] = erp_sections["section_id"].to_numpy()[erp_enrollments["section_index"]]
+    erp_enrollments["course_id"] = erp_sections["course_id"].to_numpy()[erp_enrollments["section_index"]]
+    erp_enrollments["status"] = "active"
+    erp_enrollments["yr_cde"] = term_id[:2]
+    erp_enrollments["trm_cde"] = term_id[2:4]
+    erp_enrollments = erp_enrollments.drop(columns="section_index")
+
+    in_canvas = {name: rng.random(len(table)) >= churn for name, table in
+                 [("users", erp_users), ("courses", erp_courses), ("sections", erp_sections),
+                  ("enrollments", erp_enrollments)]}
+
+    dropped = in_canvas["enrollments"] & (rng.random(len(erp_enrollments)) < churn)
+    erp_enrollments.loc[dropped, "status"] = "deleted"
+
+    canvas = _canvas_datasets(erp_users[in_canvas["users"]], erp_courses[in_canvas["courses"]],
+                              erp_sections[in_canvas["sections"]], erp_enrollments[in_canvas["enrollments"]],
+                              term_id, canvas_term_id)
+
+    return {
+        "term_id": term_id,
+        "canvas_term_id": canvas_term_id,
+        "erp": {"users": erp_users, "courses": erp_courses, "sections": erp_sections,
+                "enrollments": erp_enrollments},
+        "canvas": canvas,
+    }
+
+
+def _canvas_datasets(users, courses, sections, enrollments, term_id, canvas_term_id):
+    canvas_user_ids = dict(zip(users["user_id"], range(1, len(users) + 1)))
+    canvas_course_ids = dict(zip(courses["course_id"], range(1, len(courses) + 1)))
+    canvas_section_ids = dict(zip(sections["section_id"], range(1, len(sections) + 1)))
+
+    canvas_users = pd.DataFrame({
+        "canvas_user_id": list(canvas_user_ids.values()) + [len(users) + 1],
+        "user_id": [str(user_id) for user_id in canvas_user_ids] + ["CanvasStu1"],
+        "integration_id": None,
+        "login_id": list(users["login_id"]) + ["canvas_student"],
+        "first_name": list(users["first_name"]) + ["Test"],
+        "last_name": list(users["last_name"]) + ["Student"],
+        "email": list(users["email"]) + [None],
+        "status": "active",
+        "created_by_sis": "true",
+    })
+
+    canvas_courses = pd.DataFrame({
+        "canvas_course_id": [canvas_course_ids[course_id] for course_id in courses["course_id"]],
+        "course_id": courses["course_id"].to_numpy(),
+        "integration_id": None,
+        "short_name": courses["short_name"].to_numpy(),
+        "long_name": courses["long_name"].to_numpy(),
+        "canvas_account_id": 1,
+        "account_id": courses["account_id"].to_numpy(),
+        "canvas_term_id": canvas_term_id,
+        "term_id": term_id,
+        "status": "active",
+        "created_by_sis": "true",
+    })
+
+    canvas_sections = pd.DataFrame({
+        "canvas_section_id": [canvas_section_ids[section_id] for section_id in sections["section_id"]],
+        "section_id": sections["section_id"].to_numpy(),
+        "canvas_course_id": [canvas_course_ids.get(course_id) for course_id in sections["course_id"]],
+        "course_id": sections["course_id"].to_numpy(),
+        "integration_id": None,
+        "name": sections["name"].to_numpy(),
+        "status": "active",
+        "canvas_account_id": 1,
+        "account_id": sections["account_id"].to_numpy(),
+        "created_by_sis": "true",
+    })
+
+    enrollments = enrollments[enrollments["user_id"].isin(canvas_user_ids.keys())
+                              & enrollments["section_id"].isin(canvas_section_ids.keys())]
+    canvas_enrollments = pd.DataFrame({
+        "canvas_course_id": [canvas_course_ids.get(course_id) for course_id in enrollments["course_id"]],
+        "course_id": enrollments["course_id"].to_numpy(),
+        "canvas_user_id": [canvas_user_ids[user_id] for user_id in enrollments["user_id"]],
+        "user_id": enrollments["user_id"].astype(str).to_numpy(),
+        "role": enrollments["role"].to_numpy(),
+        "canvas_section_id": [canvas_section_ids[section_id] for section_id in enrollments["section_id"]],
+        "section_id": enrollments["section_id"].to_numpy(),
+        "status": "active",
+        "canvas_enrollment_id": np.arange(1, len(enrollments) + 1),
+        "created_by_sis": "true",
+    })
+
+    return {"users": canvas_users, "courses": canvas_courses, "sections": canvas_sections,
+            "enrollments": canvas_enrollments}
+
+
+def build_report_zip(canvas_datasets):
+    """
+    Pack Canvas datasets into a provisioning report zip, as bytes.
+    """
+    buffer = io.BytesIO()
+
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as report_zip:
+        for dataset_name, dataset in canvas_datasets.items():
+            report_zip.writestr(f'{dataset_name}.csv', dataset.to_csv(index=False))
+
+    return buffer.getvalue()
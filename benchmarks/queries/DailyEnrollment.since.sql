@@ -0,0 +1,15 @@
+SELECT e.course_id, e.user_id, e.role, e.section_id, e.status
+FROM erp_enrollments e
+WHERE e.yr_cde = ? AND e.trm_cde = ?
+  AND e.job_time >= ?
+  AND (
+    (e.status = 'active' AND NOT EXISTS (
+        SELECT 1 FROM rpc_RE_Canvas_Enrollments m
+        WHERE m.section_id = e.section_id AND m.user_id = CAST(e.user_id AS TEXT)
+          AND m.role = e.role AND m.status = 'active'))
+    OR
+    (e.status = 'deleted' AND EXISTS (
+        SELECT 1 FROM rpc_RE_Canvas_Enrollments m
+        WHERE m.section_id = e.section_id AND m.user_id = CAST(e.user_id AS TEXT)
+          AND m.role = e.role AND m.status = 'active'))
+  )
@@ -0,0 +1,5 @@
+SELECT c.course_id, c.short_name, c.long_name, c.account_id, c.term_id, c.status
+FROM erp_courses c
+WHERE c.yr_cde = ? AND c.trm_cde = ?
+  AND c.account_id = 'ctl_library'
+  AND c.job_time >= ?
@@ -0,0 +1,5 @@
+SELECT s.section_id, s.course_id, s.name, s.status
+FROM erp_sections s
+WHERE s.yr_cde = ? AND s.trm_cde = ?
+  AND s.account_id = 'ctl_library'
+  AND s.job_time >= ?
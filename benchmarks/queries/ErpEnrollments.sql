@@ -0,0 +1,3 @@
+SELECT e.course_id, e.user_id, e.role, e.section_id, e.status
+FROM erp_enrollments e
+WHERE e.yr_cde = ? AND e.trm_cde = ?
@@ -0,0 +1,4 @@
+SELECT u.user_id, u.login_id, u.first_name, u.last_name, u.email, u.status
+FROM erp_users u
+WHERE u.role = 'faculty'
+  AND ? IS NOT NULL AND ? IS NOT NULL
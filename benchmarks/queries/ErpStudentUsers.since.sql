@@ -0,0 +1,5 @@
+SELECT u.user_id, u.login_id, u.first_name, u.last_name, u.email, u.status
+FROM erp_users u
+WHERE u.role = 'student'
+  AND ? IS NOT NULL AND ? IS NOT NULL
+  AND u.job_time >= ?
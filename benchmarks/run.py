@@ -0,0 +1,128 @@
+"""
+Benchmark the integration pipeline against local Canvas and SIS stand-ins.
+
+Usage:
+    python -m benchmarks.run --sizes 1000 10000
+    python -m benchmarks.run --sizes 1000 --save-baseline
+    python -m benchmarks.run --sizes 1000 --update-mode local --tolerance 0.5
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+from pathlib import Path
+
+from benchmarks import generators
+from benchmarks import sis_standin
+from benchmarks.fake_canvas import FakeCanvas
+
+from src.integrator import Integrator
+from src.jenzabar import Jenzabar
+from src.canvas import Canvas
+
+
+baseline_path = Path(__file__).parent / "baseline.json"
+
+
+def run_benchmark(enrollments, update_mode="sql", work_path=None):
+    """
+    Run one full Integrator sync on a generated institution.
+
+    Returns the total seconds of every timed metric the run recorded,
+    plus the run's total wall-clock time.
+    """
+    institution = generators.generate_institution(enrollments)
+
+    with tempfile.TemporaryDirectory(dir=work_path) as temp_dir:
+        previous_cwd = os.getcwd()
+        os.chdir(temp_dir)
+        try:
+            sis_engine = sis_standin.create_database(Path(temp_dir) / "sis.db", [institution])
+
+            with FakeCanvas([institution]) as fake_canvas:
+                jenzabar = Jenzabar(sis_engine=sis_engine)
+                jenzabar.queries_path = sis_standin.queries_path
+                canvas = Canvas(fake_canvas.url, "benchmark")
+                canvas.report_poll_interval = 0.05
+                canvas.sis_import_poll_interval = 0.05
+
+                start = time.perf_counter()
+                integration = Integrator("current", report_max_age=0, update_mode=update_mode,
+                                         jenzabar=jenzabar, canvas=canvas)
+                integration.run()
+                total_seconds = time.perf_counter() - start
+
+            sis_engine.dispose()
+        finally:
+            os.chdir(previous_cwd)
+
+    results = {"total_seconds": total_seconds}
+    for metric in integration.telemetry.metrics:
+        if metric["name"].endswith("_seconds"):
+            results[metric["name"]] = results.get(metric["name"], 0.0) + metric["value"]
+
+    return results
+
+
+def compare(results, baseline, tolerance, min_seconds=0.05):
+    """
+    List the metrics that got slower than the baseline by more than tolerance.
+    """
+    regressions = []
+
+    for size, metrics in results.items():
+        for name, seconds in metrics.items():
+            expected = baseline.get(size, {}).get(name)
+            if expected is None:
+                continue
+            if seconds > expected * (1 + tolerance) and seconds - expected > min_seconds:
+                regressions.append((size, name, expected, seconds))
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000],
+                        help="Enrollments per synthetic institution, from 1000 up to 1000000.")
+    parser.add_argument("--update-mode", choices=["sql", "local"], default="sql")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed slowdown against the baseline, as a fraction.")
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for size in args.sizes:
+        print(f'Benchmarking {size} enrollments...')
+        results[f'{args.update_mode}:{size}'] = run_benchmark(size, args.update_mode)
+
+    for key, metrics in results.items():
+        print(f'== {key}')
+        for name, seconds in sorted(metrics.items()):
+            print(f'{name:40} {seconds:10.3f}')
+
+    baseline = {}
+    if baseline_path.is_file():
+        with open(baseline_path) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    if args.save_baseline:
+        baseline.update(results)
+        with open(baseline_path, 'w') as baseline_file:
+            json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+        print(f'Baseline saved to {baseline_path}')
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    for size, name, expected, seconds in regressions:
+        print(f'REGRESSION {size} {name}: {expected:.3f}s -> {seconds:.3f}s')
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,62 @@
+import sqlalchemy as db
+import pandas as pd
+
+from pathlib import Path
+
+
+queries_path = Path(__file__).parent / "queries"
+
+mirror_tables = {
+    "rpc_RE_Canvas_Users": "id_num INTEGER, canvas_user INTEGER, login_id TEXT, load_date TEXT",
+    "rpc_RE_Canvas_Courses": "canvas_course_id INTEGER, crs_cde TEXT, status TEXT, yr_cde TEXT, "
+                             "trm_cde TEXT, load_date TEXT",
+    "rpc_RE_Canvas_Sections": "crs_cde TEXT, section_id TEXT, name TEXT, status TEXT, account_id TEXT, "
+                              "canvas_section_id INTEGER, created_by_sis INTEGER, yr_cde TEXT, trm_cde TEXT, "
+                              "load_date TEXT",
+    "rpc_RE_Canvas_Enrollments": "course_id TEXT, user_id TEXT, role TEXT, section_id TEXT, status TEXT, "
+                                 "canvas_enrollment_id INTEGER, canvas_section_id INTEGER, created_by_sis INTEGER, "
+                                 "yr_cde TEXT, trm_cde TEXT, load_date TEXT",
+}
+
+table_indexes = [
+    ("ix_mirror_users", "rpc_RE_Canvas_Users", "id_num"),
+    ("ix_mirror_courses", "rpc_RE_Canvas_Courses", "crs_cde"),
+    ("ix_mirror_sections", "rpc_RE_Canvas_Sections", "section_id"),
+    ("ix_mirror_enrollments", "rpc_RE_Canvas_Enrollments", "section_id, user_id, role"),
+    ("ix_erp_enrollments", "erp_enrollments", "section_id, user_id, role"),
+]
+
+
+def create_database(database_path, institutions):
+    """
+    Create a SQLite stand-in for the Jenzabar SIS database.
+
+    It holds REG_CONFIG, empty rpc_RE_Canvas_* mirror tables and erp_*
+    tables with the generated institutions' ERP data, each row stamped
+    with a job_time like Jenzabar's tables. The first institution's term
+    is the current term. The queries in
+    benchmarks/queries run against it in place of the production ones.
+    """
+    engine = db.create_engine(f'sqlite:///{database_path}')
+    term_id = institutions[0]["term_id"]
+    job_time = pd.Timestamp.now(tz="UTC").strftime("%Y-%m-%d %H:%M:%S")
+
+    with engine.begin() as conn:
+        for table_name, columns in mirror_tables.items():
+            conn.execute(db.text(f'DROP TABLE IF EXISTS {table_name}'))
+            conn.execute(db.text(f'CREATE TABLE {table_name} ({columns})'))
+
+        pd.DataFrame({"CUR_YR_DFLT": [term_id[:2]], "CUR_TRM_DFLT": [term_id[2:4]]}).to_sql(
+            "REG_CONFIG", conn, if_exists="replace", index=False)
+
+        for dataset_name in ["users", "courses", "sections", "enrollments"]:
+            erp_table = pd.concat([institution["erp"][dataset_name] for institution in institutions])
+            if dataset_name == "users":
+                erp_table = erp_table.drop_duplicates("user_id")
+            erp_table = erp_table.assign(job_time=job_time)
+            erp_table.to_sql(f'erp_{dataset_name}', conn, if_exists="replace", index=False, chunksize=10000)
+
+        for index_name, table_name, columns in table_indexes:
+            conn.execute(db.text(f'CREATE INDEX {index_name} ON {table_name} ({columns})'))
+
+    return engine
@@ -1,10 +1,6 @@
-from src.integrator import Integrator
+import sys
 
-integration = Integrator(term="next")
-integration.update_mirror_tables()
-integration.update_canvas()
-
-# integration_next_sem = Integrator(term="current")
-# integration_next_sem.update_mirror_tables()
-# integration_next_sem.update_canvas()
+from src.cli import main
 
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,250 @@
+import os
+import time
+import uuid
+import sqlalchemy as db
+import pandas as pd
+
+from pathlib import Path
+
+
+class BulkLoader:
+    """
+    Replace the contents of a SQL table through a staging table.
+
+    Rows are inserted into a staging copy of the target in batches with
+    executemany (pyodbc's fast_executemany when the engine enables it).
+    The staging table has a name of its own for every load, so runs in
+    separate processes do not collide. The rows are then copied into
+    the target in one transaction, so readers never see a half-loaded
+    table and the target keeps its indexes, constraints and grants.
+
+    With swap on SQL Server the staging table is instead created with
+    the target's columns, primary key and indexes, and its rows are
+    switched into the emptied target with ALTER TABLE SWITCH, which only
+    moves metadata and so locks the target briefly whatever its size.
+    This needs ALTER permission on the target. Other databases always
+    copy.
+    """
+
+    def __init__(self, engine, batch_size=5000, swap=False, state_path=None):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.swap = swap
+        self.state_path = state_path
+
+
+    def load(self, dataset, target_table):
+        """
+        Replace target_table with dataset and save it as the table's state
+        for the next apply_delta. Returns the load statistics.
+        """
+        start = time.perf_counter()
+        staging_table = self._staging_name(target_table, "staging")
+        columns = ", ".join(list(dataset))
+        switch = self.swap and self.engine.dialect.name == "mssql"
+
+        self._clear_state(target_table)
+        try:
+            with self.engine.begin() as conn:
+                if switch:
+                    self._create_switch_table(conn, target_table, staging_table)
+                else:
+                    self._create_staging_table(conn, target_table, staging_table)
+                self._insert(conn, staging_table, dataset)
+
+            with self.engine.begin() as conn:
+                if switch:
+                    conn.execute(db.text(f'TRUNCATE TABLE {target_table}'))
+                    conn.execute(db.text(f'ALTER TABLE {staging_table} SWITCH TO {target_table}'))
+                else:
+                    conn.execute(db.text(f'DELETE FROM {target_table}'))
+                    conn.execute(db.text(f'INSERT INTO {target_table} ({columns}) '
+                                         f'SELECT {columns} FROM {staging_table}'))
+        finally:
+            with self.engine.begin() as conn:
+                self._drop_table(conn, staging_table)
+        self._write_state(dataset, target_table)
+
+        seconds = time.perf_counter() - start
+
+        return {"table": target_table, "rows": len(dataset), "seconds": seconds,
+                "rows_per_second": len(dataset) / seconds if seconds else 0.0}
+
+
+    def apply_delta(self, dataset, target_table, key_columns, ignore_columns=("load_date",)):
+        """
+        Bring target_table in line with dataset by writing only the changed rows.
+
+        Rows are matched on key_columns and compared by a hash of their
+        other columns (except ignore_columns) with the dataset last loaded
+        into the table, which is kept under state_path after every load.
+        The table itself is only counted, so nothing is read back from it.
+        Inserts, updates and deletes are staged and then applied inside a
+        single transaction; updated rows are replaced. Unchanged rows keep
+        the load_date of the load that last wrote them. Falls back to a
+        full load when the keys are not unique, when there is no state for
+        the table or when the table no longer has as many rows as its
+        state. Returns the load statistics.
+        """
+        if dataset[key_columns].isna().any().any() or dataset.duplicated(key_columns).any():
+            return self.load(dataset, target_table)
+
+        start = time.perf_counter()
+        columns = list(dataset)
+        compare_columns = [column for column in columns if column not in ignore_columns]
+
+        previous = self._read_state(target_table)
+        if previous is None or not set(compare_columns) <= set(previous):
+            return self.load(dataset, target_table)
+
+        with self.engine.connect() as conn:
+            table_rows = conn.execute(db.text(f'SELECT COUNT(*) FROM {target_table}')).scalar()
+        if table_rows != len(previous):
+            return self.load(dataset, target_table)
+
+        previous = previous[compare_columns].astype(dataset[compare_columns].dtypes.to_dict())
+        current_hashes = self._row_hashes(dataset, key_columns, compare_columns)
+        previous_hashes = self._row_hashes(previous, key_columns, compare_columns)
+        changes = current_hashes.merge(previous_hashes, on=key_columns, how="outer",
+                                       suffixes=("", "_previous"), indicator=True)
+
+        inserted = changes["_merge"] == "left_only"
+        deleted = changes["_merge"] == "right_only"
+        updated = (changes["_merge"] == "both") & (changes["row_hash"] != changes["row_hash_previous"])
+
+        changed_keys = changes.loc[inserted | updated, key_columns]
+        changed_rows = dataset.merge(changed_keys, on=key_columns, how="inner")[columns]
+        removed_keys = changes.loc[deleted | updated, key_columns]
+
+        staging_table = self._staging_name(target_table, "staging")
+        removed_table = self._staging_name(target_table, "removed")
+        key_match = " AND ".join(f'{target_table}.{key} = {removed_table}.{key}' for key in key_columns)
+
+        # Until the new state is written, a failed apply leaves no state and the next load is a full one.
+        self._clear_state(target_table)
+        try:
+            with self.engine.begin() as conn:
+                self._create_staging_table(conn, target_table, staging_table)
+                self._create_staging_table(conn, target_table, removed_table, key_columns)
+                self._insert(conn, staging_table, changed_rows)
+                self._insert(conn, removed_table, removed_keys)
+
+            with self.engine.begin() as conn:
+                conn.execute(db.text(f'DELETE FROM {target_table} WHERE EXISTS '
+                                     f'(SELECT 1 FROM {removed_table} WHERE {key_match})'))
+                conn.execute(db.text(f'INSERT INTO {target_table} ({", ".join(columns)}) '
+                                     f'SELECT {", ".join(columns)} FROM {staging_table}'))
+        finally:
+            with self.engine.begin() as conn:
+                self._drop_table(conn, staging_table)
+                self._drop_table(conn, removed_table)
+        self._write_state(dataset, target_table)
+
+        seconds = time.perf_counter() - start
+        rows = int(inserted.sum() + updated.sum() + deleted.sum())
+
+        return {"table": target_table, "rows": rows, "seconds": seconds,
+                "rows_per_second": rows / seconds if seconds else 0.0,
+                "inserted": int(inserted.sum()), "updated": int(updated.sum()), "deleted": int(deleted.sum())}
+
+
+    def _state_file(self, target_table):
+        return Path(self.state_path) / f'{target_table}.pkl.gz'
+
+
+    def _read_state(self, target_table):
+        if self.state_path is None or not self._state_file(target_table).is_file():
+            return None
+        return pd.read_pickle(self._state_file(target_table))
+
+
+    def _write_state(self, dataset, target_table):
+        if self.state_path is None:
+            return
+        state_file = self._state_file(target_table)
+        state_file.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = state_file.with_name(f'{state_file.name}.{os.getpid()}.tmp')
+        dataset.to_pickle(temp_path, compression="gzip")
+        os.replace(temp_path, state_file)
+
+
+    def _clear_state(self, target_table):
+        if self.state_path is not None:
+            self._state_file(target_table).unlink(missing_ok=True)
+
+
+    def _row_hashes(self, dataset, key_columns, compare_columns):
+        values = dataset[compare_columns].astype(str).apply(lambda column: column.str.strip())
+        hashes = dataset[key_columns].reset_index(drop=True)
+        hashes["row_hash"] = pd.util.hash_pandas_object(values, index=False).to_numpy()
+        return hashes
+
+
+    def _insert(self, conn, table_name, dataset):
+        table = db.table(table_name, *[db.column(column) for column in dataset])
+        records = self._records(dataset)
+
+        for batch_start in range(0, len(records), self.batch_size):
+            conn.execute(table.insert(), records[batch_start:batch_start + self.batch_size])
+
+
+    def _records(self, dataset):
+        dataset = dataset.astype(object)
+        dataset = dataset.where(dataset.notna(), None)
+        return dataset.to_dict("records")
+
+
+    def _staging_name(self, target_table, purpose):
+        return f'{target_table}_{purpose}_{uuid.uuid4().hex[:8]}'
+
+
+    def _create_switch_table(self, conn, target_table, staging_table):
+        """
+        Create staging_table with the columns, primary key and indexes of target_table, as SWITCH requires.
+        """
+        self._drop_table(conn, staging_table)
+        target = db.Table(target_table, db.MetaData(), autoload_with=conn)
+
+        staging = db.Table(staging_table, db.MetaData(),
+                           *[db.Column(column.name, column.type, nullable=column.nullable) for column in target.columns])
+        if target.primary_key.columns:
+            staging.append_constraint(db.PrimaryKeyConstraint(
+                *[column.name for column in target.primary_key.columns], **target.primary_key.dialect_kwargs))
+        for index in target.indexes:
+            db.Index(f'{staging_table}_{index.name}', *[staging.c[column.name] for column in index.columns],
+                     unique=index.unique, **index.dialect_kwargs)
+
+        staging.create(conn)
+
+
+    def _create_staging_table(self, conn, target_table, staging_table, columns=None):
+        self._drop_table(conn, staging_table)
+        selected = ", ".join(columns) if columns else "*"
+
+        if conn.dialect.name == "mssql":
+            conn.execute(db.text(f'SELECT {selected} INTO {staging_table} FROM {target_table} WHERE 1 = 0'))
+        else:
+            conn.execute(db.text(f'CREATE TABLE {staging_table} AS SELECT {selected} FROM {target_table} WHERE 1 = 0'))
+
+
+    def _drop_table(self, conn, table_name):
+        if conn.dialect.name == "mssql":
+            conn.execute(db.text(f"IF OBJECT_ID('{table_name}') IS NOT NULL DROP TABLE {table_name}"))
+        else:
+            conn.execute(db.text(f'DROP TABLE IF EXISTS {table_name}'))
+
+
+class PandasBulkLoader(BulkLoader):
+    """
+    Staging-table loader that inserts through DataFrame.to_sql multi-row inserts.
+
+    Batches are capped so a statement stays under SQL Server's limit of
+    2100 parameters.
+    """
+
+    def _insert(self, conn, table_name, dataset):
+        chunksize = min(self.batch_size, max(1, 2000 // max(1, len(list(dataset)))))
+        dataset.to_sql(table_name, conn, if_exists='append', index=False, chunksize=chunksize, method="multi")
+
+
+bulk_loaders = {"executemany": BulkLoader, "to_sql": PandasBulkLoader}
@@ -0,0 +1,54 @@
+import json
+import threading
+import datetime
+
+
+class JsonCache:
+    """
+    Small key/value cache kept in a JSON file.
+
+    Every entry remembers when it was stored so callers can ignore
+    entries older than the maximum age they are willing to accept.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+
+    def get(self, key, max_age):
+        """
+        Return the cached value for key, or None if missing or older than max_age.
+        """
+        entry = self._read().get(key)
+        if entry is None:
+            return None
+
+        saved_at = datetime.datetime.fromisoformat(entry["saved_at"])
+        if datetime.datetime.now() - saved_at > max_age:
+            return None
+
+        return entry["value"]
+
+
+    def set(self, key, value, saved_at=None):
+        """
+        Store value under key, stamped with saved_at (defaults to now).
+        """
+        if saved_at is None:
+            saved_at = datetime.datetime.now()
+
+        with self._lock:
+            entries = self._read()
+            entries[key] = {"saved_at": saved_at.isoformat(), "value": value}
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, 'w') as cache_file:
+                json.dump(entries, cache_file, indent=2)
+
+
+    def _read(self):
+        try:
+            with open(self.path) as cache_file:
+                return json.load(cache_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
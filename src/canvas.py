@@ -1,30 +1,183 @@
+import csv
 import time
+import shutil
 import requests
 import zipfile
-import io
 import datetime
+import threading
+
 import pandas as pd
 
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+
 from decouple import config
 
 from canvasapi import Canvas as CanvasApi
+from canvasapi.account import Account
+from canvasapi.course import Course
+from canvasapi.section import Section
+from canvasapi.user import User
+from canvasapi.exceptions import ResourceDoesNotExist
+
+from src.cache import JsonCache
+from src import cleaner
+from src import rate_limit
 
 class Canvas:
 
+    upload_order = [
+        "faculty_users.csv",
+        "student_users.csv",
+        "courses.csv",
+        "sections.csv",
+        "enrollments.csv",
+        "ctl_library_courses.csv",
+        "ctl_library_sections.csv"
+        ]
+
+    upload_dependencies = {
+        "faculty_users.csv": [],
+        "student_users.csv": [],
+        "courses.csv": [],
+        "sections.csv": ["courses.csv"],
+        "enrollments.csv": ["faculty_users.csv", "student_users.csv", "sections.csv"],
+        "ctl_library_courses.csv": [],
+        "ctl_library_sections.csv": ["ctl_library_courses.csv"],
+        }
+
+    report_types = {
+        "faculty_users.csv": "Account",
+        "student_users.csv": "Account",
+        "courses.csv": "Course",
+        "sections.csv": "CourseSection",
+        "enrollments.csv": "Enrollment",
+        "ctl_library_courses.csv": "Course",
+        "ctl_library_sections.csv": "CourseSection",
+        }
 
-    def __init__(self):
-        self.canvas_admin = CanvasApi(config('api_url'), config('api_key')).get_account(1)
+    enrollment_types = {
+        "student": "StudentEnrollment",
+        "teacher": "TeacherEnrollment",
+        "ta": "TaEnrollment",
+        "observer": "ObserverEnrollment",
+        "designer": "DesignerEnrollment",
+        }
+
+    rest_columns = {
+        "Account": ["user_id", "login_id", "first_name", "last_name", "email", "status"],
+        "Course": ["course_id", "short_name", "long_name", "account_id", "term_id", "status"],
+        "CourseSection": ["section_id", "course_id", "name", "status"],
+        "Enrollment": ["section_id", "user_id", "role", "status"],
+        }
+
+    report_poll_interval = 3
+    sis_import_poll_interval = 2
+
+
+    def __init__(self, api_url=None, api_key=None, budget=None, account_id=None):
+        self.api_url = api_url
+        self.api_key = api_key
+        self.budget = budget if budget is not None else rate_limit.shared_budget()
+        self.account_id = account_id if account_id is not None else config('canvas_account_id', default=1, cast=int)
+        self._canvas_admin = None
+        self._connect_lock = threading.Lock()
+        self.report_cache = JsonCache(Path("data/report_cache.json"))
+        self.term_cache = JsonCache(Path("data/term_cache.json"))
+
+
+    @property
+    def canvas_admin(self):
+        """
+        Canvas account (the root account unless account_id says otherwise), connected on first use.
+        """
+        if self._canvas_admin is not None:
+            return self._canvas_admin
+
+        with self._connect_lock:
+            if self._canvas_admin is None:
+                api_url = self.api_url if self.api_url is not None else config('api_url')
+                api_key = self.api_key if self.api_key is not None else config('api_key')
+                self._canvas_admin = rate_limit.install(CanvasApi(api_url, api_key), self.budget).get_account(self.account_id)
+
+        return self._canvas_admin
+
+
+    @canvas_admin.setter
+    def canvas_admin(self, canvas_admin):
+        self._canvas_admin = canvas_admin
+
+
+    def sub_account(self, account_id):
+        """
+        Canvas client for a sub-account, sharing this client's connection, request budget and caches.
+
+        Provisioning reports of a sub-account only hold its own courses,
+        sections and enrollments. SIS imports and terms stay on the root
+        account.
+        """
+        canvas = Canvas(self.api_url, self.api_key, self.budget, account_id)
+        canvas.canvas_admin = Account(self.canvas_admin._requester, {"id": account_id})
+        canvas.report_cache = self.report_cache
+        canvas.term_cache = self.term_cache
+
+        return canvas
 
 
     def convert_term_id(self, jenzabar_term_id):
         """
         Convert Jenzabar term ID to corresponding Canvas term ID.
+
+        Terms are looked up in a term index kept on disk, which is rebuilt
+        from the enrollment terms only when it is older than term_cache_hours
+        or does not know the term.
+        """
+        max_age = datetime.timedelta(hours=config('term_cache_hours', default=24, cast=int))
+        term_index = self.term_cache.get("terms", max_age)
+
+        if term_index is None or jenzabar_term_id not in term_index:
+            term_index = self._build_term_index()
+
+        return term_index.get(jenzabar_term_id)
+
+
+    def _build_term_index(self):
+        term_index = {term.sis_term_id: term.id for term in self.canvas_admin.get_enrollment_terms()
+                      if getattr(term, "sis_term_id", None)}
+        self.term_cache.set("terms", term_index)
+
+        return term_index
+
+
+    def get_provisioning_report(self, datasets, term_id, max_age=None):
+        """
+        Reuse a recent completed provisioning report, or create a new one.
+
+        max_age is given in minutes and defaults to the report_max_age
+        setting. A max_age of 0 always creates a new report.
         """
-        canvas_enrollment_terms = self.canvas_admin.get_enrollment_terms()
+        if max_age is None:
+            max_age = config('report_max_age', default=0, cast=int)
 
-        for term in canvas_enrollment_terms:
-            if term.sis_term_id == jenzabar_term_id:
-                return term.id
+        cache_key = self._report_cache_key(datasets, term_id)
+
+        if max_age > 0:
+            report_id = self.report_cache.get(cache_key, datetime.timedelta(minutes=max_age))
+            if report_id is not None:
+                report = self.canvas_admin.get_report("provisioning_csv", report_id)
+                if report.status == "complete" and getattr(report, "attachment", None):
+                    return report
+
+        requested_at = datetime.datetime.now()
+        report = self.create_provisioning_report(datasets, term_id)
+        self.report_cache.set(cache_key, report.id, saved_at=requested_at)
+
+        return report
+
+
+    def _report_cache_key(self, datasets, term_id):
+        dataset_names = sorted(name for name, enabled in datasets.items() if enabled)
+        return f'{self.account_id}:{term_id}:{",".join(dataset_names)}'
 
 
     def create_provisioning_report(self, datasets, term_id):
@@ -34,119 +187,441 @@ class Canvas:
         enrollment_term_dict = {"enrollment_term_id": term_id}
         parameters = {**datasets, **enrollment_term_dict}
 
+        poller = rate_limit.Poller(self.report_poll_interval)
         report = self.canvas_admin.create_report("provisioning_csv", parameters=parameters)
         while report.status != "complete":
             report = self.canvas_admin.get_report(report.report, report.id)
-            time.sleep(3)
+            poller.wait(getattr(report, "progress", None))
 
         report = self.canvas_admin.get_report(report.report, report.id)
         return report 
 
 
-    def download_report(self, report, data_path):
+    def download_report(self, report, data_path, chunk_size=1024 * 1024, dataset_name=None):
+        """
+        Stream a canvas report archive to a given data path.
+
+        The archive is written in chunks and kept zipped; datasets are
+        read straight from it when cleaning. Canvas sends a plain CSV
+        instead of a zip when the report has a single dataset, so that
+        file is packed into the archive under dataset_name, or under the
+        one dataset the report's parameters request when it is not given.
         """
-        Download a canvas report to a given data path.
+        data_path.mkdir(parents=True, exist_ok=True)
+        report_path = data_path / "provisioning_report.zip"
+        download_path = data_path / "provisioning_report.download"
+
+        with requests.get(report.attachment["url"], stream=True) as response:
+            response.raise_for_status()
+            with open(download_path, 'wb') as report_file:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    report_file.write(chunk)
+
+        if zipfile.is_zipfile(download_path):
+            download_path.replace(report_path)
+        else:
+            if dataset_name is None:
+                parameters = getattr(report, "parameters", None) or {}
+                dataset_names = [name for name in cleaner.dataset_specs if parameters.get(name)]
+                if len(dataset_names) != 1:
+                    download_path.unlink()
+                    raise ValueError(f'Report {report.id} sent a single CSV but its parameters request '
+                                     f'{len(dataset_names)} datasets, pass the dataset_name it holds')
+                dataset_name = dataset_names[0]
+            with zipfile.ZipFile(report_path, 'w', compression=zipfile.ZIP_DEFLATED) as report_zip:
+                report_zip.write(download_path, arcname=f'{dataset_name}.csv')
+            download_path.unlink()
+
+        return report_path
+
+
+    def download_reports(self, datasets, term_id, data_path, max_age=None):
         """
-        request = requests.get(report.attachment["url"])
-        zipf = zipfile.ZipFile(io.BytesIO(request.content))
-        zipf.extractall(data_path / f"provisioning_report")
+        Request and download one provisioning report per dataset, all at the same time.
 
+        Canvas builds a combined report one dataset after another, so
+        separate reports let the small datasets finish without waiting
+        on enrollments. The downloads are merged into the same
+        provisioning_report.zip download_report writes. Returns its path
+        and the seconds each dataset's report took.
+        """
+        dataset_names = [name for name, enabled in datasets.items() if enabled]
+        reports_path = data_path / "reports"
+
+        def download_dataset(dataset_name):
+            start = time.perf_counter()
+            report = self.get_provisioning_report({dataset_name: True}, term_id, max_age)
+            report_path = self.download_report(report, reports_path / dataset_name, dataset_name=dataset_name)
+            return report_path, time.perf_counter() - start
+
+        with ThreadPoolExecutor(max_workers=len(dataset_names)) as executor:
+            futures = {dataset_name: executor.submit(download_dataset, dataset_name) for dataset_name in dataset_names}
+            results = {dataset_name: future.result() for dataset_name, future in futures.items()}
+
+        report_path = data_path / "provisioning_report.zip"
+        with zipfile.ZipFile(report_path, 'w', compression=zipfile.ZIP_DEFLATED) as report_zip:
+            for dataset_name, (dataset_report_path, _) in results.items():
+                with zipfile.ZipFile(dataset_report_path) as dataset_zip, \
+                        dataset_zip.open(f'{dataset_name}.csv') as source, \
+                        report_zip.open(f'{dataset_name}.csv', 'w') as target:
+                    shutil.copyfileobj(source, target, 1024 * 1024)
+        shutil.rmtree(reports_path)
 
-    def clean_report(self, dataset_names, data_path, term_id):
-        for dataset_name in dataset_names.keys():
-            clean_dataset = self._clean_dataset(data_path, dataset_name, term_id)
-            dataset_path = (data_path / "provisioning_report_clean").mkdir(parents=True, exist_ok=True)
-            clean_dataset.to_csv(data_path / "provisioning_report_clean" / f"{dataset_name}.csv", index=False)
+        return report_path, {dataset_name: seconds for dataset_name, (_, seconds) in results.items()}
+
+
+    def clean_report(self, dataset_names, data_path, term_id, max_workers=None, clean_format=None):
+        """
+        Clean every dataset of a downloaded report, one worker process per dataset.
+
+        Workers clean chunk by chunk and hand every cleaned chunk to this
+        process as a pickle in a temporary directory, so they never hold a
+        whole dataset and nothing is parsed back from text. The chunks are
+        combined here and returned keyed by dataset name. A copy of each
+        dataset is kept under provisioning_report_clean in clean_format:
+        csv is appended by the workers as they go, parquet and feather
+        (which need pyarrow) are written here from the combined frame,
+        and "none" keeps no copy.
+        """
+        if max_workers is None:
+            max_workers = config('clean_workers', default=4, cast=int)
+        if clean_format is None:
+            clean_format = config('clean_format', default="csv")
+        if clean_format != "none":
+            cleaner.check_clean_format(clean_format)
+
+        chunksize = config('clean_chunksize', default=50000, cast=int)
+        report_path = data_path / "provisioning_report.zip"
+        clean_path = data_path / "provisioning_report_clean"
+        chunk_path = data_path / "provisioning_report_clean.tmp"
+
+        # Chunks left by an interrupted attempt would be read twice.
+        shutil.rmtree(chunk_path, ignore_errors=True)
+        chunk_path.mkdir(parents=True)
+        if clean_format != "none":
+            clean_path.mkdir(parents=True, exist_ok=True)
+        csv_path = clean_path if clean_format == "csv" else None
+
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                futures = {dataset_name: executor.submit(cleaner.clean_dataset_chunks, report_path, dataset_name,
+                                                         term_id, chunk_path, chunksize, csv_path)
+                           for dataset_name in dataset_names.keys()}
+                stats = {dataset_name: future.result() for dataset_name, future in futures.items()}
+
+            datasets = {}
+            for dataset_name, dataset_stats in stats.items():
+                datasets[dataset_name] = cleaner.read_dataset_chunks(chunk_path, dataset_name)
+                datasets[dataset_name].attrs.update(dataset_stats)
+        finally:
+            shutil.rmtree(chunk_path, ignore_errors=True)
+
+        if clean_format in ["parquet", "feather"]:
+            for dataset_name, dataset in datasets.items():
+                cleaner.write_clean_dataset(dataset, clean_path, dataset_name, clean_format)
+
+        return datasets
 
 
     def _clean_dataset(self, data_path, dataset_name, term_id):
-        dataset = pd.read_csv(data_path / "provisioning_report" / f'{dataset_name}.csv')
-        add_term_id = False
-
-        if dataset_name == "users":
-            cols_to_keep = ["user_id", "canvas_user_id", "login_id"]
-            cols_name_map = {"user_id": "id_num", "canvas_user_id": "canvas_user"}
-            dataset = dataset[~dataset["user_id"].isna()]
-            dataset = dataset[dataset["user_id"].str.isnumeric()]
-            
-
-        elif dataset_name == "courses":
-            cols_to_keep = ["canvas_course_id", "course_id", "status"]
-            cols_name_map = {"course_id": "crs_cde"}
-            add_term_id = True
-
-        elif dataset_name == "sections":
-            cols_to_keep = ["course_id", "section_id", "name", "status",
-                            "account_id", "canvas_section_id", "created_by_sis"]
-            cols_name_map = {"course_id": "crs_cde"}
-            add_term_id = True
-
-        elif dataset_name == "enrollments":
-            cols_to_keep = ["course_id", "user_id", "role", "section_id", 
-                        "status", "canvas_enrollment_id", "canvas_section_id", "created_by_sis"]
-            cols_name_map = {}
-            add_term_id = True
-            # dataset = dataset[~dataset["user_id"].str.startswith("CanvasStu")]
-
-        dataset = dataset.loc[:, cols_to_keep]
-        dataset = dataset.rename(cols_name_map, axis="columns")
-
-        if "created_by_sis" in list(dataset):
-            dataset["created_by_sis"] = dataset["created_by_sis"].replace({True: -1, False:0})
-
-        if add_term_id:
-            dataset["yr_cde"] = term_id[:2]
-            dataset["trm_cde"] = term_id[2:4]
-
-        dataset["load_date"] = datetime.date.today()
-        
-        
-        return dataset
-
-
-    def upload_all_updates(self, data_path):
-        upload_order = [
-            "faculty_users.csv",
-            "student_users.csv",
-            "courses.csv",
-            "sections.csv",
-            "enrollments.csv",
-            "ctl_library_courses.csv",
-            "ctl_library_sections.csv"
-            ]
+        chunksize = config('clean_chunksize', default=50000, cast=int)
+        return cleaner.read_dataset(data_path / "provisioning_report.zip", dataset_name, term_id, chunksize)
+
 
+    def upload_all_updates(self, data_path, max_workers=None, upload_mode=None, file_names=None, on_complete=None):
+        """
+        Upload the update files in file_names (default all) through SIS import.
+
+        With upload_mode "separate" each file is delivered on its own, as
+        soon as the files it depends on have finished, with at most
+        max_workers files in flight at the same time. A file of up to
+        rest_delta_threshold rows goes through direct API calls instead of
+        waiting in the SIS import queue, see upload_rest. With "bundled"
+        the files go to Canvas as one zipped import. on_complete is called
+        with the file name and ImportResult of every file as soon as it
+        finishes.
+        """
+        if upload_mode is None:
+            upload_mode = config('sis_upload_mode', default="separate")
+        if upload_mode == "bundled":
+            return self.upload_bundled_updates(data_path, file_names, on_complete)
+
+        if max_workers is None:
+            max_workers = config('sis_import_workers', default=3, cast=int)
+        rest_threshold = config('rest_delta_threshold', default=25, cast=int)
+
+        upload_order = self._upload_order(file_names)
+        pending = {name: [dependency for dependency in self.upload_dependencies[name] if dependency in upload_order]
+                   for name in upload_order}
         reports = {}
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while pending or running:
+                ready = [name for name, dependencies in pending.items()
+                         if all(dependency in reports for dependency in dependencies)]
+
+                for dataset_name in ready:
+                    del pending[dataset_name]
+                    future = executor.submit(self._deliver, data_path / "updates" / f'{dataset_name}', rest_threshold)
+                    running[future] = dataset_name
+
+                if not running:
+                    raise ValueError(f"Unresolvable upload dependencies for: {list(pending)}")
 
-        for dataset_name in upload_order:
-            reports[dataset_name] = self._upload(data_path / "updates" / f'{dataset_name}')
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    dataset_name = running.pop(future)
+                    reports[dataset_name] = future.result()
+                    if on_complete is not None:
+                        on_complete(dataset_name, reports[dataset_name])
+
+        return {dataset_name: reports[dataset_name] for dataset_name in upload_order}
+
+
+    def _deliver(self, file_path, rest_threshold):
+        rows = self._read_rows(file_path, rest_threshold)
+        if rows is not None and all(self._rest_supported(file_path.name, row) for row in rows):
+            return self.upload_rest(file_path.name, rows)
+
+        return self._import_result(self._upload(file_path))
+
+
+    def _read_rows(self, file_path, limit):
+        """
+        Rows of an update file, or None if it has more than limit rows.
+        """
+        if limit <= 0:
+            return None
+
+        rows = []
+        with open(file_path, newline='') as update_file:
+            for row in csv.DictReader(update_file):
+                if len(rows) == limit:
+                    return None
+                rows.append(row)
+
+        return rows
+
+
+    def _rest_supported(self, file_name, row):
+        # csv.DictReader gives '' for an empty cell, which the API calls cannot use either.
+        if any(not (row.get(column) or "").strip() for column in self.rest_columns[self.report_types[file_name]]):
+            return False
+        if self.report_types[file_name] == "Enrollment":
+            return row["status"] in ["active", "deleted"] and row["role"] in self.enrollment_types
+        return row["status"] == "active"
+
+
+    def upload_rest(self, file_name, rows, max_workers=None):
+        """
+        Apply a small update file through direct API calls, on pooled connections.
+
+        New users, courses and sections are created, and enrollments are
+        added or deleted, with up to max_workers calls in flight; the shared
+        request budget keeps them under Canvas's rate limit. Returns an
+        ImportResult shaped like a SIS import's. A row that fails, whether
+        Canvas rejects it or the call itself fails, is recorded in
+        processing_errors instead of stopping the others.
+        """
+        if max_workers is None:
+            max_workers = config('rest_workers', default=8, cast=int)
+
+        started = time.perf_counter()
+        statistics = {"created": 0, "deleted": 0}
+        errors = []
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(self._rest_row, file_name, row): row for row in rows}
+            for future, row in futures.items():
+                try:
+                    statistics[future.result()] += 1
+                except Exception as error:
+                    errors.append([file_name, f'{",".join(row.values())}: {error}'])
+
+        return ImportResult({"statistics": {self.report_types[file_name]: statistics}}, transport="rest",
+                            processing_errors=errors, queue_seconds=0,
+                            processing_seconds=time.perf_counter() - started)
+
+
+    def _rest_row(self, file_name, row):
+        requester = self.canvas_admin._requester
+        report_type = self.report_types[file_name]
+
+        if report_type == "Account":
+            self.canvas_admin.create_user(
+                pseudonym={"unique_id": row["login_id"], "sis_user_id": row["user_id"]},
+                user={"name": f'{row["first_name"]} {row["last_name"]}',
+                      "sortable_name": f'{row["last_name"]}, {row["first_name"]}'},
+                communication_channel={"type": "email", "address": row["email"], "skip_confirmation": True})
+            return "created"
+
+        if report_type == "Course":
+            account = Account(requester, {"id": f'sis_account_id:{row["account_id"]}'})
+            account.create_course(course={"name": row["long_name"], "course_code": row["short_name"],
+                                          "sis_course_id": row["course_id"],
+                                          "term_id": f'sis_term_id:{row["term_id"]}'})
+            return "created"
+
+        if report_type == "CourseSection":
+            course = Course(requester, {"id": f'sis_course_id:{row["course_id"]}'})
+            course.create_course_section(course_section={"name": row["name"], "sis_section_id": row["section_id"]})
+            return "created"
+
+        section = Section(requester, {"id": f'sis_section_id:{row["section_id"]}'})
+        enrollment_type = self.enrollment_types[row["role"]]
+        if row["status"] == "active":
+            section.enroll_user(User(requester, {"id": f'sis_user_id:{row["user_id"]}'}),
+                                enrollment={"type": enrollment_type, "enrollment_state": "active"})
+            return "created"
+
+        for enrollment in section.get_enrollments(user_id=f'sis_user_id:{row["user_id"]}', type=[enrollment_type]):
+            enrollment.deactivate("delete")
+        return "deleted"
+
+
+    def fetch_keys(self, term_id, course_ids, max_workers=None):
+        """
+        Fetch the SIS keys Canvas holds for a term, without a provisioning report.
+
+        Returns every course of the term, and the sections and active
+        enrollments of course_ids only, as frames with the update files'
+        key columns. Courses are fetched on up to max_workers pooled
+        connections at the same time.
+        """
+        if max_workers is None:
+            max_workers = config('rest_workers', default=8, cast=int)
+
+        courses = [{"course_id": getattr(course, "sis_course_id", None)} for course in self.canvas_admin.get_courses(
+            enrollment_term_id=term_id, state=["created", "claimed", "available", "completed"], per_page=100)]
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(self._fetch_course_keys, course_ids))
+
+        sections = [section for course_sections, _ in results for section in course_sections]
+        enrollments = [enrollment for _, course_enrollments in results for enrollment in course_enrollments]
+
+        return {"courses": pd.DataFrame(courses, columns=["course_id"]),
+                "sections": pd.DataFrame(sections, columns=["section_id", "course_id"]),
+                "enrollments": pd.DataFrame(enrollments, columns=["section_id", "user_id", "role", "course_id"])}
+
+
+    def _fetch_course_keys(self, course_id):
+        course = Course(self.canvas_admin._requester, {"id": f'sis_course_id:{course_id}'})
+        roles = {enrollment_type: role for role, enrollment_type in self.enrollment_types.items()}
+
+        try:
+            sections = [{"section_id": getattr(section, "sis_section_id", None), "course_id": course_id}
+                        for section in course.get_sections(per_page=100)]
+            enrollments = [{"section_id": getattr(enrollment, "sis_section_id", None),
+                            "user_id": getattr(enrollment, "sis_user_id", None),
+                            "role": roles.get(enrollment.type, enrollment.type), "course_id": course_id}
+                           for enrollment in course.get_enrollments(state=["active"], per_page=100)]
+        except ResourceDoesNotExist:
+            return [], []
+
+        return sections, enrollments
+
+
+    def _import_result(self, sis_import):
+        attributes = {name: getattr(sis_import, name) for name in
+                      ["id", "processing_warnings", "processing_errors", "queue_seconds", "processing_seconds"]
+                      if hasattr(sis_import, name)}
+        return ImportResult(sis_import.data, transport="sis_import", **attributes)
+
+
+    def _upload_order(self, file_names=None):
+        if file_names is None:
+            return list(self.upload_order)
+        return [file_name for file_name in self.upload_order if file_name in file_names]
+
+
+    def upload_bundled_updates(self, data_path, file_names=None, on_complete=None):
+        """
+        Upload every non-empty update file in a single zipped SIS import.
+
+        Canvas orders the files inside the archive itself. The import is
+        split back into one result per file: each gets the import's
+        statistics for its record type, and the warnings and errors that
+        name it. Files of the same type, such as faculty and student users,
+        share their type's statistics.
+        """
+        updates_path = data_path / "updates"
+        upload_order = self._upload_order(file_names)
+        bundled_files = [name for name in upload_order if self._has_rows(updates_path / name)]
+        sis_import = None
+
+        if bundled_files:
+            bundle_path = data_path / "updates.zip"
+            with zipfile.ZipFile(bundle_path, 'w', compression=zipfile.ZIP_DEFLATED) as bundle:
+                for file_name in bundled_files:
+                    bundle.write(updates_path / file_name, arcname=file_name)
+
+            sis_import = self._upload(bundle_path)
+
+        reports = {file_name: self._split_import(sis_import, file_name) for file_name in upload_order}
+        if on_complete is not None:
+            for file_name, report in reports.items():
+                on_complete(file_name, report)
 
         return reports
 
+
+    def _split_import(self, sis_import, file_name):
+        report_type = self.report_types[file_name]
+
+        if sis_import is None:
+            return ImportResult({"statistics": {report_type: {}}})
+
+        statistics = sis_import.data.get("statistics", {})
+        attributes = {"id": sis_import.id, "transport": "sis_import",
+                      "queue_seconds": getattr(sis_import, "queue_seconds", 0),
+                      "processing_seconds": getattr(sis_import, "processing_seconds", 0)}
+
+        for name in ["processing_warnings", "processing_errors"]:
+            messages = getattr(sis_import, name, None)
+            if messages is not None:
+                attributes[name] = [message for message in messages if message and message[0] == file_name]
+
+        return ImportResult({"statistics": {report_type: statistics.get(report_type, {})}}, **attributes)
+
+
+    def _has_rows(self, file_path):
+        with open(file_path) as update_file:
+            update_file.readline()
+            return bool(update_file.readline().strip())
+
+
     def _upload(self, dataset_path):
+        submitted = time.perf_counter()
+        started = None
         sis_import = self.canvas_admin.create_sis_import(str(dataset_path))
 
-        while self.canvas_admin.get_sis_import(sis_import).progress != 100:
-            time.sleep(2)
+        poller = rate_limit.Poller(self.sis_import_poll_interval)
+        progress = self.canvas_admin.get_sis_import(sis_import).progress
+        while progress != 100:
+            if started is None and progress:
+                started = time.perf_counter()
+            poller.wait(progress)
+            progress = self.canvas_admin.get_sis_import(sis_import).progress
 
         sis_import_finished = self.canvas_admin.get_sis_import(sis_import)
 
+        finished = time.perf_counter()
+        started = started if started is not None else finished
+        sis_import_finished.queue_seconds = started - submitted
+        sis_import_finished.processing_seconds = finished - started
+
         return sis_import_finished
 
 
     def save_report(self, reports, data_path):
-        report_names = {
-            "faculty_users.csv": "Account",
-            "student_users.csv": "Account",
-            "courses.csv": "Course",
-            "sections.csv": "CourseSection",
-            "enrollments.csv": "Enrollment",
-            "ctl_library_courses.csv": "Course",
-            "ctl_library_sections.csv": "CourseSection",
-        }
+        report_names = self.report_types
 
         with open((data_path / "report.txt"), 'w') as report_file:
             for report_name in reports.keys():
                 report_file.write(f'File Name: {report_name}\n')
+                report_file.write(f'Transport: {getattr(reports[report_name], "transport", "sis_import")}\n')
                 statistics = reports[report_name].data['statistics'][report_names[report_name]]
                 report_file.write(f'Changes: {statistics} \n')
                 try:
@@ -159,4 +634,19 @@ class Canvas:
                 except AttributeError:
                     report_file.write("No errors to report.\n")
 
-                report_file.write("############################\n")
\ No newline at end of file
+                report_file.write("############################\n")
+
+
+class ImportResult:
+    """
+    Outcome of delivering one update file to Canvas.
+
+    Carries the same data, processing_warnings and processing_errors
+    attributes that save_report reads from a canvasapi SisImport, whether
+    the file went through SIS import or direct API calls (transport).
+    """
+
+    def __init__(self, data, **attributes):
+        self.data = data
+        for name, value in attributes.items():
+            setattr(self, name, value)
@@ -0,0 +1,77 @@
+import os
+import json
+import datetime
+import threading
+
+from pathlib import Path
+
+from src.canvas import ImportResult
+
+
+class Checkpoint:
+    """
+    Completion manifest of one run, kept as checkpoint.json in its data_path.
+
+    Records which stages of the run finished and the result of every SIS
+    import that finished, so a failed run can be resumed from the first
+    stage or import that did not.
+    """
+
+    file_name = "checkpoint.json"
+    import_attributes = ["id", "transport", "processing_warnings", "processing_errors", "queue_seconds", "processing_seconds"]
+
+
+    def __init__(self, data_path, run=None):
+        self.path = Path(data_path) / self.file_name
+        self.run = run if run is not None else {}
+        self._lock = threading.Lock()
+
+
+    def read(self):
+        """
+        Return the manifest, or an empty one if the run has not checkpointed anything yet.
+        """
+        try:
+            with open(self.path) as checkpoint_file:
+                return json.load(checkpoint_file)
+        except FileNotFoundError:
+            return {"run": self.run, "stages": {}, "imports": {}}
+
+
+    def is_done(self, stage_name):
+        return stage_name in self.read()["stages"]
+
+
+    def mark_done(self, stage_name):
+        with self._lock:
+            checkpoint = self.read()
+            checkpoint["stages"][stage_name] = datetime.datetime.now().isoformat()
+            self._write(checkpoint)
+
+
+    def completed_imports(self):
+        """
+        Results of the SIS imports that already finished, keyed by update file.
+        """
+        return {file_name: ImportResult(entry["data"], **entry["attributes"])
+                for file_name, entry in self.read()["imports"].items()}
+
+
+    def mark_import(self, file_name, result):
+        """
+        Record the finished SIS import of one update file.
+        """
+        attributes = {name: getattr(result, name) for name in self.import_attributes if hasattr(result, name)}
+
+        with self._lock:
+            checkpoint = self.read()
+            checkpoint["imports"][file_name] = {"data": result.data, "attributes": attributes}
+            self._write(checkpoint)
+
+
+    def _write(self, checkpoint):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.path.with_name(f'{self.file_name}.tmp')
+        with open(temp_path, 'w') as checkpoint_file:
+            json.dump(checkpoint, checkpoint_file, indent=2, default=str)
+        os.replace(temp_path, self.path)
@@ -0,0 +1,230 @@
+import zipfile
+import datetime
+import importlib.util
+import pandas as pd
+
+from pandas.api.types import union_categoricals
+
+
+dataset_specs = {
+    "users": {
+        "dtypes": {"user_id": "string", "canvas_user_id": "Int64", "login_id": "string"},
+        "cols_name_map": {"user_id": "id_num", "canvas_user_id": "canvas_user"},
+        "add_term_id": False,
+    },
+    "courses": {
+        "dtypes": {"canvas_course_id": "Int64", "course_id": "string", "status": "category"},
+        "cols_name_map": {"course_id": "crs_cde"},
+        "add_term_id": True,
+    },
+    "sections": {
+        "dtypes": {"course_id": "string", "section_id": "string", "name": "string", "status": "category",
+                   "account_id": "string", "canvas_section_id": "Int64", "created_by_sis": "boolean"},
+        "cols_name_map": {"course_id": "crs_cde"},
+        "add_term_id": True,
+    },
+    "enrollments": {
+        "dtypes": {"course_id": "string", "user_id": "string", "role": "category", "section_id": "string",
+                   "status": "category", "canvas_enrollment_id": "Int64", "canvas_section_id": "Int64",
+                   "created_by_sis": "boolean"},
+        "cols_name_map": {},
+        "add_term_id": True,
+    },
+}
+
+clean_formats = {"csv": ".csv", "parquet": ".parquet", "feather": ".feather"}
+
+
+def clean_chunks(source, dataset_name, term_id, chunksize=50000, stats=None):
+    """
+    Yield cleaned chunks of a provisioning dataset.
+
+    Only the columns in dataset_specs are parsed, with their compact
+    dtypes, so memory use depends on chunksize and not on file size.
+    Row counts are added to stats when it is given.
+    """
+    spec = dataset_specs[dataset_name]
+    load_date = datetime.date.today()
+
+    reader = pd.read_csv(source, usecols=list(spec["dtypes"]), dtype=spec["dtypes"], chunksize=chunksize)
+
+    for chunk in reader:
+        rows_in = len(chunk)
+
+        if dataset_name == "users":
+            chunk = chunk[chunk["user_id"].notna()]
+            chunk = chunk[chunk["user_id"].str.isnumeric()]
+            chunk = chunk.assign(user_id=chunk["user_id"].astype("Int64"))
+
+        chunk = chunk.loc[:, list(spec["dtypes"])]
+        chunk = chunk.rename(spec["cols_name_map"], axis="columns")
+
+        if "created_by_sis" in list(chunk):
+            chunk["created_by_sis"] = -chunk["created_by_sis"].astype("Int8")
+
+        if spec["add_term_id"]:
+            chunk["yr_cde"] = term_id[:2]
+            chunk["trm_cde"] = term_id[2:4]
+
+        chunk["load_date"] = load_date
+
+        if stats is not None:
+            stats["rows_in"] += rows_in
+            stats["rows_out"] += len(chunk)
+
+        yield chunk
+
+
+def output_columns(dataset_name):
+    """
+    Column names of a cleaned dataset, in output order.
+    """
+    spec = dataset_specs[dataset_name]
+    columns = [spec["cols_name_map"].get(column, column) for column in spec["dtypes"]]
+
+    if spec["add_term_id"]:
+        columns += ["yr_cde", "trm_cde"]
+
+    return columns + ["load_date"]
+
+
+def concat_chunks(chunks, dataset_name):
+    """
+    Concatenate cleaned chunks, keeping categorical columns categorical.
+    """
+    if not chunks:
+        return pd.DataFrame(columns=output_columns(dataset_name))
+
+    for column in chunks[0].select_dtypes("category"):
+        categories = union_categoricals([chunk[column] for chunk in chunks]).categories
+        chunks = [chunk.assign(**{column: chunk[column].cat.set_categories(categories)}) for chunk in chunks]
+
+    return pd.concat(chunks, ignore_index=True)
+
+
+def clean_dtypes(dataset_name):
+    """
+    Dtypes of a cleaned dataset's columns, keyed by output column name.
+    """
+    spec = dataset_specs[dataset_name]
+    dtypes = {spec["cols_name_map"].get(column, column): dtype for column, dtype in spec["dtypes"].items()}
+
+    if "created_by_sis" in dtypes:
+        dtypes["created_by_sis"] = "Int8"
+    if dataset_name == "users":
+        dtypes["id_num"] = "Int64"
+    if spec["add_term_id"]:
+        dtypes.update({"yr_cde": "string", "trm_cde": "string"})
+
+    return dtypes
+
+
+def read_dataset(report_path, dataset_name, term_id, chunksize=50000, stats=None):
+    """
+    Read and clean a whole dataset from a provisioning report archive.
+    """
+    with zipfile.ZipFile(report_path) as report_zip:
+        with report_zip.open(f'{dataset_name}.csv') as dataset_file:
+            chunks = list(clean_chunks(dataset_file, dataset_name, term_id, chunksize, stats))
+
+    return concat_chunks(chunks, dataset_name)
+
+
+def clean_dataset(report_path, dataset_name, term_id, chunksize=50000, clean_path=None, clean_format="csv"):
+    """
+    Clean a dataset from a provisioning report archive.
+
+    The cleaned frame is returned with its row counts in frame.attrs.
+    When clean_path is given a copy is also saved there in clean_format
+    for auditing and replay.
+    """
+    stats = {"rows_in": 0, "rows_out": 0}
+    dataset = read_dataset(report_path, dataset_name, term_id, chunksize, stats)
+    dataset.attrs.update(stats)
+
+    if clean_path is not None:
+        write_clean_dataset(dataset, clean_path, dataset_name, clean_format)
+
+    return dataset
+
+
+def clean_dataset_chunks(report_path, dataset_name, term_id, chunk_path, chunksize=50000, csv_path=None):
+    """
+    Clean a dataset from a provisioning report archive into pickled chunks under chunk_path.
+
+    Every chunk is written as soon as it is cleaned, so memory depends
+    on chunksize and not on file size. The pickles keep the cleaned
+    dtypes and are loaded by read_dataset_chunks without any parsing.
+    With csv_path the chunks are also appended to a csv copy there.
+    Returns the dataset's row counts.
+    """
+    stats = {"rows_in": 0, "rows_out": 0}
+    csv_file = csv_path / f'{dataset_name}{clean_formats["csv"]}' if csv_path is not None else None
+    index = -1
+
+    with zipfile.ZipFile(report_path) as report_zip:
+        with report_zip.open(f'{dataset_name}.csv') as dataset_file:
+            for index, chunk in enumerate(clean_chunks(dataset_file, dataset_name, term_id, chunksize, stats)):
+                chunk.to_pickle(chunk_path / f'{dataset_name}.{index:06d}.pkl')
+                if csv_file is not None:
+                    chunk.to_csv(csv_file, mode='w' if index == 0 else 'a', header=index == 0, index=False)
+
+    if csv_file is not None and index < 0:
+        pd.DataFrame(columns=output_columns(dataset_name)).to_csv(csv_file, index=False)
+
+    return stats
+
+
+def read_dataset_chunks(chunk_path, dataset_name):
+    """
+    Load a dataset written by clean_dataset_chunks.
+    """
+    chunks = [pd.read_pickle(chunk_file) for chunk_file in sorted(chunk_path.glob(f'{dataset_name}.*.pkl'))]
+    return concat_chunks(chunks, dataset_name)
+
+
+def check_clean_format(clean_format):
+    """
+    Raise if clean_format is unknown, or is parquet or feather and pyarrow is not installed.
+    """
+    if clean_format not in clean_formats:
+        raise ValueError(f"Unknown clean format: {clean_format}")
+    if clean_format in ["parquet", "feather"] and importlib.util.find_spec("pyarrow") is None:
+        raise ImportError(f'clean_format "{clean_format}" needs pyarrow, install it with pip install pyarrow')
+
+
+def write_clean_dataset(dataset, clean_path, dataset_name, clean_format="csv"):
+    """
+    Save a cleaned dataset as csv, parquet or feather.
+    """
+    check_clean_format(clean_format)
+
+    output_path = clean_path / f'{dataset_name}{clean_formats[clean_format]}'
+
+    if clean_format == "csv":
+        dataset.to_csv(output_path, index=False)
+    elif clean_format == "parquet":
+        dataset.to_parquet(output_path, index=False)
+    elif clean_format == "feather":
+        dataset.reset_index(drop=True).to_feather(output_path)
+
+    return output_path
+
+
+def read_clean_dataset(clean_path, dataset_name):
+    """
+    Load a saved cleaned dataset, whichever format it was written in.
+    """
+    for clean_format, suffix in clean_formats.items():
+        dataset_path = clean_path / f'{dataset_name}{suffix}'
+        if not dataset_path.is_file():
+            continue
+
+        if clean_format == "csv":
+            return pd.read_csv(dataset_path, dtype=clean_dtypes(dataset_name))
+        elif clean_format == "parquet":
+            return pd.read_parquet(dataset_path)
+        elif clean_format == "feather":
+            return pd.read_feather(dataset_path)
+
+    raise FileNotFoundError(f"No cleaned {dataset_name} dataset in {clean_path}")
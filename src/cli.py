@@ -0,0 +1,222 @@
+"""
+Command line entry point for the integration.
+
+Usage:
+    python main.py run --term current next
+    python main.py run --term next --profile enrollments-only
+    python main.py run --term next --datasets enrollments --update-files enrollments.csv
+    python main.py resume
+    python main.py daemon
+    python main.py status
+    python main.py plan --term next
+
+The Integrator, pandas, SQLAlchemy and canvasapi are only imported by the
+commands that sync, and the SIS engine and the Canvas account are only
+connected once a stage needs them, so status and plan start right away.
+"""
+
+import re
+import sys
+import json
+import argparse
+
+from pathlib import Path
+
+from decouple import config
+
+from src.profiles import profiles, get_profile
+
+
+data_root = Path("data")
+
+# Run directories are named after their start time and Jenzabar term, see Integrator.data_path.
+run_name_pattern = re.compile(r"\d{4}-\d{2}-\d{2}_\d{2}-\d{2}_\w+")
+
+
+def run(args):
+    """
+    Sync one or more terms.
+    """
+    from src.integrator import Integrator
+
+    options = {"report_max_age": args.report_max_age, "update_mode": args.update_mode,
+               "datasets": args.datasets, "update_files": args.update_files, "profile": args.profile}
+
+    if len(args.term) > 1:
+        Integrator.sync_terms(args.term, **options)
+    else:
+        Integrator(args.term[0], **options).run()
+
+    return 0
+
+
+def resume(args):
+    """
+    Continue a failed run from its first unfinished stage or import.
+    """
+    run_path = Path(args.run) if args.run is not None else _last_unfinished_run()
+    if run_path is None:
+        print(f'No unfinished runs in {data_root}')
+        return 1
+
+    from src.integrator import Integrator
+
+    print(f'Resuming {run_path}...')
+    Integrator.resume(run_path)
+
+    return 0
+
+
+def daemon(args):
+    """
+    Run the resident sync daemon until interrupted.
+    """
+    from src.daemon import SyncDaemon
+
+    sync_daemon = SyncDaemon(terms=args.term)
+    sync_daemon.handle_signals()
+    sync_daemon.serve_forever()
+
+    return 0
+
+
+def status(args):
+    """
+    List the most recent runs in the data directory, without connecting to anything.
+    """
+    if not data_root.is_dir():
+        print(f'No runs in {data_root}')
+        return 0
+
+    for run_path in _run_paths()[:args.limit]:
+        print(f'{run_path.name:30} {_run_state(run_path):10} {_run_summary(run_path)}')
+
+    return 0
+
+
+def plan(args):
+    """
+    Print what a run would do with the current settings, without connecting to anything.
+    """
+    profile = get_profile(args.profile)
+    datasets = args.datasets if args.datasets is not None else profile["datasets"]
+    update_files = args.update_files if args.update_files is not None else profile["update_files"]
+    update_mode = args.update_mode if args.update_mode is not None else config('update_mode', default="sql")
+
+    print(f'Terms:          {", ".join(args.term)}')
+    print(f'Profile:        {args.profile}')
+    print(f'Datasets:       {", ".join(datasets)}')
+    print(f'Reports:        {"one per dataset" if len(datasets) > 1 and config("report_per_dataset", default=True, cast=bool) else "one"}')
+    print(f'Sub-accounts:   {config("canvas_shards", default="") or "root account only"}')
+    print(f'Update files:   {", ".join(update_files) if update_files else "all"}')
+    print(f'Update mode:    {update_mode}')
+    print(f'ERP extract:    {config("extract_mode", default="full")}')
+    print(f'Mirror load:    {config("mirror_load_mode", default="full")} with {config("bulk_loader", default="executemany")}')
+    print(f'SIS upload:     {config("sis_upload_mode", default="separate")}, '
+          f'{config("sis_import_workers", default=3, cast=int)} imports at a time')
+    print(f'Reconcile:      up to {config("reconcile_max_courses", default=25, cast=int)} touched courses'
+          if config("reconcile", default=True, cast=bool) else 'Reconcile:      off')
+    print(f'Report max age: {args.report_max_age if args.report_max_age is not None else config("report_max_age", default=0, cast=int)} minutes')
+
+    stages = ["prepare_report", "load_mirror_tables", "download_updates", "upload_updates"]
+    if update_mode == "local":
+        stages.remove("load_mirror_tables")
+    if config("reconcile", default=True, cast=bool):
+        stages.append("reconcile")
+    print(f'Stages:         {" -> ".join(stages)}')
+
+    return 0
+
+
+def _last_unfinished_run():
+    for run_path in _run_paths():
+        checkpoint_path = run_path / "checkpoint.json"
+        if not checkpoint_path.is_file():
+            continue
+        with open(checkpoint_path) as checkpoint_file:
+            if "upload_updates" not in json.load(checkpoint_file)["stages"]:
+                return run_path
+
+    return None
+
+
+def _run_paths():
+    """
+    Run directories in data_root, newest first.
+    """
+    if not data_root.is_dir():
+        return []
+
+    return sorted((path for path in data_root.iterdir()
+                   if path.is_dir() and run_name_pattern.fullmatch(path.name)), reverse=True)
+
+
+def _run_state(run_path):
+    if (run_path / "report.txt").is_file():
+        return "finished"
+    if (run_path / "metrics.json").is_file():
+        return "failed"
+    return "running"
+
+
+def _run_summary(run_path):
+    metrics_path = run_path / "metrics.json"
+    if not metrics_path.is_file():
+        return ""
+
+    with open(metrics_path) as metrics_file:
+        metrics = json.load(metrics_file)
+
+    stages = {}
+    for metric in metrics:
+        if metric["name"].endswith("_seconds") and not metric["labels"].keys() - {"term"}:
+            stage_name = metric["name"][:-len("_seconds")]
+            stages[stage_name] = stages.get(stage_name, 0.0) + metric["value"]
+
+    return ", ".join(f'{name} {seconds:.1f}s' for name, seconds in stages.items())
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="main.py", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command")
+
+    run_parser = commands.add_parser("run", help="Sync one or more terms now.")
+    plan_parser = commands.add_parser("plan", help="Show what a run would do, without connecting.")
+    for command_parser in [run_parser, plan_parser]:
+        command_parser.add_argument("--term", nargs="+", default=["next"],
+                                    help="Terms to sync: current, next or both.")
+        command_parser.add_argument("--profile", choices=list(profiles), default="full",
+                                    help="Sync profile limiting the datasets and update files.")
+        command_parser.add_argument("--datasets", nargs="+", choices=["users", "courses", "sections", "enrollments"],
+                                    help="Datasets to sync, overriding the profile.")
+        command_parser.add_argument("--update-files", nargs="+",
+                                    help="Update files to build and upload, overriding the profile.")
+        command_parser.add_argument("--update-mode", choices=["sql", "local"])
+        command_parser.add_argument("--report-max-age", type=int,
+                                    help="Reuse a provisioning report up to this many minutes old.")
+    run_parser.set_defaults(handler=run)
+    plan_parser.set_defaults(handler=plan)
+
+    resume_parser = commands.add_parser("resume", help="Continue a failed run where it stopped.")
+    resume_parser.add_argument("run", nargs="?", help="Run directory to resume, defaults to the newest unfinished run.")
+    resume_parser.set_defaults(handler=resume)
+
+    daemon_parser = commands.add_parser("daemon", help="Run full and enrollment syncs on their intervals.")
+    daemon_parser.add_argument("--term", nargs="+", help="Terms to sync, defaults to the daemon_terms setting.")
+    daemon_parser.set_defaults(handler=daemon)
+
+    status_parser = commands.add_parser("status", help="List the most recent runs.")
+    status_parser.add_argument("--limit", type=int, default=10)
+    status_parser.set_defaults(handler=status)
+
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        argv = ["run"]
+
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
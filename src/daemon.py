@@ -0,0 +1,127 @@
+import time
+import signal
+import threading
+import traceback
+
+from decouple import config
+
+from src.integrator import Integrator
+from src.jenzabar import Jenzabar
+from src.canvas import Canvas
+
+
+class SyncDaemon:
+    """
+    Long-running sync service around Integrator.
+
+    Keeps one Jenzabar engine and one Canvas client open for its whole
+    life and runs two kinds of cycles: a full sync of every dataset and
+    a light sync of enrollments only, each on its own interval. Only one
+    cycle runs at a time.
+    """
+
+    cycles = {
+        "full": "full",
+        "enrollments": "enrollments-only",
+    }
+
+
+    def __init__(self, terms=None, full_interval=None, enrollment_interval=None, jenzabar=None, canvas=None):
+        if terms is None:
+            terms = config('daemon_terms', default="current", cast=lambda value: value.split(","))
+        if full_interval is None:
+            full_interval = config('daemon_full_interval', default=1440, cast=int)
+        if enrollment_interval is None:
+            enrollment_interval = config('daemon_enrollment_interval', default=15, cast=int)
+
+        self.terms = terms
+        self.intervals = {"full": full_interval * 60, "enrollments": enrollment_interval * 60}
+        self.jenzabar = jenzabar if jenzabar is not None else Jenzabar()
+        self.canvas = canvas if canvas is not None else Canvas()
+        self._cycle_lock = threading.Lock()
+        self._stop = threading.Event()
+
+
+    def run_cycle(self, cycle):
+        """
+        Run one cycle now. Returns False without running if another cycle is in progress.
+        """
+        if not self._cycle_lock.acquire(blocking=False):
+            print(f'Skipping {cycle} sync, the previous cycle is still running.')
+            return False
+
+        try:
+            print(f'Starting {cycle} sync of {", ".join(self.terms)}...')
+            Integrator.sync_terms(self.terms, jenzabar=self.jenzabar, canvas=self.canvas, profile=self.cycles[cycle])
+        except Exception:
+            print(f'{cycle.capitalize()} sync failed:')
+            traceback.print_exc()
+        finally:
+            self._cycle_lock.release()
+
+        return True
+
+
+    def serve_forever(self):
+        """
+        Run cycles on their intervals until stop is called.
+
+        A full sync also covers enrollments, so it pushes the next light
+        sync back by a whole interval. A light sync that comes due during
+        another cycle is skipped; a full sync waits for it to finish.
+        However serve_forever is left, it waits for the running cycle to
+        end, so an import is never cut off halfway.
+        """
+        next_runs = {cycle: time.monotonic() for cycle in self.intervals}
+        worker = None
+
+        try:
+            while not self._stop.is_set():
+                now = time.monotonic()
+                due = [cycle for cycle in ["full", "enrollments"] if next_runs[cycle] <= now]
+
+                if due and worker is not None and worker.is_alive():
+                    if "enrollments" in due:
+                        print("Skipping enrollments sync, the previous cycle is still running.")
+                        next_runs["enrollments"] = now + self.intervals["enrollments"]
+                    worker.join(timeout=1)
+                    continue
+
+                if due:
+                    cycle = due[0]
+                    worker = threading.Thread(target=self.run_cycle, args=(cycle,))
+                    worker.start()
+                    next_runs[cycle] = now + self.intervals[cycle]
+                    if cycle == "full":
+                        next_runs["enrollments"] = now + self.intervals["enrollments"]
+
+                self._stop.wait(max(0, min(next_runs.values()) - time.monotonic()))
+        finally:
+            if worker is not None and worker.is_alive():
+                print("Waiting for the running cycle to finish...")
+                worker.join()
+
+
+    def stop(self):
+        """
+        Stop scheduling new cycles; serve_forever returns once the current one ends.
+        """
+        self._stop.set()
+
+
+    def handle_signals(self):
+        """
+        Stop on SIGTERM and SIGINT instead of being killed mid-cycle. Must be called from the main thread.
+        """
+        def handle(signum, frame):
+            print(f'Received {signal.Signals(signum).name}, stopping after the running cycle.')
+            self.stop()
+
+        signal.signal(signal.SIGTERM, handle)
+        signal.signal(signal.SIGINT, handle)
+
+
+if __name__ == "__main__":
+    sync_daemon = SyncDaemon()
+    sync_daemon.handle_signals()
+    sync_daemon.serve_forever()
@@ -0,0 +1,96 @@
+import pandas as pd
+
+
+user_columns = ["user_id", "login_id", "first_name", "last_name", "email", "status"]
+course_columns = ["course_id", "short_name", "long_name", "account_id", "term_id", "status"]
+section_columns = ["section_id", "course_id", "name", "status"]
+enrollment_columns = ["course_id", "user_id", "role", "section_id", "status"]
+
+# Every ERP extract takes the term's yr_cde and trm_cde as its two parameters
+# and returns at least "columns", named as in the SIS import format.
+update_specs = {
+    "faculty_users.csv": {"query": "ErpFacultyUsers.sql", "dataset": "users", "columns": user_columns,
+                          "keys": {"user_id": "id_num"}, "compare": {}},
+    "student_users.csv": {"query": "ErpStudentUsers.sql", "dataset": "users", "columns": user_columns,
+                          "keys": {"user_id": "id_num"}, "compare": {}},
+    "courses.csv": {"query": "ErpCourses.sql", "dataset": "courses", "columns": course_columns,
+                    "keys": {"course_id": "crs_cde"}, "compare": {}},
+    "sections.csv": {"query": "ErpSections.sql", "dataset": "sections", "columns": section_columns,
+                     "keys": {"section_id": "section_id"}, "compare": {}},
+    "enrollments.csv": {"query": "ErpEnrollments.sql", "dataset": "enrollments", "columns": enrollment_columns,
+                        "keys": {"section_id": "section_id", "user_id": "user_id", "role": "role"},
+                        "compare": {"status": "status"}},
+    "ctl_library_courses.csv": {"query": "ErpCtlLibraryCourses.sql", "dataset": "courses", "columns": course_columns,
+                                "keys": {"course_id": "crs_cde"}, "compare": {}},
+    "ctl_library_sections.csv": {"query": "ErpCtlLibrarySections.sql", "dataset": "sections",
+                                 "columns": section_columns, "keys": {"section_id": "section_id"}, "compare": {}},
+}
+
+
+def find_updates(erp_rows, canvas_dataset, keys, compare):
+    """
+    Return the ERP rows Canvas still needs, in SIS import format.
+
+    keys and compare map ERP column names to the cleaned Canvas column
+    names. A row is needed when its key is missing from Canvas (unless
+    the ERP marks it deleted) or when a compared column differs.
+    """
+    erp_columns = list(keys) + list(compare)
+    erp = _normalize(erp_rows, erp_columns)
+
+    canvas = _normalize(canvas_dataset, list(keys.values()) + list(compare.values()))
+    canvas.columns = erp_columns
+    canvas = canvas.drop_duplicates(list(keys))
+
+    merged = erp.merge(canvas, on=list(keys), how="left", suffixes=("", "_canvas"), indicator=True)
+    missing = merged["_merge"] == "left_only"
+
+    if "status" in list(erp_rows):
+        missing &= (_normalize(erp_rows, ["status"])["status"] != "deleted").fillna(True)
+
+    changed = pd.Series(False, index=merged.index)
+    for column in compare:
+        differs = (merged[column] != merged[f'{column}_canvas']).fillna(True)
+        changed |= (merged["_merge"] == "both") & differs
+
+    return erp_rows[(missing | changed).to_numpy(dtype=bool)]
+
+
+def compute_updates(erp_snapshot, canvas_datasets, file_names=None):
+    """
+    Diff every ERP extract in file_names (default all) against its cleaned Canvas dataset.
+
+    Raises a ValueError naming every extract that lacks a column of its
+    update_specs contract.
+    """
+    if file_names is None:
+        file_names = list(update_specs)
+
+    problems = []
+    for file_name in file_names:
+        missing = [column for column in update_specs[file_name]["columns"] if column not in list(erp_snapshot[file_name])]
+        if missing:
+            problems.append(f'{update_specs[file_name]["query"]} does not return {", ".join(missing)}')
+    if problems:
+        raise ValueError("Invalid ERP extracts: " + "; ".join(problems))
+
+    updates = {}
+
+    for file_name in file_names:
+        spec = update_specs[file_name]
+        updates[file_name] = find_updates(erp_snapshot[file_name], canvas_datasets[spec["dataset"]],
+                                          spec["keys"], spec["compare"])
+
+    return updates
+
+
+def _normalize(dataset, columns):
+    normalized = pd.DataFrame(index=range(len(dataset)))
+
+    for column in columns:
+        values = dataset[column].astype("string").str.strip().reset_index(drop=True)
+        if column in ("status", "role"):
+            values = values.str.lower()
+        normalized[column] = values
+
+    return normalized
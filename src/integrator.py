@@ -1,20 +1,81 @@
 from pathlib import Path
 from datetime import datetime
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
 
 from src.jenzabar import Jenzabar
 from src.canvas import Canvas
+from src.telemetry import Telemetry
+from src.snapshots import SnapshotStore
+from src.checkpoint import Checkpoint
+from src.profiles import get_profile
+from src import cleaner
+from src import reconcile
 
+from decouple import config, Csv
+
+import shutil
 import requests
+import threading
 
 class Integrator:
 
 
-    def __init__(self, term="current"):
-        self.jenzabar = Jenzabar()
-        self.canvas = Canvas()
-        self.term_id = self._get_term_id(term)
+    def __init__(self, term="current", report_max_age=None, update_mode=None, jenzabar=None, canvas=None,
+                 datasets=None, update_files=None, profile=None, shards=None):
+        if profile is not None:
+            datasets = datasets if datasets is not None else get_profile(profile)["datasets"]
+            update_files = update_files if update_files is not None else get_profile(profile)["update_files"]
+
+        self.jenzabar = jenzabar if jenzabar is not None else Jenzabar()
+        self.canvas = canvas if canvas is not None else Canvas()
+        self.term = term
+        self._term_id = None
         self.datasets = {"users": True, "courses": True, "sections": True, "enrollments": True}
-        self.data_path = Path("data/" + str(datetime.now().strftime("%Y-%m-%d_%H-%M")) + "_" + self.term_id["jenzabar"])
+        if datasets is not None:
+            self.datasets = {dataset_name: True for dataset_name in datasets}
+        self.update_files = update_files
+        self.report_max_age = report_max_age
+        self.update_mode = update_mode if update_mode is not None else config('update_mode', default="sql")
+        self.shards = shards if shards is not None else config('canvas_shards', default="", cast=Csv(int))
+        self.clean_datasets = None
+        self.started = datetime.now()
+        self._data_path = None
+        self._telemetry = None
+        self._checkpoint = None
+
+
+    @property
+    def term_id(self):
+        """
+        Jenzabar and Canvas ids of the term, looked up on first use.
+        """
+        if self._term_id is None:
+            self._term_id = self._get_term_id(self.term)
+        return self._term_id
+
+
+    @property
+    def data_path(self):
+        if self._data_path is None:
+            self._data_path = Path("data/" + self.started.strftime("%Y-%m-%d_%H-%M") + "_" + self.term_id["jenzabar"])
+        return self._data_path
+
+
+    @property
+    def telemetry(self):
+        if self._telemetry is None:
+            self._telemetry = Telemetry({"term": self.term_id["jenzabar"]})
+        return self._telemetry
+
+
+    @property
+    def checkpoint(self):
+        if self._checkpoint is None:
+            run = {"term": self.term, "term_id": self.term_id, "datasets": list(self.datasets),
+                   "update_files": self.update_files, "update_mode": self.update_mode, "shards": self.shards}
+            self._checkpoint = Checkpoint(self.data_path, run)
+        return self._checkpoint
 
 
     def _get_term_id(self, term="current"):
@@ -34,27 +95,363 @@ class Integrator:
                 semester = "2S"
             term_ids["jenzabar"] = year + semester
             term_ids["canvas"] = self.canvas.convert_term_id(term_ids["jenzabar"])
-            
+
         return term_ids
 
+
+    @classmethod
+    def sync_terms(cls, terms=("current", "next"), jenzabar=None, canvas=None, **kwargs):
+        """
+        Sync several terms in one process, sharing the Jenzabar and Canvas clients.
+
+        Every term requests, downloads and cleans its provisioning report at
+        the same time. The mirror tables are shared by all terms, so each
+        term's mirror load and update queries run under one lock while the
+        other terms wait on Canvas reports or SIS imports.
+        """
+        jenzabar = jenzabar if jenzabar is not None else Jenzabar()
+        canvas = canvas if canvas is not None else Canvas()
+        integrations = [cls(term, jenzabar=jenzabar, canvas=canvas, **kwargs) for term in terms]
+        sql_lock = threading.Lock()
+
+        with ThreadPoolExecutor(max_workers=len(integrations)) as executor:
+            futures = [executor.submit(integration.run, sql_lock) for integration in integrations]
+            for future in futures:
+                future.result()
+
+        return integrations
+
+
+    @classmethod
+    def resume(cls, data_path, jenzabar=None, canvas=None):
+        """
+        Continue a failed run in data_path from its first unfinished stage or import.
+        """
+        run = Checkpoint(data_path).read()["run"]
+        if not run:
+            raise ValueError(f"No checkpoint to resume in {data_path}")
+
+        integration = cls(run["term"], update_mode=run["update_mode"], jenzabar=jenzabar, canvas=canvas,
+                          datasets=run["datasets"], update_files=run["update_files"], shards=run.get("shards"))
+        integration._term_id = run["term_id"]
+        integration._data_path = Path(data_path)
+        integration.run()
+
+        return integration
+
+
+    def run(self, sql_lock=None):
+        """
+        Run every stage of the sync. sql_lock guards the shared mirror tables.
+        """
+        try:
+            self.prepare_report()
+            with sql_lock if sql_lock is not None else nullcontext():
+                self.load_mirror_tables()
+                self.download_updates()
+            self.upload_updates()
+            self.reconcile()
+        finally:
+            self.save_metrics()
+            self.save_snapshot()
+
+
     def update_mirror_tables(self):
-        # jenzabar_term_id = self.jenzabar.get_current_term_id()
-        # canvas_term_id = self.canvas.convert_term_id(jenzabar_term_id)
-        print("Creating Provisioning Report from Canvas...")
-        report = self.canvas.create_provisioning_report(self.datasets, self.term_id["canvas"])
-        print("Downloading Report...")
-        self.canvas.download_report(report, self.data_path)
-        print("Cleaning Report...")
-        self.canvas.clean_report(self.datasets, self.data_path, self.term_id["jenzabar"])
-        print("Uploading Report to Canvas mirror tables in SQL...")
-        self.jenzabar.upload_report_to_sql(self.data_path, self.datasets)
-        
-    
+        self.prepare_report()
+        self.load_mirror_tables()
+
+
     def update_canvas(self):
-        print("Comparing Mirror tables with SQL's data...")
-        self.jenzabar.download_all_updates(self.data_path, self.term_id["jenzabar"])
-        print("Uploading updates to Canvas through SIS import...")
-        reports = self.canvas.upload_all_updates(self.data_path)
+        try:
+            self.download_updates()
+            self.upload_updates()
+            self.reconcile()
+        finally:
+            self.save_metrics()
+            self.save_snapshot()
+
+
+    def prepare_report(self):
+        if self.shards:
+            self.prepare_shards()
+            return
+
+        if not self._skip("download_report"):
+            self._download_report(self.canvas, self.data_path)
+            self.checkpoint.mark_done("download_report")
+
+        if self._skip("clean_report"):
+            return
+        self._print("Cleaning Report...")
+        with self.telemetry.stage("clean"):
+            self.clean_datasets = self.canvas.clean_report(self.datasets, self.data_path, self.term_id["jenzabar"])
+        for dataset_name, dataset in self.clean_datasets.items():
+            self.telemetry.record("clean_rows_in", dataset.attrs.get("rows_in", 0), dataset=dataset_name)
+            self.telemetry.record("clean_rows_out", dataset.attrs.get("rows_out", len(dataset)), dataset=dataset_name)
+        # Without saved copies a resumed run has nothing to replay, so it cleans again.
+        if (self.data_path / "provisioning_report_clean").is_dir():
+            self.checkpoint.mark_done("clean_report")
+
+
+    def prepare_shards(self):
+        """
+        Download and clean the provisioning report of every sub-account in shards, all at the same time.
+
+        The cleaned shards are merged into one set of datasets, which the
+        rest of the run loads, compares and imports as a whole: the mirror
+        tables are shared and the ERP side covers the whole institution.
+        """
+        if self._skip("clean_report"):
+            return
+        self._print(f'Getting Provisioning Reports from {len(self.shards)} sub-accounts: '
+                    f'{", ".join(str(account_id) for account_id in self.shards)}...')
+        with self.telemetry.stage("shards"):
+            with ThreadPoolExecutor(max_workers=len(self.shards)) as executor:
+                futures = {account_id: executor.submit(self._prepare_shard, account_id) for account_id in self.shards}
+                shard_datasets = {account_id: future.result() for account_id, future in futures.items()}
+
+        self._print("Merging sub-account reports...")
+        with self.telemetry.stage("clean"):
+            self.clean_datasets = self._merge_shards(shard_datasets)
+        for dataset_name, dataset in self.clean_datasets.items():
+            self.telemetry.record("clean_rows_in", dataset.attrs["rows_in"], dataset=dataset_name)
+            self.telemetry.record("clean_rows_out", dataset.attrs["rows_out"], dataset=dataset_name)
+        self.checkpoint.mark_done("download_report")
+        if (self.data_path / "provisioning_report_clean").is_dir():
+            self.checkpoint.mark_done("clean_report")
+            shutil.rmtree(self.data_path / "shards")
+
+
+    def _prepare_shard(self, account_id):
+        shard_path = self.data_path / "shards" / str(account_id)
+        stage_name = f'download_report_{account_id}'
+
+        if not self._skip(stage_name):
+            self._download_report(self.canvas.sub_account(account_id), shard_path, shard=account_id)
+            self.checkpoint.mark_done(stage_name)
+
+        with self.telemetry.stage("shard_clean", shard=account_id):
+            datasets = self.canvas.clean_report(self.datasets, shard_path, self.term_id["jenzabar"],
+                                                clean_format="none")
+        for dataset_name, dataset in datasets.items():
+            self.telemetry.record("shard_rows", len(dataset), shard=account_id, dataset=dataset_name)
+        self._print(f'Sub-account {account_id}: {sum(len(dataset) for dataset in datasets.values())} rows')
+
+        return datasets
+
+
+    def _merge_shards(self, shard_datasets):
+        """
+        Concatenate the cleaned datasets of every shard, dropping rows more than one shard reported.
+        """
+        clean_format = config('clean_format', default="csv")
+        clean_path = self.data_path / "provisioning_report_clean"
+        if clean_format != "none":
+            clean_path.mkdir(parents=True, exist_ok=True)
+
+        datasets = {}
+        for dataset_name in self.datasets:
+            shards = [datasets_of_shard[dataset_name] for datasets_of_shard in shard_datasets.values()]
+            dataset = cleaner.concat_chunks(shards, dataset_name)
+            dataset = dataset.drop_duplicates(subset=self.jenzabar.mirror_keys[dataset_name], ignore_index=True)
+            dataset.attrs["rows_in"] = sum(shard.attrs.get("rows_in", len(shard)) for shard in shards)
+            dataset.attrs["rows_out"] = len(dataset)
+            if clean_format != "none":
+                cleaner.write_clean_dataset(dataset, clean_path, dataset_name, clean_format)
+            datasets[dataset_name] = dataset
+
+        return datasets
+
+
+    def _download_report(self, canvas, data_path, **labels):
+        if len(self.datasets) > 1 and config('report_per_dataset', default=True, cast=bool):
+            self._print(f'Getting one Provisioning Report per dataset from Canvas: {", ".join(self.datasets)}...')
+            with self.telemetry.stage("report_wait", **labels):
+                report_path, report_seconds = canvas.download_reports(self.datasets, self.term_id["canvas"],
+                                                                      data_path, self.report_max_age)
+            for dataset_name, seconds in report_seconds.items():
+                self.telemetry.record("dataset_report_seconds", seconds, dataset=dataset_name, **labels)
+        else:
+            self._print("Getting Provisioning Report from Canvas...")
+            with self.telemetry.stage("report_wait", **labels):
+                report = canvas.get_provisioning_report(self.datasets, self.term_id["canvas"], self.report_max_age)
+            self._print("Downloading Report...")
+            with self.telemetry.stage("download", **labels):
+                report_path = canvas.download_report(report, data_path)
+        self.telemetry.record("download_bytes", report_path.stat().st_size, **labels)
+
+        return report_path
+
+
+    def load_mirror_tables(self):
+        if self.update_mode == "local":
+            self._print("Skipping Canvas mirror tables, updates will be compared locally.")
+            return
+        # Other runs share the mirror tables, so they are loaded again whenever the update queries still have to run.
+        if self.checkpoint.is_done("download_updates"):
+            self._print("Skipping load_mirror_tables, the update files are already written.")
+            return
+        self._print("Uploading Report to Canvas mirror tables in SQL...")
+        with self.telemetry.stage("mirror_load"):
+            load_stats = self.jenzabar.upload_report_to_sql(self.data_path, self.datasets, self.clean_datasets)
+        for stats in load_stats.values():
+            self._print(f'{stats["table"]}: {stats["rows"]} rows at {stats["rows_per_second"]:.0f} rows/s')
+            self.telemetry.record("sql_load_rows", stats["rows"], table=stats["table"])
+            self.telemetry.record("sql_load_rows_per_second", stats["rows_per_second"], table=stats["table"])
+        self.checkpoint.mark_done("load_mirror_tables")
+
+
+    def download_updates(self):
+        if self._skip("download_updates"):
+            return
+        self._print("Comparing Mirror tables with SQL's data...")
+        with self.telemetry.stage("download_updates"):
+            timings = self.jenzabar.download_all_updates(self.data_path, self.term_id["jenzabar"],
+                                                         self.update_mode, self.clean_datasets,
+                                                         file_names=self.update_files)
+        for timing in timings.values():
+            self._print(f'{timing["query"]}: {timing["rows"]} rows in {timing["seconds"]:.1f}s')
+            self.telemetry.record("update_query_seconds", timing["seconds"], query=timing["query"])
+            self.telemetry.record("update_query_rows", timing["rows"], query=timing["query"])
+        query_seconds = sum(timing["seconds"] for timing in timings.values())
+        if query_seconds > 0:
+            slowest = max(timings.values(), key=lambda timing: timing["seconds"])
+            self._print(f'Slowest query: {slowest["query"]} ({slowest["seconds"] / query_seconds:.0%} of query time)')
+        if any(timing.get("plan") for timing in timings.values()):
+            self._print(f'Plans of slow queries saved in {self.data_path / "query_plans.txt"}')
+        self.checkpoint.mark_done("download_updates")
+
+
+    def upload_updates(self):
+        if self._skip("upload_updates"):
+            return
+        upload_order = [file_name for file_name in self.canvas.upload_order
+                        if self.update_files is None or file_name in self.update_files]
+        reports = self.checkpoint.completed_imports()
+        file_names = [file_name for file_name in upload_order if file_name not in reports]
+        if reports:
+            self._print(f'Skipping imports finished in an earlier attempt: {", ".join(reports)}')
+        self._print("Uploading updates to Canvas through SIS import...")
+        with self.telemetry.stage("sis_imports"):
+            new_reports = self.canvas.upload_all_updates(self.data_path, file_names=file_names,
+                                                         on_complete=self.checkpoint.mark_import)
+        for file_name, report in new_reports.items():
+            self.telemetry.record("sis_import_queue_seconds", getattr(report, "queue_seconds", 0), file=file_name)
+            self.telemetry.record("sis_import_processing_seconds", getattr(report, "processing_seconds", 0),
+                                  file=file_name)
+        reports.update(new_reports)
+        reports = {file_name: reports[file_name] for file_name in upload_order}
         self.canvas.save_report(reports, self.data_path)
-        print("=================================================")
-        print(f'Operation finished succesfully. Report saved in {self.data_path}')
\ No newline at end of file
+        failed_files = [file_name for file_name, report in reports.items()
+                        if getattr(report, "transport", None) == "rest" and getattr(report, "processing_errors", None)]
+        if failed_files:
+            self._print(f'Keeping the previous watermarks of files with failed API calls: {", ".join(failed_files)}')
+        self.jenzabar.commit_watermarks(self.data_path, skip_files=failed_files)
+        self.checkpoint.mark_done("upload_updates")
+        self._print("=================================================")
+        self._print(f'Operation finished succesfully. Report saved in {self.data_path}')
+
+
+    def reconcile(self):
+        """
+        Check right after the imports that Canvas holds the courses, sections and enrollments it should.
+
+        The keys expected from the cleaned report and the update files are
+        compared, by count and checksum, with a targeted fetch: every
+        course of the term, and the sections and enrollments of up to
+        reconcile_max_courses of the courses this run touched. Drift is
+        reported in reconciliation.txt and the run's metrics.
+        """
+        if not config('reconcile', default=True, cast=bool):
+            return
+        dataset_names = [dataset_name for dataset_name, file_names in reconcile.reconcile_files.items()
+                         if dataset_name in self.datasets
+                         and any((self.data_path / "updates" / file_name).is_file() for file_name in file_names)]
+        clean_path = self.data_path / "provisioning_report_clean"
+        if not dataset_names or (self.clean_datasets is None and not clean_path.is_dir()):
+            return
+
+        self._print("Reconciling Canvas with the imported updates...")
+        try:
+            with self.telemetry.stage("reconcile"):
+                course_ids, results = self._reconcile(dataset_names, clean_path)
+        except Exception as error:
+            # The imports already went through, so a failed check is reported and the run still succeeds.
+            self.telemetry.record("reconcile_errors", 1)
+            report_path = reconcile.save_report({}, self.data_path, self.term_id["jenzabar"], [], error=error)
+            self._print(f'Reconciliation failed, see {report_path}: {error!r}')
+            return
+
+        for dataset_name, result in results.items():
+            self.telemetry.record("reconcile_expected", result["expected_count"], dataset=dataset_name)
+            self.telemetry.record("reconcile_actual", result["actual_count"], dataset=dataset_name)
+            self.telemetry.record("reconcile_drift", result["missing"] + result["unexpected"], dataset=dataset_name)
+            if result["expected_checksum"] == result["actual_checksum"]:
+                self._print(f'{dataset_name}: {result["actual_count"]} in Canvas, as expected')
+            else:
+                self._print(f'DRIFT {dataset_name}: {result["missing"]} missing from Canvas, '
+                            f'{result["unexpected"]} unexpected')
+        report_path = reconcile.save_report(results, self.data_path, self.term_id["jenzabar"], course_ids)
+        self._print(f'Reconciliation saved in {report_path}')
+
+
+    def _reconcile(self, dataset_names, clean_path):
+        updates = {dataset_name: reconcile.read_updates(self.data_path / "updates", dataset_name)
+                   for dataset_name in dataset_names}
+        course_ids = reconcile.sample_courses(updates, config('reconcile_max_courses', default=25, cast=int))
+        canvas_keys = self.canvas.fetch_keys(self.term_id["canvas"], course_ids)
+
+        results = {}
+        for dataset_name in dataset_names:
+            dataset = (self.clean_datasets or {}).get(dataset_name)
+            if dataset is None:
+                dataset = cleaner.read_clean_dataset(clean_path, dataset_name)
+            scope = None if dataset_name == "courses" else course_ids
+            results[dataset_name] = reconcile.compare(
+                reconcile.expected_keys(dataset_name, dataset, updates[dataset_name], scope),
+                reconcile.actual_keys(dataset_name, canvas_keys[dataset_name], scope))
+
+        return course_ids, results
+
+
+    def save_metrics(self):
+        """
+        Save the run's metrics to data_path, and to the Prometheus textfile directory if configured.
+        """
+        budget = self.canvas.budget.snapshot()
+        for name in ["requests", "throttled", "retries", "cost", "wait_seconds"]:
+            self.telemetry.record(f'canvas_api_{name}', budget[name])
+        if budget["remaining"] is not None:
+            self.telemetry.record("canvas_api_rate_limit_remaining", budget["remaining"])
+
+        self.telemetry.save(self.data_path)
+
+        prometheus_dir = config('prometheus_textfile_dir', default="")
+        if prometheus_dir:
+            self.telemetry.write_prometheus(Path(prometheus_dir) / f'lms_erp_sync_{self.term_id["jenzabar"]}.prom')
+
+
+    def save_snapshot(self):
+        """
+        Snapshot the run's artifacts into the snapshot store and apply its retention policy.
+        """
+        if not config('snapshot_store', default=True, cast=bool):
+            return
+
+        store = SnapshotStore(self.data_path.parent / "snapshots")
+        with self.telemetry.stage("snapshot"):
+            manifest = store.save(self.data_path, self.term_id["jenzabar"])
+            store.apply_retention(self.data_path.parent)
+        if manifest is not None:
+            self.telemetry.record("snapshot_bytes", sum(entry["size"] for entry in manifest["artifacts"].values()))
+
+
+    def _skip(self, stage_name):
+        if self.checkpoint.is_done(stage_name):
+            self._print(f'Skipping {stage_name}, it finished in an earlier attempt.')
+            return True
+        return False
+
+
+    def _print(self, message):
+        print(f'[{self.term_id["jenzabar"]}] {message}')
@@ -1,19 +1,98 @@
 from decouple import config
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
 import sqlalchemy as db
 import pandas as pd
 import urllib.parse
+import datetime
+import json
+import threading
 
-import pyodbc
+from src import cleaner
+from src.cache import JsonCache
+from src.query_registry import QueryRegistry
+from src import diff_engine
+from src.bulk_loader import bulk_loaders
 
 
 class Jenzabar:
 
+    mirror_keys = {
+        "users": ["id_num"],
+        "courses": ["canvas_course_id"],
+        "sections": ["canvas_section_id"],
+        "enrollments": ["canvas_enrollment_id"],
+        }
+
+    update_queries = {
+        "faculty_users.csv": "MissingFacultyUsers.sql",
+        "student_users.csv": "MissingStudentUsers.sql",
+        "courses.csv": "MissingCourses.sql",
+        "sections.csv": "MissingSections.sql",
+        "enrollments.csv": "DailyEnrollment.sql",
+        "ctl_library_courses.csv": "CtlLibraryCourses.sql",
+        "ctl_library_sections.csv": "CtlLibrarySections.sql"
+        }
+
+
+    def __init__(self, sis_engine=None):
+        self._sis_engine = sis_engine
+        self._bulk_loader = None
+        self._queries = None
+        self._connect_lock = threading.Lock()
+        self.queries_path = Path(__file__).parent / "queries"
+        self.watermarks = JsonCache(Path("data/watermarks.json"))
+        self.extract_overlap_minutes = config('extract_overlap_minutes', default=10, cast=int)
+        self.extract_repair_hours = config('extract_repair_hours', default=168, cast=int)
+
+
+    @property
+    def sis_engine(self):
+        """
+        SQL engine for the SIS database, created on first use.
+        """
+        if self._sis_engine is not None:
+            return self._sis_engine
+
+        with self._connect_lock:
+            if self._sis_engine is None:
+                password = urllib.parse.quote_plus(config('sis_password'))
+                self._sis_engine = db.create_engine(f"mssql+pyodbc://{config('sis_username')}:{password}@{config('sis_server')}/{config('sis_database')}?driver=SQL+Server+Native+Client+10.0",
+                                                    fast_executemany=True,
+                                                    pool_size=config('sis_pool_size', default=8, cast=int),
+                                                    max_overflow=config('sis_pool_overflow', default=4, cast=int),
+                                                    pool_recycle=config('sis_pool_recycle', default=1800, cast=int),
+                                                    pool_pre_ping=True)
 
-    def __init__(self):
-        password = urllib.parse.quote_plus(config('sis_password'))
-        self.sis_engine = db.create_engine(f"mssql+pyodbc://{config('sis_username')}:{password}@{config('sis_server')}/{config('sis_database')}?driver=SQL+Server+Native+Client+10.0")
+        return self._sis_engine
+
+
+    @property
+    def bulk_loader(self):
+        """
+        Bulk loader for the mirror tables, chosen by the bulk_loader setting.
+        """
+        if self._bulk_loader is None:
+            self._bulk_loader = bulk_loaders[config('bulk_loader', default="executemany")](
+                self.sis_engine, batch_size=config('bulk_batch_size', default=5000, cast=int),
+                swap=config('mirror_load_swap', default=False, cast=bool), state_path=Path("data/mirror_state"))
+
+        return self._bulk_loader
+
+
+    @property
+    def queries(self):
+        """
+        Registry of the queries in queries_path, loaded on first use and again if queries_path changes.
+        """
+        sis_engine = self.sis_engine
+        with self._connect_lock:
+            if self._queries is None or self._queries.queries_path != Path(self.queries_path):
+                self._queries = QueryRegistry(self.queries_path, sis_engine,
+                                              config('slow_query_seconds', default=0, cast=float))
+
+        return self._queries
 
 
     def get_current_term_id(self):
@@ -28,54 +107,230 @@ class Jenzabar:
         return term_id
 
 
-    def upload_report_to_sql(self, datapath, dataset_names):
+    def upload_report_to_sql(self, datapath, dataset_names, datasets=None, load_mode=None):
         """
         Upload a cleaned canvas report to Jenzabar's SQL server.
+
+        datasets holds the cleaned frames from Canvas.clean_report; any
+        dataset not given is replayed from provisioning_report_clean.
+        load_mode "full" reloads every table, "delta" writes only the rows
+        that changed since the last load. Returns the load statistics of
+        each table.
         """
+        if datasets is None:
+            datasets = {}
+        if load_mode is None:
+            load_mode = config('mirror_load_mode', default="full")
+
+        load_stats = {}
+
         allowed_targets = ["rpc_RE_Canvas_Users", "rpc_RE_Canvas_Courses", 
                            "rpc_RE_Canvas_Sections", "rpc_RE_Canvas_Enrollments"]
 
         for dataset_name in dataset_names:
-            dataset = pd.read_csv(datapath / "provisioning_report_clean" / f'{dataset_name}.csv')   
+            dataset = datasets.get(dataset_name)
+            if dataset is None:
+                dataset = cleaner.read_clean_dataset(datapath / "provisioning_report_clean", dataset_name)
+
             target_table = f'rpc_RE_Canvas_{dataset_name.capitalize()}'
 
             if target_table not in allowed_targets:
                 raise NameError("Chosen target is not in the scope of the project.")
 
-            with self.sis_engine.connect() as conn:
-                conn.execute(f'DELETE FROM {target_table}')
-                dataset.to_sql(target_table, conn, if_exists='append', index=False, chunksize=100, method="multi")
+            if load_mode == "delta":
+                load_stats[dataset_name] = self.bulk_loader.apply_delta(dataset, target_table,
+                                                                        self.mirror_keys[dataset_name])
+            else:
+                load_stats[dataset_name] = self.bulk_loader.load(dataset, target_table)
 
+        return load_stats
 
-    def download_all_updates(self, data_path, term_id):
-        update_queries = {
-            "faculty_users.csv": "MissingFacultyUsers.sql",
-            "student_users.csv": "MissingStudentUsers.sql",
-            "courses.csv": "MissingCourses.sql",
-            "sections.csv": "MissingSections.sql",
-            "enrollments.csv": "DailyEnrollment.sql",
-            "ctl_library_courses.csv": "CtlLibraryCourses.sql",
-            "ctl_library_sections.csv": "CtlLibrarySections.sql"
-        }
+
+    def download_all_updates(self, data_path, term_id, update_mode=None, canvas_datasets=None, max_workers=None,
+                             file_names=None, extract_mode=None):
+        """
+        Write the Canvas update files in file_names (default all) to data_path/updates.
+
+        update_mode "sql" runs the comparison queries against the mirror
+        tables. "local" pulls the ERP side once and diffs it in memory
+        against the cleaned Canvas frames in canvas_datasets (replayed
+        from provisioning_report_clean when not given). Queries run on up
+        to max_workers pooled connections at once. With extract_mode
+        "incremental" the queries only read rows changed since the last
+        run, see _extraction_marks. Returns the timing of each query.
+        """
+        if update_mode is None:
+            update_mode = config('update_mode', default="sql")
+        if extract_mode is None:
+            extract_mode = config('extract_mode', default="full")
+
+        if file_names is None:
+            file_names = list(self.update_queries)
 
         updates_path = (data_path / "updates")
         updates_path.mkdir(parents=True, exist_ok=True)
 
-        for file_name in update_queries.keys():
-            update = self._get_update(update_queries[file_name], term_id)
+        if update_mode == "local":
+            update_queries = {file_name: diff_engine.update_specs[file_name]["query"] for file_name in file_names}
+        else:
+            update_queries = {file_name: self.update_queries[file_name] for file_name in file_names}
+
+        expected = {querie_name: 2 for querie_name in update_queries.values()}
+        if extract_mode == "incremental":
+            expected.update({self._since_query(querie_name): 3 for querie_name in update_queries.values()
+                             if self._since_query(querie_name) in self.queries})
+        columns = {}
+        if update_mode == "local":
+            columns = {diff_engine.update_specs[file_name]["query"]: diff_engine.update_specs[file_name]["columns"]
+                       for file_name in file_names}
+        self.queries.validate(expected, columns)
+
+        since = {}
+        if extract_mode == "incremental":
+            since = self._extraction_marks(data_path, term_id, update_queries)
+
+        if update_mode == "local":
+            updates, timings = self._get_local_updates(data_path, term_id, canvas_datasets, max_workers, file_names,
+                                                       since)
+        else:
+            updates, timings = self._get_updates(update_queries, term_id, max_workers, since)
+
+        for file_name, update in updates.items():
             update.to_csv(updates_path / f'{file_name}', index=False)
 
+        plans = [timing for timing in timings.values() if timing.get("plan")]
+        if plans:
+            with open(data_path / "query_plans.txt", 'w') as plans_file:
+                for timing in plans:
+                    plans_file.write(f'-- {timing["query"]}: {timing["seconds"]:.1f}s, {timing["rows"]} rows\n')
+                    plans_file.write(f'{timing["plan"]}\n\n')
+
+        return timings
 
-    def _get_update(self, querie_name, term_id):
 
-        with open(Path(f'src/queries/{querie_name}')) as querie_file:
-            querie = querie_file.read()
+    def commit_watermarks(self, data_path, skip_files=()):
+        """
+        Keep the high-water marks of an incremental extraction once its updates reached Canvas.
 
-            with self.sis_engine.connect() as conn:
-                update = pd.read_sql(querie, conn, params=[term_id[:2], term_id[2:]])
+        Until then they only live in the run's data_path, so a run that
+        fails before its imports finish is extracted again in full from
+        the previous marks. The marks of skip_files, update files some of
+        whose rows did not reach Canvas, are not kept either.
+        """
+        pending_path = data_path / "watermarks.json"
+        if not pending_path.is_file():
+            return
+
+        with open(pending_path) as pending_file:
+            pending = json.load(pending_file)
+
+        for key, watermark in pending.items():
+            if key.split(":", 1)[1] not in skip_files:
+                self.watermarks.set(key, watermark)
+
+
+    def _extraction_marks(self, data_path, term_id, update_queries):
+        """
+        Return the lower bound of changed rows to read for each update file.
+
+        A file is read incrementally when it has a stored mark, its query
+        has a .since.sql variant that takes the mark as a third parameter,
+        and it had a full read within extract_repair_hours; otherwise it
+        is read in full to repair any drift. The database's clock at the
+        start of the extraction is written to data_path as the next mark,
+        and bounds are moved back by extract_overlap_minutes so rows
+        committed late are not missed.
+        """
+        now = self._database_time()
+        repair_age = datetime.timedelta(hours=self.extract_repair_hours)
+        overlap = datetime.timedelta(minutes=self.extract_overlap_minutes)
+        since = {}
+        pending = {}
+
+        for file_name, querie_name in update_queries.items():
+            key = f'{term_id}:{file_name}'
+            watermark = self.watermarks.get(key, datetime.timedelta.max)
+            incremental = (watermark is not None and self._since_query(querie_name) in self.queries
+                           and datetime.datetime.now() - datetime.datetime.fromisoformat(watermark["full_at"]) < repair_age)
+
+            if incremental:
+                since[file_name] = (pd.Timestamp(watermark["mark"]) - overlap).strftime("%Y-%m-%d %H:%M:%S")
+                pending[key] = {"mark": now, "full_at": watermark["full_at"]}
+            else:
+                pending[key] = {"mark": now, "full_at": datetime.datetime.now().isoformat()}
+
+        with open(data_path / "watermarks.json", 'w') as pending_file:
+            json.dump(pending, pending_file, indent=2)
+
+        return since
+
+
+    def _database_time(self):
+        with self.sis_engine.connect() as conn:
+            now = conn.execute(db.text("SELECT CURRENT_TIMESTAMP")).scalar()
+
+        return pd.Timestamp(now).strftime("%Y-%m-%d %H:%M:%S")
+
+
+    def _since_query(self, querie_name):
+        return querie_name.replace(".sql", ".since.sql")
+
+
+    def _get_updates(self, update_queries, term_id, max_workers=None, since=None):
+        """
+        Run update queries concurrently, returning their results and timings.
+
+        Files with a bound in since only read the rows changed from then on.
+        """
+        if max_workers is None:
+            max_workers = config('sis_query_workers', default=4, cast=int)
+        if since is None:
+            since = {}
+
+        def timed_update(file_name, querie_name):
+            update = self._get_update(querie_name, term_id, since.get(file_name))
+            return update, {"query": querie_name, "seconds": update.attrs["seconds"], "rows": len(update),
+                            "extract": "incremental" if file_name in since else "full",
+                            "plan": update.attrs.get("plan")}
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {file_name: executor.submit(timed_update, file_name, querie_name)
+                       for file_name, querie_name in update_queries.items()}
+            results = {file_name: future.result() for file_name, future in futures.items()}
+
+        updates = {file_name: result[0] for file_name, result in results.items()}
+        timings = {file_name: result[1] for file_name, result in results.items()}
+
+        return updates, timings
+
+
+    def _get_local_updates(self, data_path, term_id, canvas_datasets=None, max_workers=None, file_names=None,
+                           since=None):
+        if canvas_datasets is None:
+            canvas_datasets = {}
+
+        update_specs = {file_name: diff_engine.update_specs[file_name] for file_name in file_names}
+
+        for dataset_name in {spec["dataset"] for spec in update_specs.values()}:
+            if canvas_datasets.get(dataset_name) is None:
+                canvas_datasets[dataset_name] = cleaner.read_clean_dataset(data_path / "provisioning_report_clean",
+                                                                           dataset_name)
+
+        erp_queries = {file_name: spec["query"] for file_name, spec in update_specs.items()}
+        erp_snapshot, timings = self._get_updates(erp_queries, term_id, max_workers, since)
+
+        return diff_engine.compute_updates(erp_snapshot, canvas_datasets, file_names), timings
+
+
+    def _get_update(self, querie_name, term_id, since=None):
+        params = (term_id[:2], term_id[2:])
+        if since is not None:
+            querie_name = self._since_query(querie_name)
+            params = (term_id[:2], term_id[2:], since)
+
+        update = self.queries.run(querie_name, params)
 
         if "user_id" in list(update):
             update["user_id"] = update["user_id"].astype("Int64")
 
         return update
-
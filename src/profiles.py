@@ -0,0 +1,32 @@
+"""
+Sync profiles: the datasets and update files a sync is limited to.
+
+datasets bounds the provisioning report, the cleaning and the mirror
+loads; update_files bounds the update queries and the imports (None
+means every update file).
+"""
+
+profiles = {
+    "full": {
+        "datasets": ["users", "courses", "sections", "enrollments"],
+        "update_files": None,
+        },
+    "enrollments-only": {
+        "datasets": ["enrollments"],
+        "update_files": ["enrollments.csv"],
+        },
+    "new-courses": {
+        "datasets": ["courses", "sections"],
+        "update_files": ["courses.csv", "sections.csv", "ctl_library_courses.csv", "ctl_library_sections.csv"],
+        },
+    "new-users": {
+        "datasets": ["users"],
+        "update_files": ["faculty_users.csv", "student_users.csv"],
+        },
+    }
+
+
+def get_profile(name):
+    if name not in profiles:
+        raise ValueError(f"Unknown sync profile {name!r}, expected one of: {', '.join(profiles)}")
+    return profiles[name]
@@ -0,0 +1,150 @@
+import re
+import time
+import threading
+
+import pandas as pd
+
+from pathlib import Path
+
+
+class QueryRegistry:
+    """
+    SQL queries of a directory, loaded once and run with bound parameters.
+
+    Every run is timed and counted per query. A run slower than
+    slow_query_seconds also captures the database's plan for the query
+    (0 turns plan capture off), so the query that dominates an update
+    can be found without rerunning it by hand.
+    """
+
+    explain_statements = {
+        "sqlite": "EXPLAIN QUERY PLAN {query}",
+        "postgresql": "EXPLAIN {query}",
+        "mysql": "EXPLAIN {query}",
+    }
+
+    # String literals, quoted identifiers and comments are matched whole so a ? inside them is not counted.
+    parameter_pattern = re.compile(r"'(?:[^']|'')*'|\"[^\"]*\"|\[[^\]]*\]|--[^\n]*|/\*.*?\*/|\?", re.DOTALL)
+
+
+    def __init__(self, queries_path, engine, slow_query_seconds=0):
+        self.queries_path = Path(queries_path)
+        self.engine = engine
+        self.slow_query_seconds = slow_query_seconds
+        self.queries = {query_path.name: query_path.read_text() for query_path in sorted(self.queries_path.glob("*.sql"))}
+        self.stats = {}
+        self._lock = threading.Lock()
+
+
+    def __contains__(self, name):
+        return name in self.queries
+
+
+    def validate(self, expected, columns=None):
+        """
+        Check that every query in expected exists and takes the expected number of parameters.
+
+        Parameters are the ? placeholders outside string literals, quoted
+        identifiers and comments.
+
+        expected maps query names to their parameter count, columns
+        optionally maps them to the columns they must return, which are
+        named when the query is missing. Raises a ValueError listing every
+        problem at once.
+        """
+        if columns is None:
+            columns = {}
+
+        problems = []
+
+        for name, parameters in expected.items():
+            query = self.queries.get(name)
+            if query is None and name in columns:
+                problems.append(f'{name} is missing from {self.queries_path}, it must take {parameters} '
+                                f'parameters and return {", ".join(columns[name])}')
+            elif query is None:
+                problems.append(f'{name} is missing from {self.queries_path}')
+            elif not query.strip():
+                problems.append(f'{name} is empty')
+            elif self.parameter_count(name) != parameters:
+                problems.append(f'{name} takes {self.parameter_count(name)} parameters instead of {parameters}')
+
+        if problems:
+            raise ValueError("Invalid queries: " + "; ".join(problems))
+
+
+    def parameter_count(self, name):
+        """
+        Return the number of ? placeholders a query binds.
+        """
+        return sum(1 for match in self.parameter_pattern.finditer(self.queries[name]) if match.group() == "?")
+
+
+    def run(self, name, params=()):
+        """
+        Run a query and return its rows.
+
+        The frame's attrs hold the query's seconds and, for a slow query,
+        its plan.
+        """
+        start = time.perf_counter()
+        with self.engine.connect() as conn:
+            result = pd.read_sql(self.queries[name], conn, params=tuple(params))
+        seconds = time.perf_counter() - start
+
+        with self._lock:
+            stats = self.stats.setdefault(name, {"calls": 0, "seconds": 0.0, "max_seconds": 0.0, "rows": 0})
+            stats["calls"] += 1
+            stats["seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+            stats["rows"] += len(result)
+
+        result.attrs["seconds"] = seconds
+        if self.slow_query_seconds and seconds > self.slow_query_seconds:
+            result.attrs["plan"] = self.explain(name, params)
+
+        return result
+
+
+    def explain(self, name, params=()):
+        """
+        Return the database's plan for a query as text, or None if the dialect is not supported.
+        """
+        query = self.queries[name]
+
+        if self.engine.dialect.name == "mssql":
+            return self._showplan(query, params)
+        if self.engine.dialect.name not in self.explain_statements:
+            return None
+
+        explain = self.explain_statements[self.engine.dialect.name].format(query=query)
+        with self.engine.connect() as conn:
+            plan = pd.read_sql(explain, conn, params=tuple(params))
+
+        return plan.to_string(index=False)
+
+
+    def _showplan(self, query, params=()):
+        """
+        SQL Server's plan, read from the rowsets SHOWPLAN_TEXT returns.
+
+        Every statement gives a rowset with its text followed by one with
+        its plan, so all rowsets are read from the DBAPI cursor and only
+        the plans are kept.
+        """
+        with self.engine.connect() as conn:
+            cursor = conn.connection.cursor()
+            try:
+                cursor.execute("SET SHOWPLAN_TEXT ON")
+                cursor.execute(query, tuple(params))
+                rowsets = []
+                while True:
+                    if cursor.description is not None:
+                        rowsets.append(cursor.fetchall())
+                    if not cursor.nextset():
+                        break
+            finally:
+                cursor.execute("SET SHOWPLAN_TEXT OFF")
+                cursor.close()
+
+        return "\n".join(str(row[0]).rstrip() for rowset in rowsets[1::2] for row in rowset)
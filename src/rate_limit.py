@@ -0,0 +1,202 @@
+import time
+import random
+import threading
+
+from decouple import config
+from requests.adapters import HTTPAdapter
+
+
+class RequestBudget:
+    """
+    Canvas API throttling budget shared by every request of the process.
+
+    Canvas throttles with a leaky bucket per access token. Every response
+    carries X-Request-Cost and X-Rate-Limit-Remaining, and every request
+    is charged an up-front penalty while it is in flight. The budget
+    keeps the last remaining value it saw, counts requests still in
+    flight against it, and holds new requests back while the estimate is
+    below the reserve, letting the bucket drain at refill_rate units a
+    second.
+    """
+
+    def __init__(self, reserve=None, preflight_cost=None, refill_rate=None, max_retries=None):
+        self.reserve = reserve if reserve is not None else config('canvas_rate_limit_reserve', default=100, cast=float)
+        self.preflight_cost = preflight_cost if preflight_cost is not None else config('canvas_rate_limit_preflight', default=50, cast=float)
+        self.refill_rate = refill_rate if refill_rate is not None else config('canvas_rate_limit_refill', default=10, cast=float)
+        self.max_retries = max_retries if max_retries is not None else config('canvas_rate_limit_retries', default=5, cast=int)
+        self.remaining = None
+        self.in_flight = 0
+        self.counters = {"requests": 0, "throttled": 0, "retries": 0, "cost": 0.0, "wait_seconds": 0.0}
+        self._updated = time.monotonic()
+        self._condition = threading.Condition()
+
+
+    def acquire(self):
+        """
+        Wait until the shared budget can afford one more request, then count it as in flight.
+        """
+        waited = 0.0
+
+        with self._condition:
+            while True:
+                available = self._estimate() - self.in_flight * self.preflight_cost
+                if available >= self.reserve:
+                    break
+                delay = max(0.05, (self.reserve - available) / self.refill_rate)
+                start = time.monotonic()
+                self._condition.wait(delay)
+                waited += time.monotonic() - start
+
+            self.in_flight += 1
+            self.counters["requests"] += 1
+            self.counters["wait_seconds"] += waited
+
+
+    def release(self, response=None):
+        """
+        Count a request as finished and take in the throttling headers of its response.
+        """
+        with self._condition:
+            self.in_flight -= 1
+            if response is not None:
+                remaining = response.headers.get("X-Rate-Limit-Remaining")
+                cost = response.headers.get("X-Request-Cost")
+                if remaining is not None:
+                    self.remaining = float(remaining)
+                    self._updated = time.monotonic()
+                if cost is not None:
+                    self.counters["cost"] += float(cost)
+            self._condition.notify_all()
+
+
+    def throttled(self, attempt):
+        """
+        Record a throttled request and return how long to back off before retrying it.
+        """
+        with self._condition:
+            self.counters["throttled"] += 1
+            self.counters["retries"] += 1
+            self.remaining = 0.0
+            self._updated = time.monotonic()
+
+        return backoff_delay(max(1.0, self.reserve / self.refill_rate), attempt)
+
+
+    def snapshot(self):
+        """
+        Current counters and remaining budget, for monitoring.
+        """
+        with self._condition:
+            return {**self.counters, "remaining": self._estimate() if self.remaining is not None else None,
+                    "in_flight": self.in_flight}
+
+
+    def _estimate(self):
+        if self.remaining is None:
+            return float("inf")
+        return self.remaining + (time.monotonic() - self._updated) * self.refill_rate
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """
+    Transport adapter that sends every request through a RequestBudget.
+
+    A 403 "Rate Limit Exceeded" answer is retried with backoff, up to the
+    budget's max_retries, before it is handed back to the caller.
+    """
+
+    def __init__(self, budget, **kwargs):
+        self.budget = budget
+        super().__init__(**kwargs)
+
+
+    def send(self, request, **kwargs):
+        attempt = 0
+
+        while True:
+            self.budget.acquire()
+            response = None
+            try:
+                response = super().send(request, **kwargs)
+            finally:
+                self.budget.release(response)
+
+            if not self._is_throttled(response) or attempt >= self.budget.max_retries:
+                return response
+
+            response.close()
+            time.sleep(self.budget.throttled(attempt))
+            attempt += 1
+
+
+    def _is_throttled(self, response):
+        return response.status_code == 403 and "Rate Limit Exceeded" in response.text
+
+
+class Poller:
+    """
+    Polling intervals that back off while a job makes no progress.
+
+    Starts at initial seconds and grows by factor up to maximum while
+    the polled progress stays the same; any progress drops it back to
+    initial. Every interval is jittered so concurrent pollers spread out.
+    """
+
+    def __init__(self, initial, maximum=None, factor=1.5, jitter=0.2):
+        self.initial = initial
+        self.maximum = maximum if maximum is not None else config('canvas_poll_max_interval', default=30, cast=float)
+        self.factor = factor
+        self.jitter = jitter
+        self.interval = initial
+        self.progress = None
+
+
+    def wait(self, progress=None):
+        """
+        Sleep before the next poll, adapting the interval to whether progress changed.
+        """
+        if progress != self.progress:
+            self.interval = self.initial
+            self.progress = progress
+        else:
+            self.interval = min(max(self.maximum, self.initial), self.interval * self.factor)
+
+        time.sleep(self.interval * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+
+def backoff_delay(base, attempt, maximum=60.0):
+    """
+    Exponential backoff with full jitter.
+    """
+    return random.uniform(0, min(maximum, base * 2 ** attempt))
+
+
+_shared_budget = None
+_shared_budget_lock = threading.Lock()
+
+
+def shared_budget():
+    """
+    The RequestBudget shared by every Canvas client of the process.
+    """
+    global _shared_budget
+
+    with _shared_budget_lock:
+        if _shared_budget is None:
+            _shared_budget = RequestBudget()
+        return _shared_budget
+
+
+def install(canvas_api, budget=None):
+    """
+    Route every request of a canvasapi Canvas object through budget (default the shared one).
+    """
+    budget = budget if budget is not None else shared_budget()
+    # canvasapi keeps its requests session on its name-mangled requester.
+    session = canvas_api._Canvas__requester._session
+    pool_size = config('canvas_pool_size', default=16, cast=int)
+    adapter = RateLimitedAdapter(budget, pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    return canvas_api
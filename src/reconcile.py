@@ -0,0 +1,135 @@
+import hashlib
+
+import pandas as pd
+
+from src.diff_engine import update_specs
+
+
+# The update files whose rows land in each dataset; the files of a dataset share its keys.
+reconcile_files = {
+    "courses": ["courses.csv", "ctl_library_courses.csv"],
+    "sections": ["sections.csv", "ctl_library_sections.csv"],
+    "enrollments": ["enrollments.csv"],
+}
+
+course_columns = {"courses": "crs_cde", "sections": "crs_cde", "enrollments": "course_id"}
+
+live_statuses = {
+    "courses": ["active", "unpublished", "completed"],
+    "sections": ["active"],
+    "enrollments": ["active"],
+}
+
+
+def expected_keys(dataset_name, canvas_dataset, update, course_ids=None):
+    """
+    Return the keys Canvas should hold for a dataset once update was imported.
+
+    Starts from the live rows of the cleaned provisioning dataset, adds
+    the update's active rows and removes its deleted ones. With
+    course_ids only the rows of those courses are kept.
+    """
+    spec = update_specs[reconcile_files[dataset_name][0]]
+    columns = {clean_column: column for column, clean_column in spec["keys"].items()}
+    columns[course_columns[dataset_name]] = "course_id"
+
+    canvas = canvas_dataset.rename(columns=columns)
+    live = _normalize(canvas["status"]).str.lower().isin(live_statuses[dataset_name])
+    keys = _key_set(canvas[live.fillna(False).to_numpy(dtype=bool)], list(spec["keys"]), course_ids)
+
+    deleted = pd.Series(False, index=range(len(update)))
+    if "status" in list(update):
+        deleted = (_normalize(update["status"]).str.lower() == "deleted").fillna(False)
+    keys |= _key_set(update[~deleted.to_numpy(dtype=bool)], list(spec["keys"]), course_ids)
+    keys -= _key_set(update[deleted.to_numpy(dtype=bool)], list(spec["keys"]), course_ids)
+
+    return keys
+
+
+def actual_keys(dataset_name, canvas_rows, course_ids=None):
+    """
+    Return the keys of rows fetched from Canvas, see Canvas.fetch_keys.
+    """
+    return _key_set(canvas_rows, list(update_specs[reconcile_files[dataset_name][0]]["keys"]), course_ids)
+
+
+def read_updates(updates_path, dataset_name):
+    """
+    Return the rows of every update file of a dataset found in updates_path, or None if there are none.
+    """
+    updates = [pd.read_csv(updates_path / file_name, dtype="string") for file_name in reconcile_files[dataset_name]
+               if (updates_path / file_name).is_file()]
+
+    return pd.concat(updates, ignore_index=True) if updates else None
+
+
+def checksum(keys):
+    """
+    Order-independent checksum of a key set.
+    """
+    digest = hashlib.sha256()
+    for key in sorted(keys):
+        digest.update("|".join(key).encode() + b"\n")
+
+    return digest.hexdigest()[:16]
+
+
+def compare(expected, actual, sample_size=10):
+    """
+    Compare an expected and a fetched key set by count and checksum.
+
+    Returns both counts and checksums, and up to sample_size of the keys
+    missing from Canvas and of the keys Canvas should not have.
+    """
+    missing = expected - actual
+    unexpected = actual - expected
+
+    return {"expected_count": len(expected), "actual_count": len(actual),
+            "expected_checksum": checksum(expected), "actual_checksum": checksum(actual),
+            "missing": len(missing), "unexpected": len(unexpected),
+            "missing_sample": ["|".join(key) for key in sorted(missing)[:sample_size]],
+            "unexpected_sample": ["|".join(key) for key in sorted(unexpected)[:sample_size]]}
+
+
+def sample_courses(updates, max_courses):
+    """
+    Pick up to max_courses of the courses the update files touched.
+    """
+    course_ids = set()
+    for update in updates.values():
+        if "course_id" in list(update):
+            course_ids.update(_normalize(update["course_id"]).dropna())
+
+    return sorted(course_ids)[:max_courses]
+
+
+def save_report(results, data_path, term_id, course_ids, error=None):
+    with open(data_path / "reconciliation.txt", 'w') as report_file:
+        report_file.write(f'Term: {term_id}\n')
+        if error is not None:
+            report_file.write(f'Reconciliation failed: {error!r}\n')
+        report_file.write(f'Sampled courses: {", ".join(course_ids)}\n')
+        for dataset_name, result in results.items():
+            report_file.write("############################\n")
+            report_file.write(f'Dataset: {dataset_name}\n')
+            report_file.write(f'Expected: {result["expected_count"]} ({result["expected_checksum"]})\n')
+            report_file.write(f'In Canvas: {result["actual_count"]} ({result["actual_checksum"]})\n')
+            report_file.write(f'Missing: {result["missing"]} {result["missing_sample"]}\n')
+            report_file.write(f'Unexpected: {result["unexpected"]} {result["unexpected_sample"]}\n')
+
+    return data_path / "reconciliation.txt"
+
+
+def _key_set(rows, columns, course_ids=None):
+    if course_ids is not None:
+        rows = rows[_normalize(rows["course_id"]).isin(course_ids).fillna(False).to_numpy(dtype=bool)]
+
+    keys = pd.DataFrame({column: _normalize(rows[column]) for column in columns}).dropna()
+    if "role" in columns:
+        keys["role"] = keys["role"].str.lower()
+
+    return set(keys.itertuples(index=False, name=None))
+
+
+def _normalize(values):
+    return values.astype("string").str.strip().reset_index(drop=True)
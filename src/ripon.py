@@ -12,6 +12,8 @@ TODO:
 
 from canvasapi import Canvas
 
+from src import rate_limit
+
 import pandas as pd
 import sqlalchemy as db
 
@@ -35,7 +37,7 @@ class Ripon:
     """
 
     def __init__(self, config):
-        self.canvas_connection = Canvas(config('api_url'), config('api_key'))
+        self.canvas_connection = rate_limit.install(Canvas(config('api_url'), config('api_key')))
         self.canvas_admin = self.canvas_connection.get_account(1)
         self._report = {"object": None, "path": None, "courses": None, "enrollments": None,
                         "sections": None, "users": None}
@@ -98,8 +100,11 @@ class Ripon:
 
         sis_import = self.canvas_admin.create_sis_import(str(update_path / file_name))
 
-        while self.canvas_admin.get_sis_import(sis_import).progress != 100:
-            time.sleep(2)
+        poller = rate_limit.Poller(2)
+        progress = self.canvas_admin.get_sis_import(sis_import).progress
+        while progress != 100:
+            poller.wait(progress)
+            progress = self.canvas_admin.get_sis_import(sis_import).progress
 
         sis_import_finished = self.canvas_admin.get_sis_import(sis_import)
 
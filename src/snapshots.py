@@ -0,0 +1,301 @@
+import os
+import csv
+import json
+import gzip
+import time
+import shutil
+import hashlib
+import datetime
+import threading
+
+from pathlib import Path
+from contextlib import contextmanager
+
+from decouple import config
+
+
+class SnapshotStore:
+    """
+    Content-addressed store for the artifacts of every run.
+
+    Each file of a run directory is stored once per distinct content,
+    under its SHA-256, gzip compressed unless it already is (zip and
+    parquet files are kept as they are). A snapshot is a small JSON
+    manifest mapping the run's relative file paths to those hashes.
+    Cleaned csv datasets are stored without their load_date column,
+    which the manifest records instead, so a dataset whose rows did not
+    change shares its object with earlier days; restore puts the column
+    back. Other files share an object only when byte-identical.
+
+    Saving and retention hold a lock file in the store, so a daemon and a
+    CLI run in separate processes can share it.
+    """
+
+    precompressed_suffixes = {".zip", ".parquet"}
+    lock_timeout = 3600
+
+
+    def __init__(self, root=Path("data/snapshots"), keep=None, max_age_days=None, keep_runs=None):
+        self.root = Path(root)
+        self.keep = keep if keep is not None else config('snapshot_keep', default=30, cast=int)
+        self.max_age_days = max_age_days if max_age_days is not None else config('snapshot_max_age_days', default=0, cast=int)
+        self.keep_runs = keep_runs if keep_runs is not None else config('snapshot_keep_runs', default=3, cast=int)
+        self.objects_path = self.root / "objects"
+        self.manifests_path = self.root / "manifests"
+
+
+    def save(self, run_path, term_id):
+        """
+        Snapshot every file in run_path. Returns the manifest, or None if run_path does not exist.
+        """
+        run_path = Path(run_path)
+        if not run_path.is_dir():
+            return None
+
+        manifest = {"run": run_path.name, "term": term_id, "created": datetime.datetime.now().isoformat(),
+                    "artifacts": {}}
+
+        with self._locked():
+            for file_path in sorted(run_path.rglob("*")):
+                if file_path.is_file():
+                    artifact = file_path.relative_to(run_path).as_posix()
+                    manifest["artifacts"][artifact] = self._store_artifact(file_path, artifact)
+
+            self.manifests_path.mkdir(parents=True, exist_ok=True)
+            self._write_atomic(self.manifests_path / f'{run_path.name}.json', json.dumps(manifest, indent=2).encode())
+
+        return manifest
+
+
+    def manifests(self, term_id=None):
+        """
+        Every snapshot manifest, newest first, optionally only those of one term.
+        """
+        if not self.manifests_path.is_dir():
+            return []
+
+        manifests = []
+        for manifest_path in sorted(self.manifests_path.glob("*.json"), reverse=True):
+            with open(manifest_path) as manifest_file:
+                manifest = json.load(manifest_file)
+            if term_id is None or manifest["term"] == term_id:
+                manifests.append(manifest)
+
+        return manifests
+
+
+    def previous(self, artifact, term_id, before=None):
+        """
+        Path of the newest snapshotted copy of artifact for term_id, or None.
+
+        artifact is a path relative to the run directory, for example
+        "provisioning_report_clean/enrollments.csv". With before set, only
+        runs whose names sort ahead of it are considered, so a running sync
+        can ask for the copy from the run before it. Compressed copies end in .gz and can be
+        read straight into pandas; cleaned csv datasets lack their load_date column.
+        """
+        for manifest in self.manifests(term_id):
+            if before is not None and manifest["run"] >= before:
+                continue
+            entry = manifest["artifacts"].get(artifact)
+            if entry is not None:
+                return self._object_path(entry["hash"], entry["compressed"])
+
+        return None
+
+
+    def restore(self, run_name, target_path):
+        """
+        Rebuild the run directory of a snapshot in target_path.
+        """
+        with open(self.manifests_path / f'{run_name}.json') as manifest_file:
+            manifest = json.load(manifest_file)
+
+        target_path = Path(target_path)
+        for artifact, entry in manifest["artifacts"].items():
+            file_path = target_path / artifact
+            file_path.parent.mkdir(parents=True, exist_ok=True)
+            object_path = self._object_path(entry["hash"], entry["compressed"])
+            if "load_date" in entry:
+                self._add_load_date(object_path, file_path, entry["load_date"])
+                continue
+            opener = gzip.open if entry["compressed"] else open
+            with opener(object_path, 'rb') as source, open(file_path, 'wb') as target:
+                shutil.copyfileobj(source, target)
+
+        return target_path
+
+
+    def apply_retention(self, data_root=Path("data")):
+        """
+        Drop expired snapshots, their unreferenced objects and old raw run directories.
+
+        Every term keeps its newest keep snapshots, and with max_age_days
+        set none older than that. Run directories in data_root that are
+        snapshotted are deleted past the newest keep_runs of their term
+        (0 keeps them all), except runs whose checkpoint does not show
+        their imports finished, which resume still needs. Returns the
+        number of snapshots removed.
+        """
+        removed = 0
+        oldest = datetime.datetime.now() - datetime.timedelta(days=self.max_age_days)
+
+        with self._locked():
+            by_term = {}
+            for manifest in self.manifests():
+                by_term.setdefault(manifest["term"], []).append(manifest)
+
+            for term_manifests in by_term.values():
+                for index, manifest in enumerate(term_manifests):
+                    run_path = Path(data_root) / manifest["run"]
+                    if self.keep_runs and index >= self.keep_runs and self._finished(run_path):
+                        shutil.rmtree(run_path)
+
+                    expired = self.max_age_days and datetime.datetime.fromisoformat(manifest["created"]) < oldest
+                    if index >= self.keep or expired:
+                        (self.manifests_path / f'{manifest["run"]}.json').unlink()
+                        removed += 1
+
+            self._collect_garbage()
+
+        return removed
+
+
+    @contextmanager
+    def _locked(self):
+        """
+        Hold the store's lock file. A lock older than lock_timeout seconds was left behind and is taken over.
+        """
+        lock_path = self.root / "store.lock"
+        self.root.mkdir(parents=True, exist_ok=True)
+
+        while True:
+            try:
+                os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - lock_path.stat().st_mtime > self.lock_timeout:
+                        lock_path.unlink()
+                        continue
+                except FileNotFoundError:
+                    continue
+                time.sleep(0.1)
+
+        try:
+            yield
+        finally:
+            lock_path.unlink()
+
+
+    def _finished(self, run_path):
+        try:
+            with open(run_path / "checkpoint.json") as checkpoint_file:
+                return "upload_updates" in json.load(checkpoint_file)["stages"]
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            return False
+
+
+    def _collect_garbage(self):
+        referenced = set()
+        for manifest in self.manifests():
+            referenced.update(entry["hash"] for entry in manifest["artifacts"].values())
+
+        if not self.objects_path.is_dir():
+            return
+
+        for object_path in self.objects_path.glob("*/*"):
+            if object_path.suffix != ".tmp" and object_path.name.split(".")[0] not in referenced:
+                object_path.unlink()
+
+
+    def _store_artifact(self, file_path, artifact):
+        if not (artifact.startswith("provisioning_report_clean/") and file_path.suffix == ".csv"):
+            return self._store_object(file_path)
+
+        temp_path = self.root / f'normalized.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            load_date = self._strip_load_date(file_path, temp_path)
+            if load_date is None:
+                return self._store_object(file_path)
+            entry = self._store_object(temp_path)
+        finally:
+            temp_path.unlink(missing_ok=True)
+
+        entry.update(size=file_path.stat().st_size, load_date=load_date)
+        return entry
+
+
+    def _strip_load_date(self, file_path, target_path):
+        """
+        Copy a cleaned csv to target_path without its load_date column.
+
+        Returns the load_date, or None if the file does not end with a
+        load_date column holding a single date.
+        """
+        line_terminator = self._line_terminator(file_path, open)
+        load_dates = set()
+
+        with open(file_path, newline='') as source, open(target_path, 'w', newline='') as target:
+            reader = csv.reader(source)
+            writer = csv.writer(target, lineterminator=line_terminator)
+            header = next(reader, None)
+            if header is None or len(header) < 2 or header[-1] != "load_date":
+                return None
+
+            writer.writerow(header[:-1])
+            for row in reader:
+                load_dates.add(row[-1])
+                writer.writerow(row[:-1])
+
+        if len(load_dates) > 1:
+            return None
+        return load_dates.pop() if load_dates else ""
+
+
+    def _add_load_date(self, object_path, file_path, load_date):
+        line_terminator = self._line_terminator(object_path, gzip.open)
+
+        with gzip.open(object_path, 'rt', newline='') as source, open(file_path, 'w', newline='') as target:
+            reader = csv.reader(source)
+            writer = csv.writer(target, lineterminator=line_terminator)
+            writer.writerow(next(reader) + ["load_date"])
+            for row in reader:
+                writer.writerow(row + [load_date])
+
+
+    def _line_terminator(self, file_path, opener):
+        with opener(file_path, 'rt', newline='') as source:
+            return "\r\n" if source.readline().endswith("\r\n") else "\n"
+
+
+    def _store_object(self, file_path, chunk_size=1024 * 1024):
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as source:
+            for chunk in iter(lambda: source.read(chunk_size), b""):
+                digest.update(chunk)
+
+        content_hash = digest.hexdigest()
+        compressed = file_path.suffix not in self.precompressed_suffixes
+        object_path = self._object_path(content_hash, compressed)
+
+        if not object_path.exists():
+            object_path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = object_path.with_name(f'{object_path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+            opener = gzip.open if compressed else open
+            with open(file_path, 'rb') as source, opener(temp_path, 'wb') as target:
+                shutil.copyfileobj(source, target, chunk_size)
+            os.replace(temp_path, object_path)
+
+        return {"hash": content_hash, "size": file_path.stat().st_size, "compressed": compressed}
+
+
+    def _object_path(self, content_hash, compressed):
+        return self.objects_path / content_hash[:2] / (f'{content_hash}.gz' if compressed else content_hash)
+
+
+    def _write_atomic(self, file_path, content):
+        temp_path = file_path.with_name(f'{file_path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        with open(temp_path, 'wb') as temp_file:
+            temp_file.write(content)
+        os.replace(temp_path, file_path)
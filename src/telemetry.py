@@ -0,0 +1,93 @@
+import os
+import re
+import json
+import time
+import threading
+
+from contextlib import contextmanager
+
+
+class Telemetry:
+    """
+    Collect timings and counters for the stages of a run.
+
+    Every metric is a name, a value and a set of labels. Metrics can be
+    saved as JSON next to the run's data or exported in the Prometheus
+    textfile format.
+    """
+
+    def __init__(self, labels=None):
+        self.labels = labels if labels is not None else {}
+        self.metrics = []
+        self._lock = threading.Lock()
+
+
+    @contextmanager
+    def stage(self, name, **labels):
+        """
+        Time the enclosed block as <name>_seconds.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(f'{name}_seconds', time.perf_counter() - start, **labels)
+
+
+    def record(self, name, value, **labels):
+        """
+        Record one metric value.
+        """
+        with self._lock:
+            self.metrics.append({"name": name, "value": value, "labels": {**self.labels, **labels},
+                                 "timestamp": time.time()})
+
+
+    def save(self, data_path, file_name="metrics.json"):
+        """
+        Write every metric to a JSON file in data_path.
+        """
+        data_path.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            metrics = list(self.metrics)
+
+        with open(data_path / file_name, 'w') as metrics_file:
+            json.dump(metrics, metrics_file, indent=2)
+
+        return data_path / file_name
+
+
+    def write_prometheus(self, file_path, prefix="lms_erp_sync"):
+        """
+        Export the latest value of every metric in the Prometheus textfile format.
+
+        The file is written next to its destination and renamed into place
+        so a collector never reads it half written.
+        """
+        latest = {}
+        with self._lock:
+            for metric in self.metrics:
+                labels = tuple(sorted(metric["labels"].items()))
+                latest[(metric["name"], labels)] = metric["value"]
+
+        lines = []
+        for name in sorted({name for name, _ in latest}):
+            metric_name = f'{prefix}_{re.sub(r"[^a-zA-Z0-9_]", "_", name)}'
+            lines.append(f'# TYPE {metric_name} gauge')
+            for (series_name, labels), value in latest.items():
+                if series_name != name:
+                    continue
+                label_text = ",".join(f'{key}="{self._escape(value)}"' for key, value in labels)
+                lines.append(f'{metric_name}{{{label_text}}} {float(value)}')
+
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = file_path.with_name(f'.{file_path.name}.tmp')
+        with open(temp_path, 'w') as prometheus_file:
+            prometheus_file.write("\n".join(lines) + "\n")
+        os.replace(temp_path, file_path)
+
+        return file_path
+
+
+    def _escape(self, value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
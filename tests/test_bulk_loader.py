@@ -0,0 +1,159 @@
+from src.bulk_loader import BulkLoader, PandasBulkLoader
+from pathlib import Path
+from unittest import mock
+
+import sqlalchemy as db
+import pandas as pd
+
+import tempfile
+import unittest
+
+class TestBulkLoader(unittest.TestCase):
+    """
+    Test the staging-table bulk loader against a file-backed SQLite database.
+    """
+    def setUp(self):
+        """
+        Create a mirror table holding rows from a previous load.
+        """
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.engine = db.create_engine(f"sqlite:///{Path(self.temp_dir.name) / 'sis.db'}")
+
+        with self.engine.begin() as conn:
+            conn.execute(db.text("CREATE TABLE rpc_RE_Canvas_Users (id_num INTEGER, canvas_user INTEGER, "
+                                 "login_id TEXT, load_date TEXT)"))
+            conn.execute(db.text("CREATE INDEX ix_mirror_users ON rpc_RE_Canvas_Users (id_num)"))
+            conn.execute(db.text("INSERT INTO rpc_RE_Canvas_Users VALUES (1, 10, 'old', '2021-01-01')"))
+
+        self.users = pd.DataFrame({"id_num": pd.array([1001, 1002, 1003], dtype="Int64"),
+                                   "canvas_user": pd.array([1, None, 3], dtype="Int64"),
+                                   "login_id": ["jdoe", "asmith", "bjones"],
+                                   "load_date": ["2021-10-11"] * 3})
+
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.temp_dir.cleanup()
+
+
+    def test_load_replaces_table(self):
+        """
+        Test that loading replaces the old rows, keeps the target's index and leaves no staging table behind.
+        """
+        for loader_class in [BulkLoader, PandasBulkLoader]:
+            for swap in [True, False]:
+                stats = loader_class(self.engine, batch_size=2, swap=swap).load(self.users, "rpc_RE_Canvas_Users")
+
+                actual = pd.read_sql("SELECT * FROM rpc_RE_Canvas_Users ORDER BY id_num", self.engine)
+                tables = db.inspect(self.engine).get_table_names()
+
+                self.assertEqual(list(actual["id_num"]), [1001, 1002, 1003])
+                self.assertTrue(pd.isna(actual["canvas_user"][1]))
+                indexes = db.inspect(self.engine).get_indexes("rpc_RE_Canvas_Users")
+
+                self.assertEqual(tables, ["rpc_RE_Canvas_Users"])
+                self.assertEqual([index["name"] for index in indexes], ["ix_mirror_users"])
+                self.assertEqual(stats["rows"], 3)
+            self.assertGreater(stats["rows_per_second"], 0)
+
+
+    def test_switch_on_sql_server(self):
+        """
+        Test that swap on SQL Server switches a staging table shaped like the target into the emptied target.
+        """
+        engine = mock.MagicMock()
+        engine.dialect.name = "mssql"
+        conn = engine.begin.return_value.__enter__.return_value
+        loader = BulkLoader(engine, swap=True)
+
+        with mock.patch.object(loader, "_create_switch_table") as create_switch_table, \
+                mock.patch.object(loader, "_insert"), mock.patch.object(loader, "_drop_table"):
+            loader.load(self.users, "rpc_RE_Canvas_Users")
+
+        staging_table = create_switch_table.call_args.args[2]
+        statements = [str(call.args[0]) for call in conn.execute.call_args_list]
+        self.assertEqual(statements, ["TRUNCATE TABLE rpc_RE_Canvas_Users",
+                                      f"ALTER TABLE {staging_table} SWITCH TO rpc_RE_Canvas_Users"])
+
+
+    def test_switch_table_copies_keys_and_indexes(self):
+        """
+        Test that the staging table for a switch gets the target's columns, primary key and indexes.
+        """
+        with self.engine.begin() as conn:
+            conn.execute(db.text("CREATE TABLE rpc_RE_Canvas_Courses (canvas_course_id INTEGER NOT NULL, "
+                                 "crs_cde TEXT, PRIMARY KEY (canvas_course_id))"))
+            conn.execute(db.text("CREATE UNIQUE INDEX ix_mirror_courses ON rpc_RE_Canvas_Courses (crs_cde)"))
+            BulkLoader(self.engine)._create_switch_table(conn, "rpc_RE_Canvas_Courses", "courses_staging")
+
+        inspector = db.inspect(self.engine)
+        self.assertEqual([column["name"] for column in inspector.get_columns("courses_staging")],
+                         ["canvas_course_id", "crs_cde"])
+        self.assertEqual(inspector.get_pk_constraint("courses_staging")["constrained_columns"], ["canvas_course_id"])
+        self.assertEqual([(index["column_names"], index["unique"]) for index in inspector.get_indexes("courses_staging")],
+                         [(["crs_cde"], True)])
+
+
+    def test_staging_tables_are_per_load(self):
+        """
+        Test that a load does not touch the staging table of another load in progress.
+        """
+        with self.engine.begin() as conn:
+            conn.execute(db.text("CREATE TABLE rpc_RE_Canvas_Users_staging (id_num INTEGER)"))
+
+        BulkLoader(self.engine).load(self.users, "rpc_RE_Canvas_Users")
+
+        self.assertIn("rpc_RE_Canvas_Users_staging", db.inspect(self.engine).get_table_names())
+
+
+    def test_apply_delta_writes_changes(self):
+        """
+        Test that a delta load inserts, updates and deletes only the changed rows.
+        """
+        loader = BulkLoader(self.engine, batch_size=2, state_path=Path(self.temp_dir.name) / "mirror_state")
+        loader.apply_delta(self.users, "rpc_RE_Canvas_Users", ["id_num"])
+
+        users = self.users.copy()
+        users.loc[1, "login_id"] = "asmith2"
+        users = users[users["id_num"] != 1003]
+        users = pd.concat([users, pd.DataFrame({"id_num": pd.array([1004], dtype="Int64"),
+                                                "canvas_user": pd.array([4], dtype="Int64"),
+                                                "login_id": ["new"], "load_date": ["2021-10-12"]})])
+        users["load_date"] = "2021-10-12"
+
+        with self.engine.begin() as conn:
+            conn.execute(db.text("CREATE TABLE rpc_RE_Canvas_Users_staging (id_num INTEGER)"))
+        stats = loader.apply_delta(users, "rpc_RE_Canvas_Users", ["id_num"])
+
+        actual = pd.read_sql("SELECT * FROM rpc_RE_Canvas_Users ORDER BY id_num", self.engine)
+        tables = db.inspect(self.engine).get_table_names()
+
+        self.assertEqual((stats["inserted"], stats["updated"], stats["deleted"]), (1, 1, 1))
+        self.assertEqual(list(actual["id_num"]), [1001, 1002, 1004])
+        self.assertEqual(list(actual["login_id"]), ["jdoe", "asmith2", "new"])
+        self.assertEqual(actual["load_date"][0], "2021-10-11")
+        self.assertEqual(tables, ["rpc_RE_Canvas_Users", "rpc_RE_Canvas_Users_staging"])
+
+
+    def test_apply_delta_uses_saved_state(self):
+        """
+        Test that a delta load diffs against the last loaded dataset and loads in full without one.
+        """
+        state_path = Path(self.temp_dir.name) / "mirror_state"
+        loader = BulkLoader(self.engine, state_path=state_path)
+
+        stats = loader.apply_delta(self.users, "rpc_RE_Canvas_Users", ["id_num"])
+        self.assertNotIn("inserted", stats)
+        self.assertTrue((state_path / "rpc_RE_Canvas_Users.pkl.gz").is_file())
+
+        with self.engine.begin() as conn:
+            conn.execute(db.text("UPDATE rpc_RE_Canvas_Users SET login_id = 'edited'"))
+        stats = loader.apply_delta(self.users, "rpc_RE_Canvas_Users", ["id_num"])
+        self.assertEqual((stats["inserted"], stats["updated"], stats["deleted"]), (0, 0, 0))
+
+        with self.engine.begin() as conn:
+            conn.execute(db.text("DELETE FROM rpc_RE_Canvas_Users WHERE id_num = 1003"))
+        loader.apply_delta(self.users, "rpc_RE_Canvas_Users", ["id_num"])
+
+        actual = pd.read_sql("SELECT * FROM rpc_RE_Canvas_Users ORDER BY id_num", self.engine)
+        self.assertEqual(list(actual["login_id"]), ["jdoe", "asmith", "bjones"])
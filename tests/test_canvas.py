@@ -0,0 +1,421 @@
+from src.canvas import Canvas
+from canvasapi.exceptions import CanvasException
+from src.cache import JsonCache
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+import requests
+import datetime
+import tempfile
+import threading
+import time
+import unittest
+import zipfile
+
+class TestUploadScheduler(unittest.TestCase):
+    """
+    Test the SIS import scheduler without a Canvas connection.
+    """
+    def setUp(self):
+        """
+        Setup a Canvas instance whose uploads are recorded instead of sent.
+        """
+        self.canvas = Canvas.__new__(Canvas)
+        self.started = []
+        self.finished = []
+        self.lock = threading.Lock()
+
+        def fake_deliver(dataset_path, rest_threshold):
+            with self.lock:
+                self.started.append(dataset_path.name)
+            time.sleep(0.01)
+            with self.lock:
+                self.finished.append(dataset_path.name)
+            return dataset_path.name
+
+        self.canvas._deliver = fake_deliver
+
+
+    def test_reports_keep_upload_order(self):
+        """
+        Test that reports are returned in upload_order regardless of completion order.
+        """
+        reports = self.canvas.upload_all_updates(Path("data"), max_workers=4)
+
+        self.assertEqual(list(reports), Canvas.upload_order)
+        for dataset_name, report in reports.items():
+            self.assertEqual(report, dataset_name)
+
+
+    def test_dependencies_finish_first(self):
+        """
+        Test that no import starts before the imports it depends on have finished.
+        """
+        self.canvas.upload_all_updates(Path("data"), max_workers=4)
+
+        for dataset_name, dependencies in Canvas.upload_dependencies.items():
+            for dependency in dependencies:
+                self.assertLess(self.finished.index(dependency), self.started.index(dataset_name))
+
+
+    def test_circular_dependencies_raise(self):
+        """
+        Test that a dependency cycle is reported instead of hanging.
+        """
+        self.canvas.upload_dependencies = {**Canvas.upload_dependencies,
+                                           "courses.csv": ["sections.csv"]}
+
+        with self.assertRaises(ValueError):
+            self.canvas.upload_all_updates(Path("data"), max_workers=2)
+
+
+class TestTermIndex(unittest.TestCase):
+    """
+    Test the cached Jenzabar to Canvas term index.
+    """
+    def setUp(self):
+        """
+        Setup a Canvas instance with a fake account and a temporary term cache.
+        """
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.canvas = Canvas.__new__(Canvas)
+        self.canvas.term_cache = JsonCache(Path(self.temp_dir.name) / "term_cache.json")
+        self.canvas.canvas_admin = mock.Mock()
+        self.canvas.canvas_admin.get_enrollment_terms.return_value = [
+            SimpleNamespace(id=42, sis_term_id="211S"), SimpleNamespace(id=43, sis_term_id="212S")]
+
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+
+    def test_terms_fetched_once(self):
+        """
+        Test that known terms are served from the index without another API walk.
+        """
+        self.assertEqual(self.canvas.convert_term_id("211S"), 42)
+        self.assertEqual(self.canvas.convert_term_id("212S"), 43)
+
+        self.assertEqual(self.canvas.canvas_admin.get_enrollment_terms.call_count, 1)
+
+
+    def test_unknown_term_refreshes_index(self):
+        """
+        Test that a term missing from the index triggers a rebuild.
+        """
+        self.canvas.convert_term_id("211S")
+
+        self.assertIsNone(self.canvas.convert_term_id("221S"))
+        self.assertEqual(self.canvas.canvas_admin.get_enrollment_terms.call_count, 2)
+
+
+class TestReportReuse(unittest.TestCase):
+    """
+    Test reusing recent provisioning reports through the report cache.
+    """
+    def setUp(self):
+        """
+        Setup a Canvas instance whose new reports get increasing ids and whose stored reports are complete.
+        """
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.canvas = Canvas.__new__(Canvas)
+        self.canvas.account_id = 1
+        self.canvas.report_cache = JsonCache(Path(self.temp_dir.name) / "report_cache.json")
+        self.canvas.create_provisioning_report = mock.Mock(
+            side_effect=[SimpleNamespace(id=report_id) for report_id in range(1, 10)])
+        self.canvas.canvas_admin = mock.Mock()
+        self.canvas.canvas_admin.get_report.side_effect = lambda report_type, report_id: SimpleNamespace(
+            id=report_id, status="complete", attachment={"url": f'https://canvas.test/{report_id}'})
+
+        self.datasets = {"users": True, "courses": True}
+
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+
+    def test_report_reused_within_max_age(self):
+        """
+        Test that a report requested within max_age minutes is fetched again instead of created.
+        """
+        first = self.canvas.get_provisioning_report(self.datasets, 42, max_age=60)
+        second = self.canvas.get_provisioning_report(self.datasets, 42, max_age=60)
+
+        self.assertEqual((first.id, second.id), (1, 1))
+        self.assertEqual(self.canvas.create_provisioning_report.call_count, 1)
+        self.canvas.canvas_admin.get_report.assert_called_once_with("provisioning_csv", 1)
+
+
+    def test_expired_report_is_replaced(self):
+        """
+        Test that a report older than max_age is not reused and the new one takes its place.
+        """
+        self.canvas.get_provisioning_report(self.datasets, 42, max_age=60)
+        cache_key = self.canvas._report_cache_key(self.datasets, 42)
+        self.canvas.report_cache.set(cache_key, 1, saved_at=datetime.datetime.now() - datetime.timedelta(minutes=61))
+
+        report = self.canvas.get_provisioning_report(self.datasets, 42, max_age=60)
+
+        self.assertEqual(report.id, 2)
+        self.canvas.canvas_admin.get_report.assert_not_called()
+        self.assertEqual(self.canvas.report_cache.get(cache_key, datetime.timedelta(minutes=60)), 2)
+
+
+    def test_zero_max_age_disables_reuse(self):
+        """
+        Test that a max_age of 0 creates a new report even when a fresh one is cached.
+        """
+        self.canvas.get_provisioning_report(self.datasets, 42, max_age=60)
+
+        report = self.canvas.get_provisioning_report(self.datasets, 42, max_age=0)
+
+        self.assertEqual(report.id, 2)
+        self.canvas.canvas_admin.get_report.assert_not_called()
+
+
+class TestBundledUpload(unittest.TestCase):
+    """
+    Test the single-archive SIS import without a Canvas connection.
+    """
+    def setUp(self):
+        """
+        Write update files where only courses and enrollments have rows.
+        """
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.data_path = Path(self.temp_dir.name)
+        (self.data_path / "updates").mkdir()
+
+        for file_name in Canvas.upload_order:
+            rows = "course_id,status\n"
+            if file_name in ["courses.csv", "enrollments.csv"]:
+                rows += "MATH 101,active\n"
+            (self.data_path / "updates" / file_name).write_text(rows)
+
+        self.canvas = Canvas.__new__(Canvas)
+        self.canvas._upload = mock.Mock(return_value=SimpleNamespace(
+            id=7, data={"statistics": {"Course": {"created": 1}, "Enrollment": {"created": 1}}},
+            processing_warnings=[["enrollments.csv", "user not found"], ["courses.csv", "term missing"]]))
+
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+
+    def test_bundle_holds_non_empty_files(self):
+        """
+        Test that one import is sent with only the files that have rows.
+        """
+        self.canvas.upload_all_updates(self.data_path, upload_mode="bundled")
+
+        bundle_path = self.canvas._upload.call_args[0][0]
+        with zipfile.ZipFile(bundle_path) as bundle:
+            self.assertEqual(bundle.namelist(), ["courses.csv", "enrollments.csv"])
+        self.assertEqual(self.canvas._upload.call_count, 1)
+
+
+    def test_results_split_per_file(self):
+        """
+        Test that statistics and warnings are split back to each file.
+        """
+        reports = self.canvas.upload_all_updates(self.data_path, upload_mode="bundled")
+
+        self.assertEqual(list(reports), Canvas.upload_order)
+        self.assertEqual(reports["courses.csv"].data["statistics"]["Course"], {"created": 1})
+        self.assertEqual(reports["enrollments.csv"].processing_warnings, [["enrollments.csv", "user not found"]])
+        self.assertEqual(reports["sections.csv"].data["statistics"]["CourseSection"], {})
+
+        self.canvas.save_report(reports, self.data_path)
+        self.assertTrue((self.data_path / "report.txt").is_file())
+
+
+class TestDeltaTransport(unittest.TestCase):
+    """
+    Test the choice between direct API calls and SIS import for each update file.
+    """
+    def setUp(self):
+        """
+        Write an enrollments update file with one new and one dropped enrollment.
+        """
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.file_path = Path(self.temp_dir.name) / "enrollments.csv"
+        self.file_path.write_text("course_id,user_id,role,section_id,status\n"
+                                  "MATH 101,1001,student,MATH 101 01,active\n"
+                                  "MATH 101,1002,student,MATH 101 01,deleted\n")
+
+        self.canvas = Canvas.__new__(Canvas)
+        self.canvas._upload = mock.Mock(return_value=SimpleNamespace(id=7, data={"statistics": {}}))
+        self.canvas._rest_row = mock.Mock(side_effect=["created", CanvasException("not found")])
+
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+
+    def test_small_delta_uses_rest(self):
+        """
+        Test that a file under the threshold is applied row by row with a SIS import shaped result.
+        """
+        result = self.canvas._deliver(self.file_path, rest_threshold=5)
+
+        self.canvas._upload.assert_not_called()
+        self.assertEqual(result.transport, "rest")
+        self.assertEqual(result.data["statistics"]["Enrollment"], {"created": 1, "deleted": 0})
+        self.assertEqual(len(result.processing_errors), 1)
+        self.assertEqual(result.processing_errors[0][0], "enrollments.csv")
+
+
+    def test_large_delta_uses_sis_import(self):
+        """
+        Test that a file over the threshold, or with the threshold disabled, goes through SIS import.
+        """
+        for rest_threshold in [1, 0]:
+            result = self.canvas._deliver(self.file_path, rest_threshold)
+            self.assertEqual(result.transport, "sis_import")
+            self.assertEqual(result.id, 7)
+
+        self.assertEqual(self.canvas._upload.call_count, 2)
+        self.canvas._rest_row.assert_not_called()
+
+
+    def test_missing_columns_use_sis_import(self):
+        """
+        Test that a file without a column the direct API calls need goes through SIS import.
+        """
+        self.file_path.write_text("course_id,user_id,section_id,status\n"
+                                  "MATH 101,1001,MATH 101 01,active\n")
+
+        result = self.canvas._deliver(self.file_path, rest_threshold=5)
+
+        self.assertEqual(result.transport, "sis_import")
+        self.canvas._rest_row.assert_not_called()
+
+
+    def test_failed_calls_are_recorded(self):
+        """
+        Test that a connection error on one row is recorded without stopping the upload.
+        """
+        self.canvas._rest_row = mock.Mock(side_effect=[requests.ConnectionError("reset"), "deleted"])
+
+        result = self.canvas._deliver(self.file_path, rest_threshold=5)
+
+        self.assertEqual(result.data["statistics"]["Enrollment"], {"created": 0, "deleted": 1})
+        self.assertIn("reset", result.processing_errors[0][1])
+
+
+    def test_empty_values_use_sis_import(self):
+        """
+        Test that rows are sent through the API calls, but a file with a blank key cell goes through SIS import.
+        """
+        del self.canvas._rest_row
+        self.canvas.canvas_admin = mock.Mock()
+
+        with mock.patch("src.canvas.Section.enroll_user") as enroll_user, \
+                mock.patch("src.canvas.Section.get_enrollments", return_value=[]):
+            result = self.canvas._deliver(self.file_path, rest_threshold=5)
+            self.assertEqual(result.transport, "rest")
+            self.assertEqual(enroll_user.call_args.args[0].id, "sis_user_id:1001")
+            self.assertEqual(enroll_user.call_args.kwargs["enrollment"]["type"], "StudentEnrollment")
+
+            self.file_path.write_text("course_id,user_id,role,section_id,status\n"
+                                      "MATH 101,1001,student,,active\n")
+            result = self.canvas._deliver(self.file_path, rest_threshold=5)
+
+        self.assertEqual(result.transport, "sis_import")
+        self.assertEqual(enroll_user.call_count, 1)
+
+
+class TestDatasetReports(unittest.TestCase):
+    """
+    Test requesting one provisioning report per dataset.
+    """
+    def setUp(self):
+        """
+        Setup a Canvas instance whose reports are written locally, enrollments being the slowest.
+        """
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.data_path = Path(self.temp_dir.name)
+        self.canvas = Canvas.__new__(Canvas)
+        self.canvas.get_provisioning_report = mock.Mock(
+            side_effect=lambda datasets, term_id, max_age: SimpleNamespace(dataset=list(datasets)[0]))
+
+        def fake_download(report, data_path, dataset_name=None):
+            if report.dataset == "enrollments":
+                time.sleep(0.05)
+            data_path.mkdir(parents=True)
+            with zipfile.ZipFile(data_path / "provisioning_report.zip", 'w') as report_zip:
+                report_zip.writestr(f'{report.dataset}.csv', f'{report.dataset}_id\n1\n')
+            return data_path / "provisioning_report.zip"
+
+        self.canvas.download_report = fake_download
+
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+
+    def test_reports_are_merged(self):
+        """
+        Test that every dataset gets its own report and they end up in one archive.
+        """
+        datasets = {"users": True, "courses": True, "enrollments": True}
+        report_path, seconds = self.canvas.download_reports(datasets, 42, self.data_path)
+
+        requested = [call.args[0] for call in self.canvas.get_provisioning_report.call_args_list]
+        self.assertCountEqual(requested, [{"users": True}, {"courses": True}, {"enrollments": True}])
+        with zipfile.ZipFile(report_path) as report_zip:
+            self.assertCountEqual(report_zip.namelist(), ["users.csv", "courses.csv", "enrollments.csv"])
+            self.assertEqual(report_zip.read("users.csv"), b"users_id\n1\n")
+        self.assertLess(seconds["users"], seconds["enrollments"])
+        self.assertFalse((self.data_path / "reports").exists())
+
+
+class TestDownloadReport(unittest.TestCase):
+    """
+    Test packing the plain CSV Canvas sends for single-dataset reports.
+    """
+    def setUp(self):
+        """
+        Setup a Canvas instance and a download that answers with a plain CSV.
+        """
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.data_path = Path(self.temp_dir.name)
+        self.canvas = Canvas.__new__(Canvas)
+
+        response = mock.MagicMock()
+        response.__enter__.return_value.iter_content.return_value = [b"user_id\n", b"1001\n"]
+        self.get = mock.patch("src.canvas.requests.get", return_value=response)
+        self.get.start()
+
+
+    def tearDown(self):
+        self.get.stop()
+        self.temp_dir.cleanup()
+
+
+    def test_csv_is_packed_under_dataset_name(self):
+        """
+        Test that the CSV is named after the given dataset or the one dataset the parameters request.
+        """
+        report = SimpleNamespace(id=7, attachment={"url": "https://canvas.test/report"}, parameters={})
+        report_path = self.canvas.download_report(report, self.data_path / "given", dataset_name="users")
+        with zipfile.ZipFile(report_path) as report_zip:
+            self.assertEqual(report_zip.read("users.csv"), b"user_id\n1001\n")
+
+        report.parameters = {"courses": True}
+        report_path = self.canvas.download_report(report, self.data_path / "requested")
+        with zipfile.ZipFile(report_path) as report_zip:
+            self.assertEqual(report_zip.namelist(), ["courses.csv"])
+
+
+    def test_unnamed_csv_raises(self):
+        """
+        Test that a CSV whose dataset cannot be told raises a descriptive error.
+        """
+        report = SimpleNamespace(id=7, attachment={"url": "https://canvas.test/report"}, parameters={})
+
+        with self.assertRaises(ValueError) as error:
+            self.canvas.download_report(report, self.data_path)
+
+        self.assertIn("parameters request 0 datasets", str(error.exception))
+        self.assertEqual(list(self.data_path.iterdir()), [])
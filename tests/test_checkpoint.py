@@ -0,0 +1,85 @@
+from src.integrator import Integrator
+from src.canvas import Canvas, ImportResult
+from src.rate_limit import RequestBudget
+from pathlib import Path
+from unittest import mock
+
+import tempfile
+import unittest
+
+class TestResume(unittest.TestCase):
+    """
+    Test that a failed run resumes from its first unfinished stage or import.
+    """
+    def setUp(self):
+        """
+        Build an Integrator on mocked clients whose enrollments import fails once.
+        """
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.data_path = Path(self.temp_dir.name) / "2021-01-10_06-00_211S"
+
+        self.jenzabar = mock.Mock()
+        self.jenzabar.upload_report_to_sql.return_value = {}
+        self.jenzabar.download_all_updates.return_value = {}
+
+        self.canvas = mock.Mock()
+        self.canvas.upload_order = Canvas.upload_order
+        self.canvas.budget = RequestBudget()
+        self.canvas.download_reports.side_effect = self.download_reports
+        self.canvas.clean_report.side_effect = self.clean_report
+        self.canvas.upload_all_updates.side_effect = self.upload_all_updates
+        self.uploaded = []
+        self.fail_on = "enrollments.csv"
+
+        self.integration = Integrator("current", update_mode="sql", jenzabar=self.jenzabar, canvas=self.canvas)
+        self.integration._term_id = {"jenzabar": "211S", "canvas": 42}
+        self.integration._data_path = self.data_path
+
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+
+    def download_reports(self, datasets, term_id, data_path, max_age):
+        data_path.mkdir(parents=True, exist_ok=True)
+        (data_path / "provisioning_report.zip").write_bytes(b"zip")
+        return data_path / "provisioning_report.zip", {dataset_name: 0.0 for dataset_name in datasets}
+
+
+    def clean_report(self, datasets, data_path, term_id):
+        (data_path / "provisioning_report_clean").mkdir()
+        return {}
+
+
+    def upload_all_updates(self, data_path, file_names=None, on_complete=None):
+        reports = {}
+        for file_name in file_names:
+            if file_name == self.fail_on:
+                raise RuntimeError("SIS import failed")
+            reports[file_name] = ImportResult({"statistics": {}}, id=len(self.uploaded) + 1)
+            self.uploaded.append(file_name)
+            on_complete(file_name, reports[file_name])
+        return reports
+
+
+    def test_resume_skips_finished_work(self):
+        """
+        Test that resuming reuses the report and reruns only the failed and later imports.
+        """
+        with self.assertRaises(RuntimeError):
+            self.integration.run()
+
+        self.fail_on = None
+        resumed = Integrator.resume(self.data_path, jenzabar=self.jenzabar, canvas=self.canvas)
+
+        self.assertEqual(self.canvas.download_reports.call_count, 1)
+        self.assertEqual(self.canvas.clean_report.call_count, 1)
+        self.assertEqual(self.jenzabar.download_all_updates.call_count, 1)
+        self.assertEqual(self.jenzabar.upload_report_to_sql.call_count, 1)
+        self.assertEqual(self.uploaded, Canvas.upload_order)
+        self.assertEqual(resumed.term_id["jenzabar"], "211S")
+
+        reports = self.canvas.save_report.call_args[0][0]
+        self.assertEqual(list(reports), Canvas.upload_order)
+        self.assertEqual([report.id for report in reports.values()], list(range(1, 8)))
+        self.assertTrue(resumed.checkpoint.is_done("upload_updates"))
@@ -0,0 +1,170 @@
+from src import cleaner
+from src.canvas import Canvas
+from pathlib import Path
+from unittest import mock
+
+import pandas as pd
+
+import importlib.util
+import tempfile
+import zipfile
+import unittest
+
+class TestCleaner(unittest.TestCase):
+    """
+    Test the chunked provisioning report cleaner on a small local archive.
+    """
+    def setUp(self):
+        """
+        Write a provisioning report archive with a few rows per dataset.
+        """
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.data_path = Path(self.temp_dir.name)
+        self.report_path = self.data_path / "provisioning_report.zip"
+
+        users = ("canvas_user_id,user_id,login_id,first_name,status\n"
+                 "1,1001,jdoe,John,active\n"
+                 "2,,sdemo+1,Demo,active\n"
+                 "3,CanvasStu1,student,Test,active\n"
+                 "4,1002,asmith,Ann,active\n")
+        enrollments = ("canvas_course_id,course_id,canvas_user_id,user_id,role,canvas_section_id,section_id,"
+                       "status,canvas_enrollment_id,created_by_sis\n"
+                       "10,MATH 101,1,1001,student,20,MATH 101 01,active,30,true\n"
+                       "10,MATH 101,4,1002,teacher,20,MATH 101 01,deleted,31,false\n"
+                       "11,ART 110,4,1002,student,21,ART 110 01,active,32,true\n")
+
+        with zipfile.ZipFile(self.report_path, 'w') as report_zip:
+            report_zip.writestr("users.csv", users)
+            report_zip.writestr("enrollments.csv", enrollments)
+
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+
+    def test_users_keep_numeric_ids(self):
+        """
+        Test that only users with numeric SIS ids are kept and renamed.
+        """
+        users = cleaner.read_dataset(self.report_path, "users", "211S", chunksize=2)
+
+        self.assertEqual(list(users), cleaner.output_columns("users"))
+        self.assertEqual(list(users["id_num"]), [1001, 1002])
+        self.assertEqual(str(users["id_num"].dtype), "Int64")
+
+
+    def test_enrollments_compact_dtypes(self):
+        """
+        Test that chunks are combined with categorical status and role columns.
+        """
+        enrollments = cleaner.read_dataset(self.report_path, "enrollments", "211S", chunksize=2)
+
+        self.assertEqual(len(enrollments), 3)
+        self.assertIsInstance(enrollments["status"].dtype, pd.CategoricalDtype)
+        self.assertIsInstance(enrollments["role"].dtype, pd.CategoricalDtype)
+        self.assertEqual(list(enrollments["created_by_sis"]), [-1, 0, -1])
+        self.assertEqual(list(enrollments["yr_cde"].unique()), ["21"])
+        self.assertEqual(list(enrollments["trm_cde"].unique()), ["1S"])
+
+
+    def test_clean_dataset_counts_rows(self):
+        """
+        Test that the cleaned frame carries its row counts.
+        """
+        users = cleaner.clean_dataset(self.report_path, "users", "211S", chunksize=1)
+
+        self.assertEqual(users.attrs["rows_in"], 4)
+        self.assertEqual(users.attrs["rows_out"], 2)
+
+
+    def test_csv_replay_keeps_dtypes(self):
+        """
+        Test that a dataset saved as csv reads back with its cleaned dtypes.
+        """
+        expected = cleaner.clean_dataset(self.report_path, "enrollments", "211S",
+                                         clean_path=self.data_path, clean_format="csv")
+
+        actual = cleaner.read_clean_dataset(self.data_path, "enrollments")
+
+        self.assertEqual(list(actual), list(expected))
+        self.assertIsInstance(actual["status"].dtype, pd.CategoricalDtype)
+        self.assertEqual(str(actual["canvas_enrollment_id"].dtype), "Int64")
+        self.assertEqual(list(actual["created_by_sis"]), [-1, 0, -1])
+
+
+    def test_chunks_hand_off_keeps_dtypes(self):
+        """
+        Test that pickled chunks load back whole with their cleaned dtypes and the csv copy matches them.
+        """
+        chunk_path = self.data_path / "chunks"
+        chunk_path.mkdir()
+
+        stats = cleaner.clean_dataset_chunks(self.report_path, "enrollments", "211S", chunk_path, chunksize=1,
+                                             csv_path=self.data_path)
+
+        actual = cleaner.read_dataset_chunks(chunk_path, "enrollments")
+        replayed = cleaner.read_clean_dataset(self.data_path, "enrollments")
+
+        self.assertEqual(stats, {"rows_in": 3, "rows_out": 3})
+        self.assertEqual(len(list(chunk_path.glob("enrollments.*.pkl"))), 3)
+        self.assertEqual(list(actual), cleaner.output_columns("enrollments"))
+        self.assertEqual(list(actual["canvas_enrollment_id"]), [30, 31, 32])
+        self.assertIsInstance(actual["status"].dtype, pd.CategoricalDtype)
+        self.assertEqual(str(actual["created_by_sis"].dtype), "Int8")
+        self.assertEqual(list(replayed["canvas_enrollment_id"]), [30, 31, 32])
+
+
+    def test_clean_report_hands_frames_to_parent(self):
+        """
+        Test that clean_report returns the workers' frames, keeps only the requested copy and no chunks.
+        """
+        canvas = Canvas.__new__(Canvas)
+        datasets = {"users": True, "enrollments": True}
+
+        cleaned = canvas.clean_report(datasets, self.data_path, "211S", max_workers=2, clean_format="none")
+
+        self.assertEqual(list(cleaned["users"]["id_num"]), [1001, 1002])
+        self.assertEqual(cleaned["users"].attrs, {"rows_in": 4, "rows_out": 2})
+        self.assertIsInstance(cleaned["enrollments"]["role"].dtype, pd.CategoricalDtype)
+        self.assertFalse((self.data_path / "provisioning_report_clean").exists())
+        self.assertFalse((self.data_path / "provisioning_report_clean.tmp").exists())
+
+        canvas.clean_report(datasets, self.data_path, "211S", max_workers=2, clean_format="csv")
+
+        self.assertEqual(sorted(path.name for path in (self.data_path / "provisioning_report_clean").iterdir()),
+                         ["enrollments.csv", "users.csv"])
+
+
+    @unittest.skipUnless(importlib.util.find_spec("pyarrow"), "parquet and feather need pyarrow")
+    def test_columnar_copies_keep_dtypes(self):
+        """
+        Test that parquet and feather copies read back with the cleaned dtypes.
+        """
+        canvas = Canvas.__new__(Canvas)
+
+        for clean_format in ["parquet", "feather"]:
+            clean_path = self.data_path / clean_format
+            clean_path.mkdir()
+            expected = canvas.clean_report({"enrollments": True}, self.data_path, "211S", max_workers=1,
+                                           clean_format=clean_format)["enrollments"]
+            (self.data_path / "provisioning_report_clean" / f'enrollments.{clean_format}').rename(
+                clean_path / f'enrollments.{clean_format}')
+
+            actual = cleaner.read_clean_dataset(clean_path, "enrollments")
+
+            self.assertEqual(list(actual["canvas_enrollment_id"]), list(expected["canvas_enrollment_id"]))
+            self.assertIsInstance(actual["status"].dtype, pd.CategoricalDtype)
+
+
+    def test_columnar_format_needs_pyarrow(self):
+        """
+        Test that asking for parquet without pyarrow fails before any cleaning, naming the package.
+        """
+        canvas = Canvas.__new__(Canvas)
+
+        with mock.patch("src.cleaner.importlib.util.find_spec", return_value=None):
+            with self.assertRaises(ImportError) as error:
+                canvas.clean_report({"users": True}, self.data_path, "211S", clean_format="parquet")
+
+        self.assertIn("pip install pyarrow", str(error.exception))
+        self.assertFalse((self.data_path / "provisioning_report_clean.tmp").exists())
@@ -0,0 +1,70 @@
+from src import cli
+
+from pathlib import Path
+from unittest import mock
+
+import io
+import sys
+import json
+import tempfile
+import subprocess
+import unittest
+
+class TestCli(unittest.TestCase):
+    """
+    Test the commands that must not connect to anything.
+    """
+    def setUp(self):
+        """
+        Point the CLI at a temporary data directory with one finished and one failed run.
+        """
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.data_root = Path(self.temp_dir.name)
+
+        finished = self.data_root / "2021-01-10_06-00_211S"
+        finished.mkdir()
+        (finished / "report.txt").write_text("")
+        metrics = [{"name": "clean_seconds", "value": 1.5, "labels": {"term": "211S"}},
+                   {"name": "update_query_seconds", "value": 9.0, "labels": {"term": "211S", "query": "q"}}]
+        (finished / "metrics.json").write_text(json.dumps(metrics))
+
+        failed = self.data_root / "2021-01-11_06-00_211S"
+        failed.mkdir()
+        (failed / "metrics.json").write_text("[]")
+
+        (self.data_root / "snapshots").mkdir()
+        (self.data_root / "mirror_state").mkdir()
+
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+
+    def test_status(self):
+        """
+        Test that status lists only run directories, newest first, with their state and stage times.
+        """
+        output = io.StringIO()
+        with mock.patch.object(cli, "data_root", self.data_root), mock.patch("sys.stdout", output):
+            self.assertEqual(cli.main(["status"]), 0)
+
+        lines = output.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn("2021-01-11_06-00_211S", lines[0])
+        self.assertIn("failed", lines[0])
+        self.assertIn("finished", lines[1])
+        self.assertIn("clean 1.5s", lines[1])
+        self.assertNotIn("update_query", lines[1])
+
+
+    def test_plan_stays_light(self):
+        """
+        Test that plan runs without importing the Integrator or its heavy dependencies.
+        """
+        script = ("import sys; from src.cli import main; main(['plan', '--update-mode', 'local']); "
+                  "print(sorted(name for name in ['src.integrator', 'pandas', 'sqlalchemy', 'canvasapi'] "
+                  "if name in sys.modules))")
+        result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True)
+
+        self.assertIn("prepare_report -> download_updates", result.stdout)
+        self.assertEqual(result.stdout.splitlines()[-1], "[]")
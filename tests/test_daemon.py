@@ -0,0 +1,136 @@
+from src.daemon import SyncDaemon
+from unittest import mock
+
+import contextlib
+import io
+import os
+import signal
+import threading
+import time
+import unittest
+
+class TestSyncDaemon(unittest.TestCase):
+    """
+    Test the scheduling of full and light sync cycles with short intervals.
+    """
+    def setUp(self):
+        """
+        Build a daemon on mocked clients whose syncs are recorded instead of run.
+        """
+        self.profiles = []
+        self.active = 0
+        self.max_active = 0
+        self.state_lock = threading.Lock()
+        self.release = threading.Event()
+        self.release.set()
+
+        def sync_terms(terms, jenzabar=None, canvas=None, profile=None):
+            with self.state_lock:
+                self.profiles.append(profile)
+                self.active += 1
+                self.max_active = max(self.max_active, self.active)
+            self.release.wait(timeout=5)
+            with self.state_lock:
+                self.active -= 1
+
+        self.sync_terms = mock.patch("src.daemon.Integrator.sync_terms", side_effect=sync_terms)
+        self.sync_terms.start()
+
+        self.daemon = SyncDaemon(terms=["current"], full_interval=1, enrollment_interval=1,
+                                 jenzabar=mock.Mock(), canvas=mock.Mock())
+
+
+    def tearDown(self):
+        self.release.set()
+        self.sync_terms.stop()
+
+
+    def serve(self, seconds):
+        server = threading.Thread(target=self.daemon.serve_forever)
+        server.start()
+        time.sleep(seconds)
+        self.daemon.stop()
+        server.join(timeout=5)
+        self.assertFalse(server.is_alive())
+
+
+    def test_run_cycle_skips_while_running(self):
+        """
+        Test that a cycle runs with its profile, is skipped while another holds the lock and survives errors.
+        """
+        self.assertTrue(self.daemon.run_cycle("enrollments"))
+        self.assertEqual(self.profiles, ["enrollments-only"])
+
+        with self.daemon._cycle_lock:
+            self.assertFalse(self.daemon.run_cycle("full"))
+        self.assertEqual(self.profiles, ["enrollments-only"])
+
+        with mock.patch("src.daemon.Integrator.sync_terms", side_effect=RuntimeError("boom")):
+            self.assertTrue(self.daemon.run_cycle("full"))
+        self.assertTrue(self.daemon.run_cycle("full"))
+
+
+    def test_full_sync_pushes_back_light_sync(self):
+        """
+        Test that the first cycle is a full sync and light syncs follow on their own, shorter interval.
+        """
+        self.daemon.intervals = {"full": 0.6, "enrollments": 0.15}
+
+        self.serve(1.0)
+
+        self.assertEqual(self.profiles[0], "full")
+        self.assertIn(self.profiles.count("full"), [2, 3])
+        self.assertGreaterEqual(self.profiles.count("enrollments-only"), 3)
+        self.assertEqual(self.max_active, 1)
+
+
+    def test_light_sync_skipped_during_full_sync(self):
+        """
+        Test that light syncs coming due while a full sync runs are skipped rather than queued.
+        """
+        self.daemon.intervals = {"full": 60, "enrollments": 0.05}
+        self.release.clear()
+        threading.Timer(0.6, self.release.set).start()
+
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.serve(0.4)
+
+        self.assertEqual(self.profiles, ["full"])
+        self.assertIn("Skipping enrollments sync", output.getvalue())
+
+
+    def test_stop_waits_for_running_cycle(self):
+        """
+        Test that serve_forever only returns once the cycle in progress has finished.
+        """
+        self.daemon.intervals = {"full": 60, "enrollments": 60}
+        self.release.clear()
+        server = threading.Thread(target=self.daemon.serve_forever)
+        server.start()
+        time.sleep(0.1)
+
+        self.daemon.stop()
+        server.join(timeout=0.3)
+        self.assertTrue(server.is_alive())
+
+        self.release.set()
+        server.join(timeout=5)
+        self.assertFalse(server.is_alive())
+        self.assertEqual(self.active, 0)
+
+
+    def test_sigterm_stops_daemon(self):
+        """
+        Test that SIGTERM asks the daemon to stop instead of killing it.
+        """
+        handlers = {signum: signal.getsignal(signum) for signum in [signal.SIGTERM, signal.SIGINT]}
+        try:
+            self.daemon.handle_signals()
+            os.kill(os.getpid(), signal.SIGTERM)
+            time.sleep(0.05)
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+
+        self.assertTrue(self.daemon._stop.is_set())
@@ -0,0 +1,59 @@
+from src import diff_engine
+
+import pandas as pd
+
+import unittest
+
+class TestDiffEngine(unittest.TestCase):
+    """
+    Test the local ERP to Canvas comparison.
+    """
+    def test_missing_users(self):
+        """
+        Test that only ERP users absent from Canvas are returned.
+        """
+        erp_users = pd.DataFrame({"user_id": pd.array([1001, 1002, 1003], dtype="Int64"),
+                                  "login_id": ["jdoe", "asmith", "bjones"],
+                                  "status": ["active", "active", "deleted"]})
+        canvas_users = pd.DataFrame({"id_num": pd.array([1001], dtype="Int64"),
+                                     "canvas_user": [1], "login_id": ["jdoe"]})
+
+        updates = diff_engine.find_updates(erp_users, canvas_users, {"user_id": "id_num"}, {})
+
+        self.assertEqual(list(updates["user_id"]), [1002])
+        self.assertEqual(list(updates), list(erp_users))
+
+
+    def test_enrollment_status_changes(self):
+        """
+        Test that enrollments are returned when missing or when their status differs.
+        """
+        erp_enrollments = pd.DataFrame({"course_id": ["MATH 101"] * 4,
+                                        "user_id": ["1001", "1002", "1003", "1004"],
+                                        "role": ["student"] * 4,
+                                        "section_id": ["MATH 101 01 "] * 4,
+                                        "status": ["active", "deleted", "active", "deleted"]})
+        canvas_enrollments = pd.DataFrame({"course_id": ["MATH 101"] * 3,
+                                           "user_id": ["1001", "1002", "1003"],
+                                           "role": pd.Categorical(["student"] * 3),
+                                           "section_id": ["MATH 101 01"] * 3,
+                                           "status": pd.Categorical(["active", "active", "deleted"])})
+        spec = diff_engine.update_specs["enrollments.csv"]
+
+        updates = diff_engine.find_updates(erp_enrollments, canvas_enrollments, spec["keys"], spec["compare"])
+
+        self.assertEqual(list(updates["user_id"]), ["1002", "1003"])
+
+
+    def test_extract_columns_are_checked(self):
+        """
+        Test that an ERP extract missing a contract column is reported by name.
+        """
+        erp_sections = pd.DataFrame({"section_id": ["MATH 101 01"], "course_id": ["MATH 101"]})
+        canvas_sections = pd.DataFrame({"section_id": ["MATH 101 01"]})
+
+        with self.assertRaises(ValueError) as error:
+            diff_engine.compute_updates({"sections.csv": erp_sections}, {"sections": canvas_sections},
+                                        ["sections.csv"])
+
+        self.assertIn("ErpSections.sql does not return name, status", str(error.exception))
@@ -0,0 +1,300 @@
+from src.integrator import Integrator
+from src.jenzabar import Jenzabar
+from src.canvas import Canvas, ImportResult
+from src.cache import JsonCache
+from src.rate_limit import RequestBudget
+from pathlib import Path
+from unittest import mock
+
+import pandas as pd
+
+import datetime
+import requests
+import tempfile
+import threading
+import time
+import unittest
+
+class TestShardedSync(unittest.TestCase):
+    """
+    Test splitting the provisioning reports of a run across sub-accounts.
+    """
+    def setUp(self):
+        """
+        Build an Integrator on mocked clients with two sub-accounts that both report user 1001.
+        """
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.data_path = Path(self.temp_dir.name) / "2021-01-10_06-00_211S"
+
+        self.jenzabar = mock.Mock()
+        self.jenzabar.mirror_keys = Jenzabar.mirror_keys
+
+        self.canvas = mock.Mock()
+        self.canvas.budget = RequestBudget()
+        self.canvas.sub_account.side_effect = self.sub_account
+        self.canvas.clean_report.side_effect = self.clean_report
+        self.sub_accounts = {}
+
+        self.shard_users = {"2": [1001, 1002], "3": [1001, 1003]}
+
+        self.integration = Integrator("current", update_mode="sql", jenzabar=self.jenzabar, canvas=self.canvas,
+                                      datasets=["users", "courses"], shards=[2, 3])
+        self.integration._term_id = {"jenzabar": "211S", "canvas": 42}
+        self.integration._data_path = self.data_path
+
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+
+    def sub_account(self, account_id):
+        def download_reports(datasets, term_id, data_path, max_age):
+            data_path.mkdir(parents=True, exist_ok=True)
+            (data_path / "provisioning_report.zip").write_bytes(b"zip")
+            return data_path / "provisioning_report.zip", {dataset_name: 0.0 for dataset_name in datasets}
+
+        self.sub_accounts[account_id] = mock.Mock()
+        self.sub_accounts[account_id].download_reports.side_effect = download_reports
+        return self.sub_accounts[account_id]
+
+
+    def clean_report(self, datasets, data_path, term_id, clean_format=None):
+        users = pd.DataFrame({"id_num": self.shard_users[data_path.name], "canvas_user": [1, 2],
+                              "login_id": ["a", "b"], "load_date": ["2021-01-10"] * 2})
+        courses = pd.DataFrame({"canvas_course_id": [int(data_path.name)], "crs_cde": [f'COURSE {data_path.name}'],
+                                "status": ["active"], "yr_cde": ["21"], "trm_cde": ["1S"],
+                                "load_date": ["2021-01-10"]})
+        return {"users": users, "courses": courses}
+
+
+    def test_shards_are_merged(self):
+        """
+        Test that every sub-account gets its own reports and their cleaned rows are merged once.
+        """
+        self.integration.prepare_report()
+
+        self.assertCountEqual(self.sub_accounts, [2, 3])
+        self.canvas.download_reports.assert_not_called()
+        self.assertEqual(sorted(self.integration.clean_datasets["users"]["id_num"]), [1001, 1002, 1003])
+        self.assertEqual(self.integration.clean_datasets["users"].attrs["rows_in"], 4)
+        self.assertEqual(list(self.integration.clean_datasets["courses"]["canvas_course_id"]), [2, 3])
+        self.assertTrue((self.data_path / "provisioning_report_clean" / "users.csv").is_file())
+        self.assertFalse((self.data_path / "shards").exists())
+        self.assertTrue(self.integration.checkpoint.is_done("clean_report"))
+
+
+    def test_resume_skips_downloaded_shards(self):
+        """
+        Test that a resumed run only downloads the reports of sub-accounts that had not finished.
+        """
+        self.integration.checkpoint.mark_done("download_report_2")
+        (self.data_path / "shards" / "2").mkdir(parents=True)
+
+        self.integration.prepare_report()
+
+        self.assertNotIn(2, self.sub_accounts)
+        self.sub_accounts[3].download_reports.assert_called_once()
+        self.assertEqual(self.canvas.clean_report.call_count, 2)
+
+
+class TestSyncTerms(unittest.TestCase):
+    """
+    Test syncing several terms at once on shared clients.
+    """
+    def setUp(self):
+        """
+        Replace the stages of a run with ones that record which term ran them and how many overlapped.
+        """
+        self.events = []
+        self.active_sql = 0
+        self.max_active_sql = 0
+        self.state_lock = threading.Lock()
+        report_barrier = threading.Barrier(2, timeout=5)
+
+        def prepare_report(integration):
+            report_barrier.wait()
+            self.events.append((integration.term, "prepare_report"))
+
+        def sql_stage(name):
+            def stage(integration):
+                with self.state_lock:
+                    self.active_sql += 1
+                    self.max_active_sql = max(self.max_active_sql, self.active_sql)
+                time.sleep(0.02)
+                with self.state_lock:
+                    self.active_sql -= 1
+                self.events.append((integration.term, name))
+            return stage
+
+        stages = {"prepare_report": prepare_report, "load_mirror_tables": sql_stage("load_mirror_tables"),
+                  "download_updates": sql_stage("download_updates")}
+        for name in ["upload_updates", "reconcile", "save_metrics", "save_snapshot"]:
+            stages[name] = lambda integration, name=name: self.events.append((integration.term, name))
+
+        self.patches = [mock.patch.object(Integrator, name, new=stage) for name, stage in stages.items()]
+        for patch in self.patches:
+            patch.start()
+
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+
+
+    def test_terms_share_clients_and_sql_lock(self):
+        """
+        Test that every term runs all its stages on the shared clients and SQL stages never overlap.
+        """
+        jenzabar, canvas = mock.Mock(), mock.Mock()
+        canvas.budget = RequestBudget()
+
+        integrations = Integrator.sync_terms(["current", "next"], jenzabar=jenzabar, canvas=canvas)
+
+        self.assertEqual([integration.term for integration in integrations], ["current", "next"])
+        self.assertTrue(all(integration.jenzabar is jenzabar and integration.canvas is canvas
+                            for integration in integrations))
+        for term in ["current", "next"]:
+            stages = [name for event_term, name in self.events if event_term == term]
+            self.assertEqual(stages, ["prepare_report", "load_mirror_tables", "download_updates", "upload_updates",
+                                      "reconcile", "save_metrics", "save_snapshot"])
+        self.assertEqual(self.max_active_sql, 1)
+
+
+class TestSubAccount(unittest.TestCase):
+    """
+    Test Canvas clients for sub-accounts.
+    """
+    def test_sub_account_shares_root_client(self):
+        """
+        Test that a sub-account client shares the budget and caches and keeps its reports apart.
+        """
+        root = Canvas("https://canvas.test", "key", RequestBudget(), account_id=1)
+        root.canvas_admin = mock.Mock(_requester=mock.sentinel.requester)
+
+        shard = root.sub_account(7)
+
+        self.assertIs(shard.budget, root.budget)
+        self.assertIs(shard.report_cache, root.report_cache)
+        self.assertIs(shard.canvas_admin._requester, mock.sentinel.requester)
+        self.assertEqual(shard.canvas_admin.id, 7)
+        self.assertNotEqual(shard._report_cache_key({"users": True}, 42), root._report_cache_key({"users": True}, 42))
+
+
+class TestReconcileStage(unittest.TestCase):
+    """
+    Test that reconciliation reports its own failures without failing the run.
+    """
+    def setUp(self):
+        """
+        Build an Integrator with a cleaned enrollments dataset and an enrollments update file.
+        """
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.data_path = Path(self.temp_dir.name) / "2021-01-10_06-00_211S"
+        (self.data_path / "updates").mkdir(parents=True)
+        (self.data_path / "updates" / "enrollments.csv").write_text(
+            "course_id,user_id,role,section_id,status\nMATH 101,1001,student,MATH 101 01,active\n")
+
+        self.canvas = mock.Mock()
+        self.canvas.budget = RequestBudget()
+
+        self.integration = Integrator("current", update_mode="sql", jenzabar=mock.Mock(), canvas=self.canvas,
+                                      datasets=["enrollments"])
+        self.integration._term_id = {"jenzabar": "211S", "canvas": 42}
+        self.integration._data_path = self.data_path
+        self.integration.clean_datasets = {"enrollments": pd.DataFrame(
+            {"course_id": ["MATH 101"], "user_id": ["1002"], "role": ["student"], "section_id": ["MATH 101 01"],
+             "status": ["active"]})}
+
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+
+    def test_fetch_error_is_recorded(self):
+        """
+        Test that a network error while fetching from Canvas is recorded and the stage returns.
+        """
+        self.canvas.fetch_keys.side_effect = requests.ConnectionError("reset")
+
+        self.integration.reconcile()
+
+        errors = [metric for metric in self.integration.telemetry.metrics if metric["name"] == "reconcile_errors"]
+        self.assertEqual(len(errors), 1)
+        self.assertIn("Reconciliation failed", (self.data_path / "reconciliation.txt").read_text())
+
+
+    def test_drift_is_reported(self):
+        """
+        Test that keys missing from Canvas are counted as drift.
+        """
+        self.canvas.fetch_keys.return_value = {"enrollments": pd.DataFrame(
+            {"section_id": ["MATH 101 01"], "user_id": ["1002"], "role": ["student"], "course_id": ["MATH 101"]})}
+
+        self.integration.reconcile()
+
+        drift = [metric["value"] for metric in self.integration.telemetry.metrics if metric["name"] == "reconcile_drift"]
+        self.assertEqual(drift, [1])
+        self.assertIn("Missing: 1 ['MATH 101 01|1001|student']", (self.data_path / "reconciliation.txt").read_text())
+
+
+    def test_ctl_library_courses_are_expected(self):
+        """
+        Test that courses created from the CTL library update count as expected, not as drift.
+        """
+        (self.data_path / "updates" / "ctl_library_courses.csv").write_text(
+            "course_id,short_name,long_name,account_id,term_id,status\nCTL 100,CTL 100,Library,ctl_library,211S,active\n")
+        self.integration.datasets = {"courses": True}
+        self.integration.clean_datasets = {"courses": pd.DataFrame({"crs_cde": ["MATH 101"], "status": ["active"]})}
+        self.canvas.fetch_keys.return_value = {"courses": pd.DataFrame({"course_id": ["MATH 101", "CTL 100"]})}
+
+        self.integration.reconcile()
+
+        drift = [metric["value"] for metric in self.integration.telemetry.metrics if metric["name"] == "reconcile_drift"]
+        self.assertEqual(drift, [0])
+        self.assertIn("Expected: 2", (self.data_path / "reconciliation.txt").read_text())
+
+
+class TestWatermarkCommit(unittest.TestCase):
+    """
+    Test which high-water marks are kept once the updates of an incremental run were uploaded.
+    """
+    def setUp(self):
+        """
+        Build an Integrator whose enrollments went through API calls with one failed row.
+        """
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.data_path = Path(self.temp_dir.name) / "2021-01-10_06-00_211S"
+        self.data_path.mkdir()
+        (self.data_path / "watermarks.json").write_text(
+            '{"211S:courses.csv": {"mark": "2021-01-10 06:00:00", "full_at": "2021-01-10T06:00:00"}, '
+            '"211S:enrollments.csv": {"mark": "2021-01-10 06:00:00", "full_at": "2021-01-10T06:00:00"}}')
+
+        self.jenzabar = Jenzabar(sis_engine=mock.Mock())
+        self.jenzabar.watermarks = JsonCache(Path(self.temp_dir.name) / "watermarks.json")
+
+        self.canvas = mock.Mock()
+        self.canvas.budget = RequestBudget()
+        self.canvas.upload_order = ["courses.csv", "enrollments.csv"]
+        self.canvas.upload_all_updates.return_value = {
+            "courses.csv": ImportResult({}, transport="rest", processing_errors=[]),
+            "enrollments.csv": ImportResult({}, transport="rest",
+                                            processing_errors=[["enrollments.csv", "1001: not found"]])}
+
+        self.integration = Integrator("current", update_mode="sql", jenzabar=self.jenzabar, canvas=self.canvas)
+        self.integration._term_id = {"jenzabar": "211S", "canvas": 42}
+        self.integration._data_path = self.data_path
+
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+
+    def test_failed_api_calls_keep_previous_mark(self):
+        """
+        Test that a file whose API calls failed keeps its old mark so its rows are read again.
+        """
+        self.integration.upload_updates()
+
+        max_age = datetime.timedelta.max
+        self.assertEqual(self.jenzabar.watermarks.get("211S:courses.csv", max_age)["mark"], "2021-01-10 06:00:00")
+        self.assertIsNone(self.jenzabar.watermarks.get("211S:enrollments.csv", max_age))
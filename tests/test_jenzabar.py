@@ -0,0 +1,176 @@
+from src.jenzabar import Jenzabar
+from src.cache import JsonCache
+from pathlib import Path
+
+import sqlalchemy as db
+import pandas as pd
+
+import tempfile
+import threading
+import unittest
+
+class TestIncrementalExtraction(unittest.TestCase):
+    """
+    Test watermark-based extraction against a SQLite stand-in for the SIS.
+    """
+    def setUp(self):
+        """
+        Create an ERP enrollments table with a job_time column and its full and incremental queries.
+        """
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.temp_dir.name)
+        self.engine = db.create_engine(f"sqlite:///{self.root / 'sis.db'}")
+
+        with self.engine.begin() as conn:
+            conn.execute(db.text("CREATE TABLE erp_enrollments (course_id TEXT, user_id INTEGER, role TEXT, "
+                                 "section_id TEXT, status TEXT, yr_cde TEXT, trm_cde TEXT, job_time TEXT)"))
+            conn.execute(db.text("INSERT INTO erp_enrollments VALUES "
+                                 "('MATH 101', 1001, 'student', 'MATH 101 01', 'active', '21', '1S', '2021-01-01 00:00:00'), "
+                                 "('MATH 101', 1002, 'student', 'MATH 101 01', 'active', '21', '1S', '2021-01-01 00:00:00')"))
+
+        query = ("SELECT course_id, user_id, role, section_id, status FROM erp_enrollments "
+                 "WHERE yr_cde = ? AND trm_cde = ?")
+        (self.root / "ErpEnrollments.sql").write_text(query)
+        (self.root / "ErpEnrollments.since.sql").write_text(query + " AND job_time >= ?")
+
+        self.jenzabar = Jenzabar(sis_engine=self.engine)
+        self.jenzabar.queries_path = self.root
+        self.jenzabar.watermarks = JsonCache(self.root / "watermarks.json")
+
+        self.canvas_datasets = {"enrollments": pd.DataFrame({
+            "course_id": ["MATH 101"], "user_id": ["1001"], "role": ["student"],
+            "section_id": ["MATH 101 01"], "status": ["active"]})}
+
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.temp_dir.cleanup()
+
+
+    def sync(self, run_name):
+        data_path = self.root / run_name
+        timings = self.jenzabar.download_all_updates(data_path, "211S", update_mode="local",
+                                                     canvas_datasets=self.canvas_datasets,
+                                                     file_names=["enrollments.csv"], extract_mode="incremental")
+        self.jenzabar.commit_watermarks(data_path)
+        return timings["enrollments.csv"], pd.read_csv(data_path / "updates" / "enrollments.csv")
+
+
+    def test_only_changed_rows_are_read(self):
+        """
+        Test that a run after the first reads only rows changed since its watermark.
+        """
+        timing, updates = self.sync("first")
+        self.assertEqual((timing["extract"], timing["rows"]), ("full", 2))
+        self.assertEqual(list(updates["user_id"]), [1002])
+
+        timing, updates = self.sync("second")
+        self.assertEqual((timing["extract"], timing["rows"]), ("incremental", 0))
+
+        with self.engine.begin() as conn:
+            conn.execute(db.text("UPDATE erp_enrollments SET status = 'deleted', job_time = '2999-01-01 00:00:00' "
+                                 "WHERE user_id = 1001"))
+
+        timing, updates = self.sync("third")
+        self.assertEqual((timing["extract"], timing["rows"]), ("incremental", 1))
+        self.assertEqual(list(updates["status"]), ["deleted"])
+
+
+    def test_marks_wait_for_commit_and_repair_runs_in_full(self):
+        """
+        Test that uncommitted marks are not used and that old full reads trigger a repair.
+        """
+        self.jenzabar.download_all_updates(self.root / "failed", "211S", update_mode="local",
+                                           canvas_datasets=self.canvas_datasets, file_names=["enrollments.csv"],
+                                           extract_mode="incremental")
+        timing, _ = self.sync("retry")
+        self.assertEqual(timing["extract"], "full")
+
+        self.jenzabar.extract_repair_hours = 0
+        timing, _ = self.sync("repair")
+        self.assertEqual((timing["extract"], timing["rows"]), ("full", 2))
+
+
+    def test_invalid_queries_write_no_marks(self):
+        """
+        Test that a broken incremental query is reported before the run queries the clock or writes marks.
+        """
+        (self.root / "ErpEnrollments.since.sql").write_text("SELECT course_id FROM erp_enrollments WHERE yr_cde = ?")
+
+        with self.assertRaises(ValueError) as error:
+            self.sync("broken")
+
+        self.assertIn("ErpEnrollments.since.sql takes 1 parameters instead of 3", str(error.exception))
+        self.assertFalse((self.root / "broken" / "watermarks.json").exists())
+
+
+class TestConcurrentUpdates(unittest.TestCase):
+    """
+    Test running the update queries of a run on concurrent connections.
+    """
+    def setUp(self):
+        """
+        Create ERP course and enrollment tables with one update query each.
+        """
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.temp_dir.name)
+        self.engine = db.create_engine(f"sqlite:///{self.root / 'sis.db'}")
+
+        with self.engine.begin() as conn:
+            conn.execute(db.text("CREATE TABLE erp_courses (course_id TEXT, yr_cde TEXT, trm_cde TEXT)"))
+            conn.execute(db.text("CREATE TABLE erp_enrollments (course_id TEXT, user_id INTEGER, yr_cde TEXT, "
+                                 "trm_cde TEXT)"))
+            conn.execute(db.text("INSERT INTO erp_courses VALUES ('MATH 101', '21', '1S'), ('HIST 200', '21', '2S')"))
+            conn.execute(db.text("INSERT INTO erp_enrollments VALUES ('MATH 101', 1001, '21', '1S')"))
+
+        (self.root / "MissingCourses.sql").write_text(
+            "SELECT course_id FROM erp_courses WHERE yr_cde = ? AND trm_cde = ?")
+        (self.root / "DailyEnrollment.sql").write_text(
+            "SELECT course_id, user_id FROM erp_enrollments WHERE yr_cde = ? AND trm_cde = ?")
+
+        self.jenzabar = Jenzabar(sis_engine=self.engine)
+        self.jenzabar.queries_path = self.root
+
+        # Each query waits for the other, so they only finish when they run at the same time.
+        barrier = threading.Barrier(2, timeout=5)
+        run = self.jenzabar.queries.run
+
+        def run_together(name, params=()):
+            barrier.wait()
+            return run(name, params)
+
+        self.jenzabar.queries.run = run_together
+
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.temp_dir.cleanup()
+
+
+    def test_queries_run_concurrently(self):
+        """
+        Test that the queries overlap and every update file and timing is written.
+        """
+        timings = self.jenzabar.download_all_updates(self.root / "run", "211S", update_mode="sql", max_workers=2,
+                                                     file_names=["courses.csv", "enrollments.csv"])
+
+        self.assertEqual({file_name: timing["rows"] for file_name, timing in timings.items()},
+                         {"courses.csv": 1, "enrollments.csv": 1})
+        updates = pd.read_csv(self.root / "run" / "updates" / "enrollments.csv")
+        self.assertEqual(list(updates["user_id"]), [1001])
+        self.assertTrue((self.root / "run" / "updates" / "courses.csv").is_file())
+
+
+    def test_worker_error_is_raised(self):
+        """
+        Test that a query failing in one worker fails the download and writes no update files.
+        """
+        self.jenzabar.queries.queries["MissingCourses.sql"] = (
+            "SELECT course_id FROM erp_missing WHERE yr_cde = ? AND trm_cde = ?")
+
+        with self.assertRaises(pd.errors.DatabaseError) as error:
+            self.jenzabar.download_all_updates(self.root / "run", "211S", update_mode="sql", max_workers=2,
+                                               file_names=["courses.csv", "enrollments.csv"])
+
+        self.assertIn("erp_missing", str(error.exception))
+        self.assertEqual(list((self.root / "run" / "updates").iterdir()), [])
@@ -0,0 +1,113 @@
+from src.query_registry import QueryRegistry
+from pathlib import Path
+from unittest import mock
+
+import sqlalchemy as db
+
+import tempfile
+import unittest
+
+class TestQueryRegistry(unittest.TestCase):
+    """
+    Test loading, validating and timing queries against SQLite.
+    """
+    def setUp(self):
+        """
+        Create a small enrollments table and a directory with two queries.
+        """
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.temp_dir.name)
+        self.engine = db.create_engine(f"sqlite:///{self.root / 'sis.db'}")
+
+        with self.engine.begin() as conn:
+            conn.execute(db.text("CREATE TABLE erp_enrollments (user_id INTEGER, yr_cde TEXT, trm_cde TEXT)"))
+            conn.execute(db.text("INSERT INTO erp_enrollments VALUES (1001, '21', '1S'), (1002, '21', '2S')"))
+
+        (self.root / "ErpEnrollments.sql").write_text(
+            "SELECT user_id FROM erp_enrollments WHERE yr_cde = ? AND trm_cde = ?")
+        (self.root / "Broken.sql").write_text("SELECT user_id FROM erp_enrollments WHERE yr_cde = ?")
+
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.temp_dir.cleanup()
+
+
+    def test_validate_reports_every_problem(self):
+        """
+        Test that missing queries and wrong parameter counts are all reported together.
+        """
+        registry = QueryRegistry(self.root, self.engine)
+
+        registry.validate({"ErpEnrollments.sql": 2})
+        with self.assertRaises(ValueError) as error:
+            registry.validate({"ErpEnrollments.sql": 2, "Broken.sql": 2, "Missing.sql": 2})
+
+        self.assertIn("Broken.sql takes 1 parameters instead of 2", str(error.exception))
+        self.assertIn("Missing.sql is missing", str(error.exception))
+
+        with self.assertRaises(ValueError) as error:
+            registry.validate({"Missing.sql": 2}, {"Missing.sql": ["user_id", "status"]})
+        self.assertIn("it must take 2 parameters and return user_id, status", str(error.exception))
+
+
+    def test_parameter_count_skips_literals_and_comments(self):
+        """
+        Test that a ? inside a string literal, a quoted identifier or a comment is not a parameter.
+        """
+        (self.root / "Commented.sql").write_text(
+            "-- Which term?\nSELECT user_id AS [id?], 'why?' AS \"note?\" FROM erp_enrollments\n"
+            "/* filtered by\n year? */ WHERE yr_cde = ? AND trm_cde = ? AND 'it''s?' <> ''")
+        registry = QueryRegistry(self.root, self.engine)
+
+        self.assertEqual(registry.parameter_count("Commented.sql"), 2)
+        self.assertEqual(list(registry.run("Commented.sql", ("21", "1S"))["id?"]), [1001])
+
+
+    def test_run_records_stats(self):
+        """
+        Test that runs are timed and counted per query and fast queries get no plan.
+        """
+        registry = QueryRegistry(self.root, self.engine, slow_query_seconds=60)
+
+        for _ in range(2):
+            result = registry.run("ErpEnrollments.sql", ("21", "1S"))
+
+        self.assertEqual(list(result["user_id"]), [1001])
+        self.assertNotIn("plan", result.attrs)
+        self.assertEqual(registry.stats["ErpEnrollments.sql"]["calls"], 2)
+        self.assertEqual(registry.stats["ErpEnrollments.sql"]["rows"], 2)
+
+
+    def test_slow_query_plan(self):
+        """
+        Test that a query over the threshold carries its plan.
+        """
+        registry = QueryRegistry(self.root, self.engine, slow_query_seconds=1e-9)
+
+        result = registry.run("ErpEnrollments.sql", ("21", "1S"))
+
+        self.assertIn("erp_enrollments", result.attrs["plan"])
+
+
+    def test_sql_server_plan_skips_statement_text(self):
+        """
+        Test that on SQL Server the plan rowsets are read and the statement text rowsets are left out.
+        """
+        rowsets = [[("SELECT user_id FROM erp_enrollments WHERE yr_cde = ? AND trm_cde = ?",)],
+                   [("  |--Table Scan(OBJECT:([erp_enrollments]))",), ("       |--Filter",)]]
+        cursor = mock.Mock(description=[("StmtText",)])
+        cursor.fetchall.side_effect = rowsets
+        cursor.nextset.side_effect = [True, False]
+
+        engine = mock.MagicMock()
+        engine.dialect.name = "mssql"
+        engine.connect.return_value.__enter__.return_value.connection.cursor.return_value = cursor
+        registry = QueryRegistry(self.root, engine)
+
+        plan = registry.explain("ErpEnrollments.sql", ("21", "1S"))
+
+        self.assertEqual(plan, "  |--Table Scan(OBJECT:([erp_enrollments]))\n       |--Filter")
+        self.assertEqual([call.args[0] for call in cursor.execute.call_args_list],
+                         ["SET SHOWPLAN_TEXT ON", registry.queries["ErpEnrollments.sql"], "SET SHOWPLAN_TEXT OFF"])
+
@@ -0,0 +1,86 @@
+from src.rate_limit import RequestBudget, RateLimitedAdapter, Poller
+from unittest import mock
+
+import requests
+import unittest
+
+class TestRateLimit(unittest.TestCase):
+    """
+    Test the shared Canvas request budget and its transport adapter.
+    """
+    def setUp(self):
+        """
+        Create a budget that reserves 100 units and refills quickly.
+        """
+        self.budget = RequestBudget(reserve=100, preflight_cost=50, refill_rate=1000, max_retries=2)
+        self.session = requests.Session()
+        self.session.mount("http://", RateLimitedAdapter(self.budget))
+
+
+    def response(self, status_code, remaining, text="{}"):
+        response = requests.Response()
+        response.status_code = status_code
+        response.headers["X-Rate-Limit-Remaining"] = str(remaining)
+        response.headers["X-Request-Cost"] = "2.5"
+        response._content = text.encode()
+        return response
+
+
+    def test_headers_update_budget(self):
+        """
+        Test that the remaining budget and request cost are read from every response.
+        """
+        with mock.patch.object(requests.adapters.HTTPAdapter, "send", return_value=self.response(200, 650)):
+            self.session.get("http://canvas.test/api/v1/accounts/1")
+
+        snapshot = self.budget.snapshot()
+        self.assertEqual(snapshot["requests"], 1)
+        self.assertEqual(snapshot["cost"], 2.5)
+        self.assertGreaterEqual(snapshot["remaining"], 650)
+        self.assertEqual(snapshot["in_flight"], 0)
+
+
+    def test_in_flight_requests_share_budget(self):
+        """
+        Test that a request waits while requests in flight would spend the reserve.
+        """
+        budget = RequestBudget(reserve=100, preflight_cost=50, refill_rate=1, max_retries=2)
+        budget.acquire()
+        budget.release(self.response(200, 140))
+        budget.acquire()
+
+        with mock.patch.object(budget._condition, "wait") as wait:
+            wait.side_effect = lambda delay: setattr(budget, "remaining", 1000)
+            budget.acquire()
+
+        self.assertEqual(wait.call_count, 1)
+        self.assertGreater(wait.call_args.args[0], 1)
+        self.assertEqual(budget.in_flight, 2)
+
+
+    def test_throttled_requests_are_retried(self):
+        """
+        Test that a 403 Rate Limit Exceeded is retried after a backoff.
+        """
+        responses = [self.response(403, 0, "403 Forbidden (Rate Limit Exceeded)"), self.response(200, 600)]
+
+        with mock.patch.object(requests.adapters.HTTPAdapter, "send", side_effect=responses), \
+                mock.patch("src.rate_limit.time.sleep") as sleep:
+            response = self.session.get("http://canvas.test/api/v1/accounts/1")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sleep.call_count, 1)
+        self.assertEqual(self.budget.snapshot()["throttled"], 1)
+
+
+    def test_poller_backs_off_without_progress(self):
+        """
+        Test that polling slows down while progress is unchanged and resets when it moves.
+        """
+        poller = Poller(1, maximum=4, jitter=0)
+
+        with mock.patch("src.rate_limit.time.sleep") as sleep:
+            for progress in [0, 0, 0, 0, 0, 50]:
+                poller.wait(progress)
+
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], [1, 1.5, 2.25, 3.375, 4, 1])
@@ -0,0 +1,80 @@
+from src import reconcile
+from src.canvas import Canvas
+from canvasapi.exceptions import ResourceDoesNotExist
+from types import SimpleNamespace
+from unittest import mock
+
+import pandas as pd
+
+import unittest
+
+class TestReconcile(unittest.TestCase):
+    """
+    Test comparing the expected post-import state with keys fetched from Canvas.
+    """
+    def setUp(self):
+        """
+        Build cleaned enrollments for two courses and an update that adds one and deletes one.
+        """
+        self.enrollments = pd.DataFrame({
+            "course_id": ["MATH 101", "MATH 101", "HIST 200"],
+            "user_id": ["1001", "1002", "1003"],
+            "role": ["student", "student", "teacher"],
+            "section_id": ["MATH 101 01", "MATH 101 01", "HIST 200 01"],
+            "status": ["active", "active", "active"]})
+        self.update = pd.DataFrame({
+            "course_id": ["MATH 101", "MATH 101"],
+            "user_id": ["1004", "1002"],
+            "role": ["Student", "student"],
+            "section_id": ["MATH 101 01", "MATH 101 01"],
+            "status": ["active", "deleted"]})
+
+
+    def test_expected_keys_apply_update(self):
+        """
+        Test that active update rows are added, deleted ones removed and only sampled courses kept.
+        """
+        keys = reconcile.expected_keys("enrollments", self.enrollments, self.update, ["MATH 101"])
+
+        self.assertEqual(keys, {("MATH 101 01", "1001", "student"), ("MATH 101 01", "1004", "student")})
+
+
+    def test_compare_flags_drift(self):
+        """
+        Test that equal key sets share a checksum and differing ones report what is missing.
+        """
+        expected = reconcile.expected_keys("enrollments", self.enrollments, self.update, ["MATH 101"])
+        fetched = pd.DataFrame({"course_id": ["MATH 101", "MATH 101"], "user_id": ["1004", "1001"],
+                                "role": ["student", "student"], "section_id": ["MATH 101 01", "MATH 101 01"]})
+
+        result = reconcile.compare(expected, reconcile.actual_keys("enrollments", fetched, ["MATH 101"]))
+        self.assertEqual(result["expected_checksum"], result["actual_checksum"])
+        self.assertEqual((result["missing"], result["unexpected"]), (0, 0))
+
+        result = reconcile.compare(expected, reconcile.actual_keys("enrollments", fetched.iloc[:1], ["MATH 101"]))
+        self.assertNotEqual(result["expected_checksum"], result["actual_checksum"])
+        self.assertEqual(result["missing_sample"], ["MATH 101 01|1001|student"])
+
+
+    def test_fetch_keys(self):
+        """
+        Test that Canvas keys are fetched per sampled course and a missing course has none.
+        """
+        canvas = Canvas.__new__(Canvas)
+        canvas.canvas_admin = mock.Mock()
+        canvas.canvas_admin.get_courses.return_value = [SimpleNamespace(sis_course_id="MATH 101")]
+
+        def get_sections(course, **kwargs):
+            if course.id == "sis_course_id:HIST 200":
+                raise ResourceDoesNotExist("Not Found")
+            return [SimpleNamespace(sis_section_id="MATH 101 01")]
+
+        enrollment = SimpleNamespace(sis_section_id="MATH 101 01", sis_user_id="1001", type="StudentEnrollment")
+        with mock.patch("src.canvas.Course.get_sections", get_sections), \
+                mock.patch("src.canvas.Course.get_enrollments", return_value=[enrollment]):
+            keys = canvas.fetch_keys(42, ["HIST 200", "MATH 101"], max_workers=2)
+
+        self.assertEqual(list(keys["courses"]["course_id"]), ["MATH 101"])
+        self.assertEqual(list(keys["sections"]["course_id"]), ["MATH 101"])
+        self.assertEqual(keys["enrollments"].to_dict("records"), [
+            {"section_id": "MATH 101 01", "user_id": "1001", "role": "student", "course_id": "MATH 101"}])
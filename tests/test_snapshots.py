@@ -0,0 +1,140 @@
+from src.snapshots import SnapshotStore
+from pathlib import Path
+
+import pandas as pd
+
+import os
+import json
+import time
+import tempfile
+import unittest
+
+class TestSnapshotStore(unittest.TestCase):
+    """
+    Test the content-addressed snapshot store.
+    """
+    def setUp(self):
+        """
+        Create a data directory with a store and two runs of the same term.
+        """
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.data_root = Path(self.temp_dir.name)
+        self.store = SnapshotStore(self.data_root / "snapshots", keep=2, max_age_days=0, keep_runs=1)
+
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+
+    def make_run(self, run_name, enrollments, finished=True):
+        run_path = self.data_root / run_name
+        (run_path / "provisioning_report_clean").mkdir(parents=True)
+        (run_path / "provisioning_report_clean" / "users.csv").write_text("user_id,login_id\n1001,jdoe\n")
+        (run_path / "provisioning_report_clean" / "enrollments.csv").write_text(enrollments)
+        stages = {"upload_updates": "2021-01-10T06:30:00"} if finished else {}
+        (run_path / "checkpoint.json").write_text(json.dumps({"run": {}, "stages": stages, "imports": {}}))
+        return run_path
+
+
+    def object_count(self):
+        return len(list((self.data_root / "snapshots" / "objects").glob("*/*")))
+
+
+    def test_identical_artifacts_are_stored_once(self):
+        """
+        Test that unchanged files across runs share one compressed object.
+        """
+        self.store.save(self.make_run("2021-01-10_06-00_211S", "user_id\n1001\n"), "211S")
+        self.store.save(self.make_run("2021-01-11_06-00_211S", "user_id\n1001\n1002\n"), "211S")
+
+        self.assertEqual(self.object_count(), 4)
+        self.assertTrue(all(path.suffix == ".gz" for path in (self.data_root / "snapshots" / "objects").glob("*/*")))
+
+
+    def test_previous_snapshot(self):
+        """
+        Test that the previous copy of a dataset is found and readable by pandas.
+        """
+        self.store.save(self.make_run("2021-01-10_06-00_211S", "user_id\n1001\n"), "211S")
+        self.store.save(self.make_run("2021-01-11_06-00_211S", "user_id\n1001\n1002\n"), "211S")
+
+        previous = self.store.previous("provisioning_report_clean/enrollments.csv", "211S",
+                                       before="2021-01-11_06-00_211S")
+
+        self.assertEqual(list(pd.read_csv(previous)["user_id"]), [1001])
+        self.assertIsNone(self.store.previous("provisioning_report_clean/enrollments.csv", "212S"))
+
+
+    def test_retention(self):
+        """
+        Test that old snapshots, their objects and old finished run directories are removed.
+        """
+        runs = [(10, "user_id\n1\n", False), (11, "user_id\n2\n", True), (12, "user_id\n3\n", True)]
+        for day, enrollments, finished in runs:
+            self.store.save(self.make_run(f"2021-01-{day}_06-00_211S", enrollments, finished), "211S")
+
+        removed = self.store.apply_retention(self.data_root)
+
+        self.assertEqual(removed, 1)
+        self.assertEqual([manifest["run"] for manifest in self.store.manifests()],
+                         ["2021-01-12_06-00_211S", "2021-01-11_06-00_211S"])
+        self.assertEqual(self.object_count(), 4)
+        self.assertTrue((self.data_root / "2021-01-12_06-00_211S").is_dir())
+        self.assertFalse((self.data_root / "2021-01-11_06-00_211S").exists())
+        self.assertTrue((self.data_root / "2021-01-10_06-00_211S").is_dir())
+
+        restored = self.store.restore("2021-01-11_06-00_211S", self.data_root / "restored")
+        self.assertEqual((restored / "provisioning_report_clean" / "enrollments.csv").read_text(), "user_id\n2\n")
+
+
+    def test_run_directories_kept_per_term(self):
+        """
+        Test that by default only the newest three finished run directories are kept, and none with keep_runs 0.
+        """
+        store = SnapshotStore(self.data_root / "snapshots", keep=5, max_age_days=0)
+        for day in [10, 11, 12, 13]:
+            store.save(self.make_run(f"2021-01-{day}_06-00_211S", f"user_id\n{day}\n"), "211S")
+
+        SnapshotStore(self.data_root / "snapshots", keep=5, max_age_days=0, keep_runs=0).apply_retention(self.data_root)
+        self.assertTrue((self.data_root / "2021-01-10_06-00_211S").is_dir())
+
+        store.apply_retention(self.data_root)
+        self.assertFalse((self.data_root / "2021-01-10_06-00_211S").exists())
+        self.assertTrue((self.data_root / "2021-01-11_06-00_211S").is_dir())
+        self.assertEqual(len(store.manifests()), 4)
+
+
+    def test_load_date_does_not_defeat_dedupe(self):
+        """
+        Test that cleaned datasets differing only in load_date share an object and restore byte for byte.
+        """
+        for day in [10, 11]:
+            run_path = self.make_run(f"2021-01-{day}_06-00_211S", "user_id\n1001\n")
+            (run_path / "provisioning_report_clean" / "courses.csv").write_text(
+                f'crs_cde,long_name,load_date\nMATH 101,"Algebra, I",2021-01-{day}\nHIST 200,,2021-01-{day}\n')
+            manifest = self.store.save(run_path, "211S")
+
+        self.assertEqual(self.object_count(), 4)
+        self.assertEqual(manifest["artifacts"]["provisioning_report_clean/courses.csv"]["load_date"], "2021-01-11")
+
+        restored = self.store.restore("2021-01-10_06-00_211S", self.data_root / "restored")
+        self.assertEqual((restored / "provisioning_report_clean" / "courses.csv").read_text(),
+                         'crs_cde,long_name,load_date\nMATH 101,"Algebra, I",2021-01-10\nHIST 200,,2021-01-10\n')
+
+        previous = self.store.previous("provisioning_report_clean/courses.csv", "211S")
+        self.assertEqual(list(pd.read_csv(previous)), ["crs_cde", "long_name"])
+
+
+    def test_stale_lock_is_taken_over(self):
+        """
+        Test that a lock file left behind by a dead process does not block the store forever.
+        """
+        lock_path = self.data_root / "snapshots" / "store.lock"
+        lock_path.parent.mkdir(parents=True)
+        lock_path.touch()
+        os.utime(lock_path, (time.time() - 2 * SnapshotStore.lock_timeout,) * 2)
+
+        self.store.save(self.make_run("2021-01-10_06-00_211S", "user_id\n1\n"), "211S")
+
+        self.assertEqual(len(self.store.manifests()), 1)
+        self.assertFalse(lock_path.exists())
@@ -0,0 +1,62 @@
+from src.telemetry import Telemetry
+from pathlib import Path
+
+import json
+import tempfile
+import unittest
+
+class TestTelemetry(unittest.TestCase):
+    """
+    Test the JSON and Prometheus exports of run metrics.
+    """
+    def setUp(self):
+        """
+        Record a timed stage and two series of the same metric, one of them twice.
+        """
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.temp_dir.name)
+
+        self.telemetry = Telemetry({"term": "211S"})
+        with self.telemetry.stage("download", shard=2):
+            pass
+        self.telemetry.record("update_rows", 5, file="users.csv")
+        self.telemetry.record("update_rows", 7, file="users.csv")
+        self.telemetry.record("update_rows", 3, file='say "hi"\n.csv')
+
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+
+    def test_save_writes_every_metric(self):
+        """
+        Test that the JSON file holds every recorded value with the run labels merged in.
+        """
+        metrics_path = self.telemetry.save(self.root / "run")
+
+        with open(metrics_path) as metrics_file:
+            metrics = json.load(metrics_file)
+
+        self.assertEqual(metrics_path, self.root / "run" / "metrics.json")
+        self.assertEqual([metric["name"] for metric in metrics],
+                         ["download_seconds", "update_rows", "update_rows", "update_rows"])
+        self.assertEqual(metrics[0]["labels"], {"term": "211S", "shard": 2})
+        self.assertGreaterEqual(metrics[0]["value"], 0)
+        self.assertEqual([metric["value"] for metric in metrics[1:]], [5, 7, 3])
+        self.assertEqual(metrics[1]["labels"], {"term": "211S", "file": "users.csv"})
+
+
+    def test_prometheus_keeps_latest_value_per_series(self):
+        """
+        Test that each metric is a prefixed gauge with escaped labels and the latest value of each series.
+        """
+        prometheus_path = self.telemetry.write_prometheus(self.root / "textfile" / "sync.prom", prefix="sync")
+
+        lines = prometheus_path.read_text().splitlines()
+
+        self.assertEqual(lines.count("# TYPE sync_update_rows gauge"), 1)
+        self.assertIn("# TYPE sync_download_seconds gauge", lines)
+        self.assertIn('sync_update_rows{file="users.csv",term="211S"} 7.0', lines)
+        self.assertIn('sync_update_rows{file="say \\"hi\\"\\n.csv",term="211S"} 3.0', lines)
+        self.assertTrue(any(line.startswith('sync_download_seconds{shard="2",term="211S"} ') for line in lines))
+        self.assertEqual(list(prometheus_path.parent.iterdir()), [prometheus_path])